@@ -46,6 +46,7 @@ class Hangar1 (Building):
     #glowmap = "models/buildings/hangar/hangar_1_gw.png"
     glossmap = "models/buildings/hangar/hangar_1_gls.png"
     #destoffparts = []
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -85,6 +86,7 @@ class Hangar1 (Building):
             chbx.hitpoints = 0
 
         if self._hbx_hnrg.hitpoints <= 0 and not self._hbx_hnrg.out:
+            self._leave_instancing()
             self.explode(offset=self._hbx_hnrg.center)
             fire_n_smoke_3(parent=self, store=self.damage_trails,
                            fpos1=Point3(0.0, 0.0, 2.0),
@@ -106,6 +108,7 @@ class Hangar1 (Building):
             self._hbx_hnrg.out = True
             self._failure_full = True
         if self._hbx_mdoor.hitpoints <= 0 and not self._hbx_mdoor.out:
+            self._leave_instancing()
             self.explode_minor(offset=self._hbx_mdoor.center)
             texture_subnodes(self.node, ["hng1_door_main",],
                              texture="models/buildings/hangar/hangar_1_burn.png",
@@ -152,6 +155,7 @@ class HangarNato (Building):
     #glowmap = "models/buildings/hangar/hangar_2_gw.png"
     glossmap = "models/buildings/hangar/hangar_2_gls.png"
     #destoffparts = []
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -196,6 +200,7 @@ class HangarNato (Building):
             chbx.hitpoints = 0
 
         if self._hbx_hnrg.hitpoints <= 0 and not self._hbx_hnrg.out:
+            self._leave_instancing()
             self.explode(offset=self._hbx_hnrg.center)
             fire_n_smoke_3(parent=self, store=self.damage_trails,
                            fpos1=Point3(0.0, 0.0, 1.0),
@@ -219,6 +224,7 @@ class HangarNato (Building):
             self._hbx_hnrg.out = True
             self._failure_full = True
         if self._hbx_mdoorl.hitpoints <= 0 and not self._hbx_mdoorl.out:
+            self._leave_instancing()
             self.explode_minor(offset=self._hbx_mdoorl.center)
             texture_subnodes(self.node, ["hng2_door_main_l",],
                              texture="models/buildings/hangar/hangar_2_burn.png",
@@ -227,6 +233,7 @@ class HangarNato (Building):
             self.mdoorl_down = True
             self._hbx_mdoorl.out = True
         if self._hbx_mdoorr.hitpoints <= 0 and not self._hbx_mdoorr.out:
+            self._leave_instancing()
             self.explode_minor(offset=self._hbx_mdoorr.center)
             texture_subnodes(self.node, ["hng2_door_main_r",],
                              texture="models/buildings/hangar/hangar_2_burn.png",
@@ -314,6 +321,7 @@ class Warehouse1 (Building):
     destfirepos = Vec3(0.0, 0.0, 0.0)
     destoffparts = ["wh_roof", "wh_doors", "wh_door_main", "wh_misc"]
     desttextures = ["models/buildings/warehouse/warehouse_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -342,6 +350,7 @@ class CampShed1 (Building):
     destfirepos = None
     destoffparts = ["cs1_body", "cs1_front"]
     desttextures = ["models/buildings/misc/camp_shed_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -369,6 +378,7 @@ class Bunker1 (Building):
     destfirepos = None
     destoffparts = ["bu1_body_part"]
     desttextures = ["models/buildings/misc/bunker_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -827,6 +837,7 @@ class PowgeneratorRussian1 (Building):
     destfirepos = None
     destoffparts = ["pwg_misc"]
     desttextures = ["models/buildings/powerplant/sov_powergenerator_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -872,6 +883,7 @@ class OilGasStorage1 (Building):
     destfirepos = Vec3(-12.3, -1.0, 2.0)
     destoffparts = ["ogs1_roofs", "ogs1_misc"]
     desttextures = ["models/buildings/oil-gas/oil_gas_storage_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -899,6 +911,7 @@ class FuelTank1 (Building):
     destfirepos = Vec3(0.0, 0.0, 4.2)
     destoffparts = ["flt_misc", "flt_body_part"]
     desttextures = ["models/buildings/oil-gas/fuel_tank_1_burn.png"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -924,6 +937,7 @@ class Banner1 (Building):
     #glowmap = "models/buildings/flag/banner_1_gw.png"
     #glossmap = "models/buildings/flag/banner_1_gls.png"
     destoffparts = ["banner"]
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   pos=None, hpr=None, sink=None,
@@ -949,6 +963,7 @@ class Fence1 (Building):
     #glowmap = "models/buildings/misc/fence_1_gw.png"
     #glossmap = "models/buildings/misc/fence_1_gls.png"
     destoffparts = None
+    instanced = True
 
     def __init__ (self, world, name, side, texture=None, normalmap=None,
                   transp=TransparencyAttrib.MDual,
@@ -958,10 +973,7 @@ class Fence1 (Building):
         Building.__init__(self, world=world, name=name, side=side,
                           texture=texture, normalmap=normalmap, clamp=False,
                           pos=pos, hpr=hpr, sink=sink,
-                          damage=damage, burns=burns)
-        if transp is not None:
-            self.node.setTransparency(transp)
-            # self.node.setBin("opaque", 0)
+                          damage=damage, burns=burns, transp=transp)
 
 
 class Mansion1 (Building):
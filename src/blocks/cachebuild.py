@@ -0,0 +1,189 @@
+# -*- coding: UTF-8 -*-
+
+from inspect import isclass
+from multiprocessing import Pool, cpu_count
+from time import time
+import traceback
+
+from src import join_path, split_path, walk_dir_files
+from src.core.misc import report, warning, error
+from src.core.misc import save_file_hash_manifest
+from src.core.transl import *
+
+
+def build_cache (gameconf, inputconf, numproc=None):
+    """
+    Build all cached derived data, spread over a pool of processes.
+
+    Everything that is otherwise generated lazily on first use
+    is built here: converted models and textures, plane and
+    cannon dynamics, and terrain and cloud geometry.
+    Each worker process runs its own headless base stack,
+    so this must be called before the base stack is created.
+
+    If the number of processes is not given,
+    as many processes as there are CPU cores are used.
+    """
+
+    if numproc is None:
+        numproc = cpu_count()
+
+    # Items in the first stage are small and many,
+    # and also include all textures that terrains will load,
+    # so that terrains in the second stage do not race on them.
+    # Each terrain is built in a fresh process, to release its memory.
+    stages = [
+        (_collect_file_items() + _collect_dynamics_items(), None),
+        (_collect_terrain_items(), 1),
+    ]
+
+    numitems = sum(len(items) for items, maxtasks in stages)
+    report(_("Building cache for %(num1)d items "
+             "using %(num2)d processes.") %
+           dict(num1=numitems, num2=numproc))
+
+    t0 = time()
+    numdone = 0
+    failed = []
+    for items, maxtasks in stages:
+        pool = Pool(processes=numproc,
+                    initializer=_init_worker,
+                    initargs=(gameconf, inputconf),
+                    maxtasksperchild=maxtasks)
+        try:
+            for item, dt, errmsg in pool.imap_unordered(_build_item, items):
+                numdone += 1
+                kind, name = item
+                if errmsg is None:
+                    report(_("[%(num1)d/%(num2)d] Cached %(kind)s '%(name)s' "
+                             "in %(dur).1f s.") %
+                           dict(num1=numdone, num2=numitems,
+                                kind=kind, name=name, dur=dt))
+                else:
+                    warning(_("[%(num1)d/%(num2)d] Caching %(kind)s '%(name)s' "
+                              "failed:\n%(msg)s") %
+                            dict(num1=numdone, num2=numitems,
+                                 kind=kind, name=name, msg=errmsg))
+                    failed.append(item)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    t1 = time()
+
+    if failed:
+        error(_("Building cache failed for %(num1)d of %(num2)d items.") %
+              dict(num1=len(failed), num2=numitems))
+    report(_("Cache built for %(num)d items in %(dur).1f s.") %
+           dict(num=numitems, dur=(t1 - t0)))
+
+
+def _collect_file_items ():
+
+    exclude = [
+        "heightmaps",
+    ]
+
+    items = []
+    for dirpath in (
+        join_path("models"),
+        join_path("images"),
+        join_path("terrains"),
+    ):
+        for root, filelist in walk_dir_files("data", dirpath):
+            for fn in filelist:
+                fp = join_path(root, fn)
+                fpels = split_path(fp)
+                if any(e in fpels for e in exclude):
+                    continue
+                if fn.endswith((".egg", ".egg.pz")):
+                    items.append(("model", fp))
+                elif fn.endswith((".png", ".tga", ".jpg")):
+                    # Terrain directories also contain maps which are
+                    # read as images, only textures are loaded as such.
+                    if (fpels[0] == "terrains" and len(fpels) > 2 and
+                        "textures" not in fpels):
+                        continue
+                    items.append(("texture", fp))
+    items.sort()
+    return items
+
+
+def _collect_dynamics_items ():
+
+    items = []
+
+    from src.core.plane import Plane
+    import src.blocks.planes as mod
+    for attn, attv in sorted(mod.__dict__.items()):
+        if isclass(attv) and issubclass(attv, Plane) and attv is not Plane:
+            items.append(("plane-dynamics", attn))
+
+    from src.core.shell import Cannon
+    import src.blocks.weapons as mod
+    for attn, attv in sorted(mod.__dict__.items()):
+        if isclass(attv) and issubclass(attv, Cannon) and attv is not Cannon:
+            items.append(("cannon-dynamics", attn))
+
+    return items
+
+
+def _collect_terrain_items ():
+
+    from src.blocks.terrains import terrain_types_1
+
+    return [("terrain", tname) for tname in terrain_types_1()]
+
+
+def _init_worker (gameconf, inputconf):
+
+    from src.core.basestack import BaseStack
+
+    BaseStack(gameconf=gameconf, inputconf=inputconf, headless=True)
+    # ...also automatically sets __builtin__.base.
+
+
+def _build_item (item):
+
+    kind, name = item
+    t0 = time()
+    try:
+        if kind == "model":
+            base.load_model("data", name)
+        elif kind == "texture":
+            base.load_texture("data", name)
+        elif kind == "plane-dynamics":
+            import src.blocks.planes as mod
+            mod.__dict__[name].derive_dynamics()
+        elif kind == "cannon-dynamics":
+            import src.blocks.weapons as mod
+            mod.__dict__[name].derive_dynamics()
+        elif kind == "terrain":
+            _build_terrain(name)
+        else:
+            raise StandardError("Unknown cache item kind '%s'." % kind)
+        errmsg = None
+    except:
+        errmsg = traceback.format_exc()
+    # Pool workers do not run exit handlers.
+    save_file_hash_manifest()
+    t1 = time()
+    return item, (t1 - t0), errmsg
+
+
+def _build_terrain (terraintype):
+
+    from src.blocks.terrains import create_terrain_1
+    from src.core.world import World
+
+    # Cloud geometry depends on density and seed, so only clouds
+    # with default parameters of setup_world_1 are built.
+    world = World(game=None, mission=None)
+    create_terrain_1(world=world, terraintype=terraintype,
+                     visradius=80000,
+                     cumulusdens=1.0, cirrusdens=2.0, stratusdens=0.0,
+                     cloudseed=0,
+                     sunblend=(34.0, 1e6, 1e6), moonblend=(28.0,))
+    world.destroy()
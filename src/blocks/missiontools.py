@@ -674,6 +674,9 @@ def object_under_fire (ac):
     for b in ac.world.iter_bodies(["shell", "rocket"]):
         if ac.alive and ac.dist(b) < 1000:
             return True
+    swarm = ac.world.shell_swarm
+    if ac.alive and swarm is not None and swarm.any_within(ac.pos(), 1000):
+        return True
     return False
 
 
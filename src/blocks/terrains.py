@@ -5,7 +5,7 @@ from math import radians
 from pandac.PandaModules import Vec3, Vec4, Point3
 
 from src.core.clouds import Clouds
-from src.core.misc import rgba, clampn
+from src.core.misc import SimpleProps, rgba, clampn
 from src.core.sky import Sky, Dome, Sun, Moon, Stars, Fog
 from src.core.sound import ActionMusic
 from src.core.terrain import Terrain
@@ -105,9 +105,76 @@ def setup_world_1 (terraintype, skytype,
     return world
 
 
-def create_terrain_1 (world, terraintype, visradius,
-                      cumulusdens, cirrusdens, stratusdens, cloudseed,
-                      sunblend, moonblend):
+# All terrain types known to create_terrain_1.
+_terrain_types_1 = (
+    "00-flat0",
+    "00-zangbo",
+    "00-iraq",
+    "00-angola",
+    "01-taymyr",
+    "02-iraq",
+    "03-iran1",
+    "03-iran2",
+    "04-russia1",
+    "04-russia2",
+    "05-siberia1",
+    "05-siberia2",
+    "05-siberia3",
+    "05-siberia4",
+    "05-siberia5",
+    "05-siberia6",
+    "06-cuba1",
+    "06-cuba2",
+    "07-bahamas",
+    "08-borderland1",
+    "08-borderland2",
+    "08-borderland3",
+    "09-india1",
+    "10-pakistan1",
+    "11-afghanistan1",
+    "12-europe1",
+    "12-europe2",
+    "13-korea1",
+    "13-korea2",
+    "14-angola",
+    "99-vietnam",
+)
+
+def terrain_types_1 ():
+    """
+    Names of all terrain types known to create_terrain_1.
+    """
+
+    return list(_terrain_types_1)
+
+
+def prefetch_terrain_1 (terraintype):
+    """
+    Start loading textures and cached geometry of the terrain type
+    and its clouds in background, to be taken later by create_terrain_1.
+
+    Returns the list of futures of the background loader.
+    """
+
+    spec = _terrain_spec_1(terraintype)
+    futures = []
+    futures.extend(Terrain.prefetch(terraintype, spec.cuts))
+    for cloudtype in ("cumulus", "stratus", "cirrus"):
+        if not spec[cloudtype + "map"]:
+            continue
+        glowmap = spec[cloudtype + "glowmap"]
+        if glowmap:
+            glowmap = "images/sky/%s" % glowmap
+        futures.extend(Clouds.prefetch(terraintype + "-clouds-" + cloudtype,
+                                       texture=_cloud_texture_1,
+                                       glowmap=glowmap))
+    return futures
+
+
+_cloud_texture_1 = "images/sky/clouds_tex.png"
+
+
+def _terrain_spec_1 (terraintype):
 
     # Common parameters, can be overridden per terrain below.
     sizex = 320000
@@ -817,17 +884,40 @@ def create_terrain_1 (world, terraintype, visradius,
         waterlakeparams=waterlakeparams,
         tilediv=tilediv)
     cuts, tiledivx, tiledivy = ret
+
+    spec = SimpleProps(
+        sizex=sizex, sizey=sizey,
+        heightmap=heightmap, minheight=minheight, maxheight=maxheight,
+        celldensity=celldensity,
+        tiledivx=tiledivx, tiledivy=tiledivy, cuts=cuts, pntlit=pntlit,
+        cumulusmap=cumulusmap, stratusmap=stratusmap, cirrusmap=cirrusmap,
+        cumulusglowmap=cumulusglowmap, stratusglowmap=stratusglowmap,
+        cirrusglowmap=cirrusglowmap)
+    return spec
+
+
+def create_terrain_1 (world, terraintype, visradius,
+                      cumulusdens, cirrusdens, stratusdens, cloudseed,
+                      sunblend, moonblend):
+
+    spec = _terrain_spec_1(terraintype)
+    sizex, sizey = spec.sizex, spec.sizey
+    heightmap = spec.heightmap
+    cumulusmap, cumulusglowmap = spec.cumulusmap, spec.cumulusglowmap
+    stratusmap, stratusglowmap = spec.stratusmap, spec.stratusglowmap
+    cirrusmap, cirrusglowmap = spec.cirrusmap, spec.cirrusglowmap
+
     terrain = Terrain(world=world, name=terraintype,
                       sizex=sizex, sizey=sizey, visradius=visradius,
                       heightmap=("terrains/%s" % heightmap),
-                      minheight=minheight, maxheight=maxheight,
-                      celldensity=celldensity,
-                      tiledivx=tiledivx, tiledivy=tiledivy,
-                      cuts=cuts,
-                      pntlit=pntlit, sunblend=sunblend)
+                      minheight=spec.minheight, maxheight=spec.maxheight,
+                      celldensity=spec.celldensity,
+                      tiledivx=spec.tiledivx, tiledivy=spec.tiledivy,
+                      cuts=spec.cuts,
+                      pntlit=spec.pntlit, sunblend=sunblend)
     world.terrains.append(terrain)
 
-    cloudtex = "images/sky/clouds_tex.png"
+    cloudtex = _cloud_texture_1
     if cumulusmap and cumulusdens > 0.0:
         cumulusmap = "terrains/%s" % cumulusmap
         if cumulusglowmap:
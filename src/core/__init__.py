@@ -20,6 +20,7 @@ from jammer import *
 from light import *
 from misc import *
 from mission import *
+from perf import *
 from plane import *
 from planedyn import *
 from player import *
@@ -0,0 +1,162 @@
+# -*- coding: UTF-8 -*-
+
+from collections import deque
+import sys
+
+from direct.stdpy import threading
+
+from src.core.misc import warning
+from src.core.transl import *
+
+
+class LoadFuture (object):
+    """
+    Result of a function executed by the background loader.
+    """
+
+    def __init__ (self, func, args, kwargs):
+
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+        # Whether the function loads a model, set by the submitter.
+        self.loads_model = False
+
+
+    def _run (self):
+
+        try:
+            self._result = self._func(*self._args, **self._kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+        self._func = self._args = self._kwargs = None
+        self._done.set()
+
+
+    def done (self):
+
+        return self._done.isSet()
+
+
+    def result (self):
+        """
+        Return the result of the function, waiting for it if not done yet.
+        If the function raised an exception, it is raised again here.
+        """
+
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class AsyncLoader (object):
+    """
+    Background loader, executing functions on a pool of worker threads.
+
+    Functions submitted to the loader must be safe to execute outside
+    of the main thread, i.e. must only load data and not modify
+    the scene graph reachable from the render roots.
+    If the number of threads is zero, functions are executed
+    immediately on submission.
+
+    Progress is counted over all submissions since the last reset.
+    """
+
+    def __init__ (self, numthreads=1):
+
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._num_submitted = 0
+        self._num_done = 0
+
+        self.alive = True
+
+        self._threads = []
+        for i in range(numthreads):
+            thread = threading.Thread(target=self._work,
+                                      name=("async-loader-%d" % i))
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+        self._cond.acquire()
+        self._queue.clear()
+        self._cond.notifyAll()
+        self._cond.release()
+
+
+    def _work (self):
+
+        while True:
+            self._cond.acquire()
+            while self.alive and not self._queue:
+                self._cond.wait()
+            if not self.alive:
+                self._cond.release()
+                return
+            future = self._queue.popleft()
+            self._cond.release()
+
+            future._run()
+            if future._exc_info is not None:
+                warning(_("Background loading failed: %s") %
+                        future._exc_info[1])
+
+            self._cond.acquire()
+            self._num_done += 1
+            self._cond.release()
+
+
+    def submit (self, func, *args, **kwargs):
+
+        future = LoadFuture(func, args, kwargs)
+        self._cond.acquire()
+        self._num_submitted += 1
+        if self._threads and self.alive:
+            self._queue.append(future)
+            self._cond.notify()
+            self._cond.release()
+        else:
+            self._cond.release()
+            future._run()
+            self._cond.acquire()
+            self._num_done += 1
+            self._cond.release()
+        return future
+
+
+    def progress (self):
+        """
+        Return the number of completed and of all submitted functions.
+        """
+
+        self._cond.acquire()
+        ret = (self._num_done, self._num_submitted)
+        self._cond.release()
+        return ret
+
+
+    def pending (self):
+
+        done, submitted = self.progress()
+        return submitted - done
+
+
+    def reset_progress (self):
+
+        self._cond.acquire()
+        self._num_submitted -= self._num_done
+        self._num_done = 0
+        self._cond.release()
@@ -2,8 +2,8 @@
 
 import __builtin__
 from bisect import insort_left
-from hashlib import md5
 from math import degrees, atan
+from multiprocessing import cpu_count
 import os
 import sys
 
@@ -46,11 +46,15 @@ from direct.showbase.JobManagerGlobal import jobMgr
 from direct.showbase.Loader import Loader
 from direct.showbase.MessengerGlobal import messenger
 from direct.showbase.SfxPlayer import SfxPlayer
+from direct.stdpy import threading
 from direct.task import Task
 from direct.task.TaskManagerGlobal import taskMgr
 
 from src import full_path, real_path, path_exists, path_dirname
 from src.core.shader import make_blur_shader, make_desat_shader, make_bloom_shader
+from src.core.asyncload import AsyncLoader
+from src.core.misc import file_hash_hex
+from src.core.perf import TaskTimer, Benchmark
 from src.core.shader import make_shadow_shader
 from src.core.transl import *
 
@@ -60,7 +64,7 @@ class BaseStack (DirectObject):
     _created = False
 
     def __init__ (self, gameconf, inputconf, fixdt=None, randseed=None,
-                  pandalog=None):
+                  pandalog=None, headless=False, benchmark=None):
 
         self.alive = False # needed if it crashes during initialization
 
@@ -114,6 +118,14 @@ class BaseStack (DirectObject):
         __builtin__.taskMgr = taskMgr # for Audio3DManager
         __builtin__.messenger = messenger # for direct/src/fsm/StatePush.py
 
+        # Task timer must be installed before any task is added.
+        with_task_timing = gameconf.debug.task_timing
+        if benchmark is not None or with_task_timing:
+            self.task_timer = TaskTimer(taskMgr, aggregate=with_task_timing)
+        else:
+            self.task_timer = None
+        self.with_task_timing = with_task_timing
+
         graphics_engine = GraphicsEngine.getGlobalPtr()
         self.graphics_engine = graphics_engine
 
@@ -121,6 +133,14 @@ class BaseStack (DirectObject):
         graphics_engine.setDefaultLoader(loader.loader)
         self._loader = loader
 
+        if gameconf.cpu.loader_threads == "auto":
+            num_loader_threads = max(1, min(cpu_count() - 1, 4))
+        else:
+            num_loader_threads = gameconf.cpu.loader_threads
+        self.async_loader = AsyncLoader(num_loader_threads)
+        self._file_load_locks = {}
+        self._file_load_locks_lock = threading.Lock()
+
         with_antialiasing = gameconf.video.multi_sampling_antialiasing
         with_bloom = True
         with_glow_add = False
@@ -131,8 +151,9 @@ class BaseStack (DirectObject):
         self.with_glow_add = with_glow_add
         self.with_world_shadows = with_world_shadows
         self.with_cockpit_shadows = with_cockpit_shadows
+        self.headless = headless
         ret = BaseStack._setup_window(panda_notify, panda_config, graphics_engine,
-                                      with_antialiasing, with_bloom)
+                                      with_antialiasing, with_bloom, headless)
         window, wbuffer = ret
         #is_main_window = True
         #messenger.send("open_window", [window, is_main_window])
@@ -189,7 +210,7 @@ class BaseStack (DirectObject):
         self.cockpit_shadow_camera = cockpit_shadow_camera
         self._bloom_specs = bloom_specs
 
-        ret = BaseStack._setup_mouse(window, uiface_root)
+        ret = BaseStack._setup_mouse(window, uiface_root, headless)
         data_root, datagraph_trav, mouse_watcher = ret
         self._data_root = data_root
         self._datagraph_trav = datagraph_trav
@@ -219,6 +240,7 @@ class BaseStack (DirectObject):
         self.audio_manager = audio_manager
         self.audio3d_manager = audio3d_manager
         self.sound_distance_scale = sound_distance_scale
+        self.sound_max_voices = gameconf.audio.max_voices
         self.sfxManagerList = [audio_manager] # for direct.showbase.Loader
 
         BaseStack._setup_stats(panda_config)
@@ -231,6 +253,8 @@ class BaseStack (DirectObject):
         self.buffer_viewer = buffer_viewer
 
         self.accept("window-event", self._window_event)
+        if self.with_task_timing:
+            self.accept("alt-f12", self._dump_task_timing)
 
         self._desat_factor_pack = desat_factor_pack
         self.set_desaturation_strength(0.0)
@@ -282,6 +306,12 @@ class BaseStack (DirectObject):
         taskMgr.add(self._loop_once_late, "render", sort=100)
         eventMgr.restart()
 
+        if benchmark is not None:
+            report_path, numframes = benchmark
+            self.benchmark = Benchmark(self.task_timer, report_path, numframes)
+        else:
+            self.benchmark = None
+
 
     def destroy (self):
 
@@ -298,6 +328,7 @@ class BaseStack (DirectObject):
 
         self.audio_manager.shutdown()
 
+        self.async_loader.destroy()
         self._loader.destroy()
 
         self.graphics_engine.removeAllWindows()
@@ -305,13 +336,20 @@ class BaseStack (DirectObject):
         del self.window
         del self.pipe
 
+        if self.benchmark is not None:
+            self.benchmark.destroy()
+        if self.task_timer is not None:
+            if self.with_task_timing:
+                self.task_timer.dump_stats()
+            self.task_timer.destroy()
+
         if self._panda_log_fs is not None:
             self._panda_log_fs.close()
 
 
     @staticmethod
     def _setup_window (panda_notify, panda_config, graphics_engine,
-                       with_antialiasing, with_bloom):
+                       with_antialiasing, with_bloom, headless=False):
 
         name = "window"
 
@@ -334,9 +372,15 @@ class BaseStack (DirectObject):
                           dict(type=pipe.getType().getName(),
                                name=pipe.getInterfaceName()))
 
-        flags = (0
-            | GraphicsPipe.BFRequireWindow
-        )
+        if not headless:
+            flags = (0
+                | GraphicsPipe.BFRequireWindow
+            )
+        else:
+            # Render into an offscreen buffer instead of a window.
+            flags = (0
+                | GraphicsPipe.BFRefuseWindow
+            )
 
         window = graphics_engine.makeOutput(pipe=pipe, name=name, sort=0,
                                             fb_prop=fbprops,
@@ -345,7 +389,8 @@ class BaseStack (DirectObject):
         if window is None:
             panda_notify.error("Cannot open the window.")
 
-        window.requestProperties(winprops)
+        if not headless:
+            window.requestProperties(winprops)
 
         # Make the window really open.
         graphics_engine.openWindows()
@@ -838,12 +883,20 @@ class BaseStack (DirectObject):
 
 
     @staticmethod
-    def _setup_mouse (window, uiface_root):
+    def _setup_mouse (window, uiface_root, headless=False):
 
         data_root_node = NodePath("data-root")
         data_root = data_root_node.node()
         datagraph_trav = DataGraphTraverser()
 
+        if headless:
+            # No input devices on offscreen buffer,
+            # only a watcher for user interface elements.
+            mw = data_root_node.attachNewNode(MouseWatcher("watcher0"))
+            uiface_root.node().setMouseWatcher(mw.node())
+            mw.node().addRegion(PGMouseWatcherBackground())
+            return data_root, datagraph_trav, mw
+
         # For each mouse/keyboard device, we create
         #  - MouseAndKeyboard
         #  - MouseWatcher
@@ -957,6 +1010,12 @@ class BaseStack (DirectObject):
                 sys.exit() # diverted to self._exitf
 
 
+    def _dump_task_timing (self):
+
+        self.task_timer.dump_stats()
+        self.task_timer.reset_stats()
+
+
     def _exitf (self):
 
         self.destroy()
@@ -1187,8 +1246,7 @@ class BaseStack (DirectObject):
         ckey = (category, file_path)
         key_hex = self._file_key_hex_cache.get(ckey)
         if key_hex is None:
-            real_file_path = real_path(category, file_path)
-            key_hex = md5(open(real_file_path, "rb").read()).hexdigest()
+            key_hex = file_hash_hex(category, file_path)
             self._file_key_hex_cache[ckey] = key_hex
         return key_hex
 
@@ -1225,6 +1283,33 @@ class BaseStack (DirectObject):
                                test_ext, cache_ext,
                                load_func, write_func, copy_func, cache):
 
+        # Files may be loaded concurrently by the background loader,
+        # so loading and caching of each file must be serialized.
+        lock = self._file_load_lock((category, file_path_noext))
+        lock.acquire()
+        try:
+            return self._load_file_with_cache_1(
+                category, file_path_noext, test_ext, cache_ext,
+                load_func, write_func, copy_func, cache)
+        finally:
+            lock.release()
+
+
+    def _file_load_lock (self, ckey):
+
+        self._file_load_locks_lock.acquire()
+        lock = self._file_load_locks.get(ckey)
+        if lock is None:
+            lock = threading.Lock()
+            self._file_load_locks[ckey] = lock
+        self._file_load_locks_lock.release()
+        return lock
+
+
+    def _load_file_with_cache_1 (self, category, file_path_noext,
+                                 test_ext, cache_ext,
+                                 load_func, write_func, copy_func, cache):
+
         ckey = (category, file_path_noext)
         full_file_cext_path = self._full_file_cext_path_cache.get(ckey)
         write_cache = False
@@ -1313,6 +1398,24 @@ class BaseStack (DirectObject):
         return obj
 
 
+    def drop_loaded_file (self, category, file_path):
+        """
+        Forget the loaded object of the given file, if any,
+        such that the next load reads the file anew.
+        The path must be the same as given when loading.
+        """
+
+        # Wait for any background load of the file to complete.
+        lock = self._file_load_lock((category, file_path))
+        lock.acquire()
+        for cache in (self._full_file_cext_path_cache,
+                      self._file_object_cache):
+            for ckey in cache.keys():
+                if ckey[0] == category and ckey[1].startswith(file_path):
+                    del cache[ckey]
+        lock.release()
+
+
     def set_only_cached (self, active):
 
         self._only_cached = bool(active)
@@ -1332,6 +1435,21 @@ class BaseStack (DirectObject):
         return model
 
 
+    def load_model_async (self, category, model_path_noext, cache=True):
+        """
+        Load the model on the background loader.
+
+        Returns a future, whose result is the same as that of load_model.
+        Later load_model calls for the same model take the loaded model,
+        so this can also be used just to prefetch models.
+        """
+
+        future = self.async_loader.submit(self.load_model,
+                                          category, model_path_noext, cache)
+        future.loads_model = True
+        return future
+
+
     def _load_model_any (self, full_model_path):
 
         model = self._loader.loadModel(Filename(full_model_path),
@@ -1366,6 +1484,17 @@ class BaseStack (DirectObject):
         return texture
 
 
+    def load_texture_async (self, category, texture_path_noext):
+        """
+        Load the texture on the background loader.
+
+        Returns a future, whose result is the same as that of load_texture.
+        """
+
+        return self.async_loader.submit(self.load_texture,
+                                        category, texture_path_noext)
+
+
     def _load_texture_any (self, full_texture_path):
 
         texture = self._loader.loadTexture(Filename(full_texture_path))
@@ -1423,6 +1552,8 @@ class BaseStack (DirectObject):
 
     def center_mouse_pointer (self):
 
+        if self.headless:
+            return
         center_x = self.window_size_x // 2
         center_y = self.window_size_y // 2
         base.window.movePointer(0, center_x, center_y)
@@ -1,6 +1,6 @@
 # -*- coding: UTF-8 -*-
 
-from math import degrees, pi, acos
+from math import degrees, pi, sqrt, acos
 
 from pandac.PandaModules import VBase2, VBase3, Vec3, Vec4, Point2, Point3, Quat
 from pandac.PandaModules import NodePath
@@ -12,6 +12,7 @@ from src.core.fire import MuzzleFlash
 from src.core.light import AutoPointLight
 from src.core.misc import rgba, sign, next_pos, next_quat
 from src.core.misc import load_model, load_model_lod_chain, extract_model_lod_chain
+from src.core.misc import segment_point_dist
 from src.core.misc import report, dbgval
 from src.core.sensor import SensorPack
 from src.core.shader import make_shader, SHADOWBLUR
@@ -798,6 +799,56 @@ class Hitbox (object):
             self.volume += v
             self.center += c * v
         self.center /= self.volume
+        self._center0 = Point3(self.center)
+
+        # Whether the collision node may be moved relative to the body
+        # (e.g. on a swing-wing arm), so that solids as given by
+        # collision data are no longer in body coordinates.
+        self.moving = False
+
+        # Radius of the sphere around center enclosing all solids.
+        self.radius = 0.0
+        for csd in self.colldata:
+            cst = Hitbox._csd_type(csd)
+            if cst == "sphere":
+                c, r = csd
+                rad = (c - self.center).length() + r
+            elif cst == "segment":
+                p1, p2 = csd
+                rad = max((p1 - self.center).length(),
+                          (p2 - self.center).length())
+            elif cst == "box":
+                c, hwx, hwy, hwz = csd
+                rad = ((c - self.center).length() +
+                       (hwx**2 + hwy**2 + hwz**2)**0.5)
+            self.radius = max(self.radius, rad)
+
+        # Half length along body forward axis, and radius around it,
+        # of the capsule around center enclosing all solids.
+        # Used to sweep hitboxes of fast bodies along their motion.
+        self.axhlen = 0.0
+        self.axrad = 0.0
+        for csd in self.colldata:
+            cst = Hitbox._csd_type(csd)
+            if cst == "sphere":
+                c, r = csd
+                o = c - self.center
+                hlen = abs(o[1])
+                rad = (o[0]**2 + o[2]**2)**0.5 + r
+            elif cst == "segment":
+                p1, p2 = csd
+                o1 = p1 - self.center
+                o2 = p2 - self.center
+                hlen = max(abs(o1[1]), abs(o2[1]))
+                rad = max((o1[0]**2 + o1[2]**2)**0.5,
+                          (o2[0]**2 + o2[2]**2)**0.5)
+            elif cst == "box":
+                c, hwx, hwy, hwz = csd
+                o = c - self.center
+                hlen = abs(o[1]) + hwy
+                rad = ((abs(o[0]) + hwx)**2 + (abs(o[2]) + hwz)**2)**0.5
+            self.axhlen = max(self.axhlen, hlen)
+            self.axrad = max(self.axrad, rad)
 
         cnd = CollisionNode("cnode-%s" % self.name)
         for csd in self.colldata:
@@ -827,8 +878,6 @@ class Hitbox (object):
         cnd.setIntoCollideMask(self._cmask_into)
 
         if self.isfrom:
-            world = self.pbody.world
-            world.ctrav.addCollider(self.cnode, world.cqueue)
             self._cmask_from = 0x0001
         else:
             self._cmask_from = 0x0000
@@ -837,6 +886,8 @@ class Hitbox (object):
         self._cnd = cnd
         self.active = True
 
+        pbody.world.add_hitbox(self)
+
 
     def set_active (self, active):
 
@@ -853,10 +904,83 @@ class Hitbox (object):
                 self._cnd.setFromCollideMask(0x0000)
 
 
+    def surface_distance (self, pos):
+        """
+        Signed distance of the point, given in body coordinates,
+        to the surface of the nearest solid; negative when inside.
+        Segments have no inside.
+        """
+
+        pos = self._to_solid_frame(pos)
+        mindist = None
+        for csd in self.colldata:
+            cst = Hitbox._csd_type(csd)
+            if cst == "sphere":
+                c, r = csd
+                dist = (pos - c).length() - r
+            elif cst == "segment":
+                p1, p2 = csd
+                d12 = p2 - p1
+                l12sq = d12.lengthSquared()
+                u = (pos - p1).dot(d12) / l12sq if l12sq > 0.0 else 0.0
+                u = min(max(u, 0.0), 1.0)
+                dist = (pos - (p1 + d12 * u)).length()
+            elif cst == "box":
+                c, hwx, hwy, hwz = csd
+                q = pos - c
+                dx, dy, dz = abs(q[0]) - hwx, abs(q[1]) - hwy, abs(q[2]) - hwz
+                if dx > 0.0 or dy > 0.0 or dz > 0.0:
+                    dist = sqrt(max(dx, 0.0)**2 + max(dy, 0.0)**2 +
+                                max(dz, 0.0)**2)
+                else:
+                    dist = max(dx, dy, dz)
+            if mindist is None or dist < mindist:
+                mindist = dist
+        return mindist
+
+
+    def sweep_param (self, p0, p1, rad):
+        """
+        Return the fraction along the segment at which the segment
+        thickened by given radius first touches the hitbox,
+        or None if it does not touch it.
+        Segment must be given in body coordinates.
+        """
+
+        if segment_point_dist(p0, p1, self.center) > self.radius + rad:
+            return None
+        p0 = self._to_solid_frame(p0)
+        p1 = self._to_solid_frame(p1)
+        d = p1 - p0
+        tmin = None
+        for csd in self.colldata:
+            cst = Hitbox._csd_type(csd)
+            if cst == "sphere":
+                c, r = csd
+                t = _segment_sphere_param(p0, d, c, r + rad)
+            elif cst == "box":
+                c, hwx, hwy, hwz = csd
+                t = _segment_box_param(p0, d, c,
+                                       (hwx + rad, hwy + rad, hwz + rad))
+            else:
+                # Segments cannot be collided into.
+                t = None
+            if t is not None and (tmin is None or tmin > t):
+                tmin = t
+        return tmin
+
+
+    def _to_solid_frame (self, pos):
+
+        if not self.moving:
+            return pos
+        return (self.cnode.getRelativePoint(self.pbody.node, pos) +
+                self._center0)
+
+
     def destroy (self):
 
-        world = self.pbody.world
-        world.ctrav.removeCollider(self.cnode)
+        self.pbody.world.remove_hitbox(self)
         self.cnode.clearPythonTag("hitbox")
         self.cnode.removeNode()
 
@@ -879,6 +1003,44 @@ class Hitbox (object):
                 "Unknown collision solid data composition '%s'." % csd)
 
 
+def _segment_sphere_param (p0, d, c, r):
+
+    m = p0 - c
+    cm = m.dot(m) - r**2
+    if cm <= 0.0:
+        return 0.0
+    a = d.dot(d)
+    b = m.dot(d)
+    if a == 0.0 or b > 0.0:
+        return None
+    disc = b**2 - a * cm
+    if disc < 0.0:
+        return None
+    t = (-b - sqrt(disc)) / a
+    return t if t <= 1.0 else None
+
+
+def _segment_box_param (p0, d, c, hws):
+
+    t0, t1 = 0.0, 1.0
+    for k in (0, 1, 2):
+        lo = c[k] - hws[k]
+        hi = c[k] + hws[k]
+        if d[k] == 0.0:
+            if p0[k] < lo or p0[k] > hi:
+                return None
+        else:
+            ta = (lo - p0[k]) / d[k]
+            tb = (hi - p0[k]) / d[k]
+            if ta > tb:
+                ta, tb = tb, ta
+            t0 = max(t0, ta)
+            t1 = min(t1, tb)
+            if t0 > t1:
+                return None
+    return t0
+
+
 class EnhancedVisual (Body):
 
     def __init__ (self, parent, bbox):
@@ -1,17 +1,21 @@
 # -*- coding: UTF-8 -*-
 
-from pandac.PandaModules import VBase2, VBase2D, Vec3, Vec4, Point2, Point3
-from pandac.PandaModules import NodePath
+from array import array
+
+from pandac.PandaModules import VBase2, VBase2D, VBase3, VBase4
+from pandac.PandaModules import Vec3, Vec4, Point2, Point3
+from pandac.PandaModules import NodePath, Texture, BoundingSphere
 
 from src import pycv
 from src.core.body import Body
 from src.core.effect import fire_n_smoke_3
 from src.core.fire import PolyExplosion
-from src.core.misc import rgba, AutoProps, remove_subnodes, set_texture
+from src.core.misc import rgba, AutoProps, SimpleProps
+from src.core.misc import remove_subnodes, set_texture
 from src.core.misc import fx_uniform, fx_choice
 from src.core.misc import uniform
 from src.core.misc import hrmin_to_sec
-from src.core.shader import make_shader
+from src.core.shader import make_shader, SHADOWBLUR
 from src.core.sound import Sound3D
 from src.core.table import Table1
 
@@ -52,11 +56,12 @@ class Building (Body):
     destoffparts = []
     desttextures = []
     distraise = []
+    instanced = False
 
     def __init__ (self, world, name, side,
                   texture=None, normalmap=None, clamp=True,
                   pos=None, hpr=None, sink=None, damage=None,
-                  burns=True, lightsact="cycle"):
+                  burns=True, lightsact="cycle", transp=None):
 
         # ====================
 
@@ -160,6 +165,23 @@ class Building (Body):
             self._lights_updperiod = uniform(120.0, 240.0)
             self._lights_updwait = 0.0
 
+        if transp is not None:
+            self.node.setTransparency(transp)
+
+        # Draw through the instancer if nothing is specific to this building.
+        self._instanced = False
+        if (self.instanced and self.models and
+            not self.distraise and not self._lights and
+            not isinstance(self.modelpath[0], NodePath)):
+            gkey = (self.species,
+                    _hkey(self.modelpath), texture, normalmap, clamp,
+                    _hkey(self.glowmap), _hkey(self.glossmap),
+                    _hkey(self.modelscale), _hkey(self.modeloffset),
+                    _hkey(self.modelrot), transp)
+            BuildingInstancer.for_world(world).add(self, gkey)
+            self.modelnode.stash()
+            self._instanced = True
+
         base.taskMgr.add(self._loop, "building-loop-%s" % self.name)
 
 
@@ -203,9 +225,21 @@ class Building (Body):
             return
         for turret in self.turrets:
             turret.destroy()
+        self._leave_instancing()
         Body.destroy(self)
 
 
+    def _leave_instancing (self):
+
+        if not self._instanced:
+            return
+        self._instanced = False
+        instancer = self.world.building_instancer
+        if instancer is not None and instancer.alive:
+            instancer.remove(self)
+        self.modelnode.unstash()
+
+
     def collide (self, obody, chbx, cpos):
 
         inert = Body.collide(self, obody, chbx, cpos)
@@ -220,6 +254,9 @@ class Building (Body):
         if self.damage >= self.strength:
             self.set_shotdown(5.0)
 
+            # Destruction modifies the models, so draw them directly.
+            self._leave_instancing()
+
             self.explode_minor()
 
             if "_all_" in self.destoffparts:
@@ -295,7 +332,7 @@ class CustomBuilding (Building):
                   damage=None, burns=True, lightsact="cycle",
                   destfirepos=None, destoffparts=[], desttexture=None,
                   distraise=[], castshadow=True, shdmodelpath=None,
-                  longdes=None, shortdes=None):
+                  longdes=None, shortdes=None, instanced=False):
 
         self.strength = strength
         self.minhitdmg = minhitdmg
@@ -312,14 +349,199 @@ class CustomBuilding (Building):
         self.shdmodelpath = shdmodelpath
         self.longdes = longdes
         self.shortdes = shortdes
+        self.instanced = instanced
         if desttexture:
             self.desttextures = [desttexture]
         Building.__init__(self,
             world=world, name=name, side=side,
             texture=texture, normalmap=normalmap, clamp=clamp,
             pos=pos, hpr=hpr, sink=sink,
-            damage=damage, burns=burns, lightsact=lightsact)
-        if transp is not None:
-            self.node.setTransparency(transp)
+            damage=damage, burns=burns, lightsact=lightsact, transp=transp)
+
+
+def _hkey (value):
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_hkey(e) for e in value)
+    elif isinstance(value, (VBase3, VBase4)):
+        return tuple(value)
+    else:
+        return value
+
+
+class BuildingInstancer (object):
+    """
+    Drawer of identical static buildings by hardware instancing.
+
+    Buildings with the same model and textures form a group,
+    which keeps one copy of the model LOD chain. Each level is drawn
+    in a single call for all buildings currently at that level,
+    with their transforms read by the shader from a float texture.
+    Buildings needing a state of their own (e.g. when destroyed)
+    leave the instancer and draw their own models again.
+
+    There is one instancer per world, obtained by for_world().
+    """
+
+    _instn = "INinstmat"
+
+    def __init__ (self, world):
+
+        self.world = world
+
+        self.node = world.node.attachNewNode("building-instances")
+
+        self._groups = {}
+        self._group_by_building = {}
+
+        self._update_period = 0.53
+        self._update_wait = 0.0
+
+        self.alive = True
+        base.taskMgr.add(self._loop, "building-instancer-loop")
+
+
+    @staticmethod
+    def for_world (world):
+
+        instancer = world.building_instancer
+        if instancer is None or not instancer.alive:
+            instancer = BuildingInstancer(world)
+            world.building_instancer = instancer
+        return instancer
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+        self.node.removeNode()
+        self._groups = {}
+        self._group_by_building = {}
+
+
+    def add (self, building, gkey):
+
+        group = self._groups.get(gkey)
+        if group is None:
+            group = self._make_group(building)
+            self._groups[gkey] = group
+        group.buildings.append(building)
+        self._group_by_building[building] = group
+        self._update_wait = 0.0
+
+
+    def remove (self, building):
+
+        group = self._group_by_building.pop(building, None)
+        if group is not None:
+            group.buildings.remove(building)
+            self._update_wait = 0.0
+
+
+    def _make_group (self, building):
+
+        # Shader as for the building itself, but without point lights,
+        # since these are assigned per body.
+        shdinp = self.world.shdinp
+        kwargs = dict(building.shader_kwargs)
+        kwargs.update(pntlns=[],
+                      shadowrefn=shdinp.shadowrefn,
+                      shadowdirlin=shdinp.shadowdirlin,
+                      shadowblendn=shdinp.shadowblendn,
+                      shadowpush=0.003, shadowblur=SHADOWBLUR.NONE,
+                      instn=self._instn)
+        shader = make_shader(**kwargs)
+
+        gnode = self.node.attachNewNode("building-group")
+        levels = []
+        for lv, model in enumerate(building.models):
+            lnode = gnode.attachNewNode("level-%d" % lv)
+            model.copyTo(lnode)
+            lnode.flattenLight()
+            lnode.node().setFinal(True)
+            lnode.setShader(shader)
+            if building.node.hasTransparency():
+                lnode.setTransparency(building.node.getTransparency())
+            tex = Texture("building-instances")
+            tex.setup2dTexture(3, 1, Texture.TFloat, Texture.FRgba32)
+            tex.setMinfilter(Texture.FTNearest)
+            tex.setMagfilter(Texture.FTNearest)
+            lnode.setShaderInput(self._instn, tex)
+            lnode.stash()
+            levels.append(SimpleProps(node=lnode, texture=tex, shown=False))
+
+        radius = building.bbox.length() * 0.5 + building.bboxcenter.length()
+        fardists = [(fd if fd > 0.0 else 1e30) for fd in building.fardists]
+
+        group = SimpleProps(node=gnode, levels=levels, fardists=fardists,
+                            radius=radius, buildings=[])
+        return group
+
+
+    def _loop (self, task):
+
+        if not self.alive:
+            return task.done
+        if not self.world.alive:
+            self.destroy()
+            return task.done
+
+        self._update_wait -= self.world.dt
+        if self._update_wait <= 0.0:
+            self._update_wait = self._update_period
+            campos = self.world.camera.getPos(self.world.node)
+            for group in self._groups.itervalues():
+                self._update_group(group, campos)
+
+        return task.cont
 
 
+    def _update_group (self, group, campos):
+
+        wnode = self.world.node
+        fardists = group.fardists
+        numlevels = len(fardists)
+        lvmats = [[] for lv in xrange(numlevels)]
+        lvposs = [[] for lv in xrange(numlevels)]
+        for building in group.buildings:
+            bpos = building.node.getPos(wnode)
+            dist = (bpos - campos).length()
+            for lv in xrange(numlevels):
+                if dist < fardists[lv]:
+                    lvmats[lv].append(building.node.getMat(wnode))
+                    lvposs[lv].append(bpos)
+                    break
+
+        for level, mats, poss in zip(group.levels, lvmats, lvposs):
+            num = len(mats)
+            if num == 0:
+                if level.shown:
+                    level.node.stash()
+                    level.shown = False
+                continue
+
+            # Model-to-world matrices are stored by columns,
+            # since Panda uses row vectors and the shader column vectors.
+            # Texture RAM images are in BGRA component order.
+            data = array("f")
+            for mat in mats:
+                for k in (0, 1, 2):
+                    c = mat.getCol(k)
+                    data.extend((c[2], c[1], c[0], c[3]))
+            level.texture.setup2dTexture(3, num, Texture.TFloat,
+                                         Texture.FRgba32)
+            level.texture.setRamImage(data.tostring())
+            level.node.setInstanceCount(num)
+
+            center = Point3()
+            for pos in poss:
+                center += pos
+            center /= num
+            radius = max((pos - center).length() for pos in poss)
+            radius += group.radius
+            level.node.node().setBounds(BoundingSphere(center, radius))
+            if not level.shown:
+                level.node.unstash()
+                level.shown = True
@@ -15,7 +15,6 @@ from pandac.PandaModules import GeomVertexArrayFormat, InternalName
 from pandac.PandaModules import GeomVertexFormat
 from pandac.PandaModules import GeomVertexWriter, GeomVertexData
 from pandac.PandaModules import Geom, GeomNode, GeomTriangles
-from pandac.PandaModules import Shader
 
 from src import join_path, path_exists, path_dirname
 from src import internal_path, real_path, full_path
@@ -29,6 +28,7 @@ from src.core.shader import make_shdfunc_fogbln, make_shdfunc_fogapl
 from src.core.shader import make_shdfunc_sunbln
 from src.core.shader import make_frag_outputs
 from src.core.shader import printsh
+from src.core.shader import make_glsl_shader, register_shader_maker
 from src.core.table import UnitGrid2
 from src.core.transl import *
 
@@ -160,16 +160,29 @@ class Clouds (object):
 
         # Initialize view direction and LOD handling per tile,
         # and collect data for loop.
-        self._vtilings = []
-        for vtiling in tileroot.getChildren():
-            self._vtilings.append(vtiling)
+        # Tilings of all sorting directions share the same vertex data,
+        # so only the first tiling is kept, and on direction change
+        # its geoms take the triangles of the corresponding tiling.
+        vtilings = tileroot.getChildren().getPaths()
+        self._vtiling = vtilings[0]
+        for ijtile in self._vtiling.getChildren():
+            tlod = ijtile.node()
+            for kl in xrange(numlods):
+                tlod.setSwitch(kl, actloddists[kl + 1], actloddists[kl])
+        self._vsort_geoms = []
+        for ijtile in self._vtiling.getChildren():
+            for ltile in ijtile.getChildren():
+                self._vsort_geoms.append(ltile.node().modifyGeom(0))
+        self._vsort_prims = []
+        for vtiling in vtilings:
+            prims = []
             for ijtile in vtiling.getChildren():
-                tlod = ijtile.node()
-                for kl in xrange(numlods):
-                    tlod.setSwitch(kl, actloddists[kl + 1], actloddists[kl])
-            vtiling.hide()
+                for ltile in ijtile.getChildren():
+                    prims.append(ltile.node().getGeom(0).getPrimitive(0))
+            self._vsort_prims.append(prims)
+        for vtiling in vtilings[1:]:
+            vtiling.removeNode()
         self._vsortdir_index = 0
-        self._vtilings[self._vsortdir_index].show()
 
         # Setup tile rendering.
         tileroot.setDepthWrite(False)
@@ -215,6 +228,31 @@ class Clouds (object):
         base.taskMgr.add(self._loop, "clouds-loop")
 
 
+    @staticmethod
+    def prefetch (name, texture=None, glowmap=None):
+        """
+        Start loading textures and cached geometry
+        of the named clouds in background.
+
+        Returns the list of futures of the background loader,
+        empty if there is nothing to load.
+        """
+
+        futures = []
+        for texpath in (texture, glowmap):
+            if isinstance(texpath, basestring):
+                futures.append(base.load_texture_async("data", texpath))
+
+        if not USE_COMPILED:
+            keypath = CloudsGeom._cache_key_path(name)
+            geomdatapath = CloudsGeom._cache_geomdata_path(name)
+            if (path_exists("cache", keypath) and
+                path_exists("cache", geomdatapath)):
+                futures.append(base.load_model_async("cache", geomdatapath,
+                                                     cache=False))
+        return futures
+
+
     def destroy (self):
 
         if not self.alive:
@@ -226,9 +264,9 @@ class Clouds (object):
 
     def _prod_gc (self):
 
-        for vtiling in self._vtilings:
-            vtiling.removeNode()
-        self._vtilings = []
+        self._vtiling.removeNode()
+        self._vsort_geoms = []
+        self._vsort_prims = []
         del self._geom
 
 
@@ -587,7 +625,7 @@ void main ()
 
         if 0:
             printsh((vshstr, fshstr), "clouds-shader")
-        shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+        shader = make_glsl_shader("clouds", shdkey, vshstr, fshstr)
         Clouds._shader_cache[shdkey] = shader
         return shader
 
@@ -642,8 +680,9 @@ void main ()
             vsind = self._geom.update_visual_sort_dir_index(
                 camdir, self._vsortdir_index)
             if self._vsortdir_index != vsind:
-                self._vtilings[self._vsortdir_index].hide()
-                self._vtilings[vsind].show()
+                for geom, prim in zip(self._vsort_geoms,
+                                      self._vsort_prims[vsind]):
+                    geom.setPrimitive(0, prim)
                 self._vsortdir_index = vsind
 
         # Update shader inputs.
@@ -652,6 +691,10 @@ void main ()
         return task.cont
 
 
+register_shader_maker("clouds", Clouds._shader_cache,
+                      internal_path("data", __file__).replace(".pyc", ".py"))
+
+
 # :also-compiled:
 class CloudsGeom (object):
 
@@ -1228,6 +1271,9 @@ class CloudsGeom (object):
             return None
         okeyhx = open(real_path("cache", keypath), "rb").read()
         if okeyhx != keyhx:
+            # Geometry may have been prefetched from the outdated cache.
+            base.drop_loaded_file("cache",
+                                  CloudsGeom._cache_geomdata_path(tname))
             return None
 
         celldatapath = CloudsGeom._cache_celldata_path(tname)
@@ -3,6 +3,7 @@
 from bisect import bisect
 from math import radians, degrees, pi, sin, cos, tan, acos, atan, atan2
 from math import sqrt, log
+from time import time
 
 from pandac.PandaModules import VBase2, Vec3, Vec4, Point2, Point3, Mat4, Quat
 from pandac.PandaModules import Point3D
@@ -23,6 +24,7 @@ from src.core.misc import to_navhead, norm_ang_delta, vectohpr, hprtovec
 from src.core.misc import AutoProps, SimpleProps
 from src.core.misc import rgba, node_fade_to
 from src.core.misc import make_image, make_text, update_text
+from src.core.misc import make_digit_text, update_digit_text
 from src.core.misc import make_frame, make_quad, make_raw_quad
 from src.core.misc import load_model, set_texture, texstage_color
 from src.core.misc import font_scale_for_ptsize, vert_to_horiz_fov
@@ -364,7 +366,7 @@ class Cockpit (object):
 
         # Setup instruments.
         self._txscmgr = TexsceneManager("cockpit")
-        self._instr_update_fs = []
+        self._instr_sched = InstrumentScheduler("cockpit")
         self._instr_cleanup_fs = []
         self._instr_night_light_nodes = []
         self._instr_activate_fs = []
@@ -498,8 +500,7 @@ class Cockpit (object):
             self._update_lighting(dt)
             self._update_headpos(dt)
             self._update_aimzoom(dt)
-            for upf in self._instr_update_fs:
-                upf(dt)
+            self._instr_sched.update(dt)
 
         # Always on, must track state.
         self._update_sounds(dt)
@@ -1044,7 +1045,7 @@ class Cockpit (object):
         #screennd = self._model.find("**/visor_screen")
         #if screennd.isEmpty():
             #return False
-        self._instr_update_fs.append(self._update_visor)
+        self._instr_sched.add(self._update_visor)
         self._instr_cleanup_fs.append(self._cleanup_visor)
         self._instr_activate_fs.append(self._activate_visor)
         self._instr_deactivate_fs.append(self._deactivate_visor)
@@ -1254,7 +1255,7 @@ class Cockpit (object):
         screennd = self._model.find("**/radarpanel_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_radar)
+        self._instr_sched.add(self._update_radar)
         self._instr_cleanup_fs.append(self._cleanup_radar)
 
         glassnd = self._model.find("**/radarpanel_glass")
@@ -1611,7 +1612,7 @@ class Cockpit (object):
         screennd = self._model.find("**/hud_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_hud)
+        self._instr_sched.add(self._update_hud)
         self._instr_cleanup_fs.append(self._cleanup_hud)
         screennd.setBin("fixed", 120) # higher than "glass" (projection surface)
 
@@ -1682,17 +1683,17 @@ class Cockpit (object):
         # Altitude and speed.
         self._hud_altspd_period = 0.31
         self._hud_wait_altspd = 0.0
-        self._hud_speed_text = make_text(
-            width=0.5, pos=Point2(-0.40, 0.70),
+        self._hud_speed_text = make_digit_text(
+            numchars=5, width=0.5, pos=Point2(-0.40, 0.70),
             font=self._hud_font, size=(1.15 * bfsz), color=self._hud_color,
             align="r", anchor="mr", parent=self._hud_overlay_node)
         # NOTE: Temporary, until instrument panel done.
-        self._hud_altitude_text = make_text(
-            width=0.5, pos=Point2(0.40, 0.70),
+        self._hud_altitude_text = make_digit_text(
+            numchars=6, width=0.5, pos=Point2(0.40, 0.70),
             font=self._hud_font, size=(1.15 * bfsz), color=self._hud_color,
             align="l", anchor="ml", parent=self._hud_overlay_node)
-        self._hud_radar_altitude_text = make_text(
-            width=0.5, pos=Point2(0.40, 0.60),
+        self._hud_radar_altitude_text = make_digit_text(
+            numchars=4, width=0.5, pos=Point2(0.40, 0.60),
             font=self._hud_font, size=(0.85 * bfsz), color=self._hud_color,
             align="l", anchor="ml", parent=self._hud_overlay_node)
         self._hud_radar_altitude_threshold = 1000.0
@@ -1757,8 +1758,8 @@ class Cockpit (object):
             "images/cockpit/cockpit_mig29_hud_horizon_tex.png",
             pos=Point2(0.0, 0.0), size=(16 * un),
             filtr=False, parent=self._hud_horizon_node)
-        self._hud_pitch_text = make_text(
-            width=0.5, pos=Point2(0.40, 0.0),
+        self._hud_pitch_text = make_digit_text(
+            numchars=4, width=0.5, pos=Point2(0.40, 0.0),
             font=self._hud_font, size=(0.85 * bfsz), color=self._hud_color,
             align="l", anchor="bl", parent=self._hud_horizon_node)
         self._hud_pitch_ptclim = radians(45)
@@ -1794,12 +1795,12 @@ class Cockpit (object):
         # Target altitude, speed, heading.
         self._hud_target_altspd_period = 0.89
         self._hud_wait_target_altspd = 0.0
-        self._hud_target_speed_text = make_text(
-            width=0.5, pos=Point2(-0.40, 0.82),
+        self._hud_target_speed_text = make_digit_text(
+            numchars=5, width=0.5, pos=Point2(-0.40, 0.82),
             font=self._hud_font, size=(0.85 * bfsz), color=self._hud_color,
             align="r", anchor="mr", parent=self._hud_attack_node)
-        self._hud_target_altitude_text = make_text(
-            width=0.5, pos=Point2(0.40, 0.82),
+        self._hud_target_altitude_text = make_digit_text(
+            numchars=6, width=0.5, pos=Point2(0.40, 0.82),
             font=self._hud_font, size=(0.85 * bfsz), color=self._hud_color,
             align="l", anchor="ml", parent=self._hud_attack_node)
         self._hud_target_relhdg_node = make_image(
@@ -1901,8 +1902,8 @@ class Cockpit (object):
             width=1.0, pos=Point2(0.0, -0.58),
             font=self._hud_font, size=(1.0 * bfsz), color=self._hud_color,
             align="c", anchor="tc", parent=self._hud_gun_node)
-        self._hud_gun_counter_text = make_text(
-            width=0.5, pos=Point2(0.0, -0.68),
+        self._hud_gun_counter_text = make_digit_text(
+            numchars=5, width=0.5, pos=Point2(0.0, -0.68),
             font=self._hud_font, size=(1.15 * bfsz), color=self._hud_color,
             align="c", anchor="tc", parent=self._hud_gun_node)
 
@@ -2052,16 +2053,16 @@ class Cockpit (object):
             self._hud_wait_altspd = self._hud_altspd_period
             #pspd = parent.dynstate.v
             pspd = parent.dynstate.vias
-            update_text(self._hud_speed_text,
-                        text=("%.0f" % (pspd * 3.6)))
+            update_digit_text(self._hud_speed_text,
+                              ("%.0f" % (pspd * 3.6)))
             palt = ppos[2]
-            update_text(self._hud_altitude_text,
-                        text=("%.0f" % (round(palt / 10) * 10)))
+            update_digit_text(self._hud_altitude_text,
+                              ("%.0f" % (round(palt / 10) * 10)))
             potralt = self.world.otr_altitude(ppos)
             if potralt < self._hud_radar_altitude_threshold:
                 self._hud_radar_altitude_text.show()
-                update_text(self._hud_radar_altitude_text,
-                            text=("%.0f" % potralt))
+                update_digit_text(self._hud_radar_altitude_text,
+                                  ("%.0f" % potralt))
             else:
                 self._hud_radar_altitude_text.hide()
 
@@ -2087,8 +2088,8 @@ class Cockpit (object):
             ptcm = clamp(ptc, -ptcmlim, ptcmlim)
             sz = -ptcm * self._hud_pitch_ptc2scr
             self._hud_horizon_node.setZ(sz)
-            update_text(self._hud_pitch_text,
-                        text=("% .0f" % degrees(ptc)))
+            update_digit_text(self._hud_pitch_text,
+                              ("% .0f" % degrees(ptc)))
 
         self._hud_wait_roll -= dt
         if self._hud_wait_roll <= 0.0:
@@ -2128,11 +2129,13 @@ class Cockpit (object):
                     ndalt = self._current_waypoint_dalt
                     val = self._hud_navbar_subnodes[self._current_waypoint_name]
                     namend, headnd, distnd, daltnd = val
-                    update_text(headnd, text=("%.0f" % to_navhead(nhead)))
-                    update_text(distnd, text=_rn("%.1f" % (ndist / 1000)))
+                    update_digit_text(headnd,
+                                      ("%.0f" % to_navhead(nhead)))
+                    update_digit_text(distnd,
+                                      _rn("%.1f" % (ndist / 1000)))
                     if daltnd is not None:
-                        update_text(daltnd,
-                                    text=("% .0f" % (round(ndalt / 10) * 10)))
+                        update_digit_text(daltnd,
+                                          ("% .0f" % (round(ndalt / 10) * 10)))
 
         else:
             self._hud_waypoint_node.hide()
@@ -2174,11 +2177,11 @@ class Cockpit (object):
                         tspd = target.dynstate.vias
                     else:
                         tspd = target.speed()
-                    update_text(self._hud_target_speed_text,
-                                text=("%.0f" % (tspd * 3.6)))
+                    update_digit_text(self._hud_target_speed_text,
+                                      ("%.0f" % (tspd * 3.6)))
                     talt = tpos[2]
-                    update_text(self._hud_target_altitude_text,
-                                text=("%.0f" % (round(talt / 10) * 10)))
+                    update_digit_text(self._hud_target_altitude_text,
+                                      ("%.0f" % (round(talt / 10) * 10)))
                     relthdg = thpr[0] - phpr[0]
                     sr = 180 - relthdg
                     self._hud_target_relhdg_node.setR(sr)
@@ -2298,8 +2301,8 @@ class Cockpit (object):
                     update_text(self._hud_gun_name_text,
                                 text=select_des(cannon.shortdes,
                                                 cannon.cpitdes, self._lang))
-                    update_text(self._hud_gun_counter_text,
-                                text=("%d" % cannon.ammo))
+                    update_digit_text(self._hud_gun_counter_text,
+                                      ("%d" % cannon.ammo))
 
                 self._hud_wait_gun_lead -= dt
                 if self._hud_wait_gun_lead <= 0.0:
@@ -2396,7 +2399,7 @@ class Cockpit (object):
         if warnlampnd.isEmpty():
             return False
 
-        self._instr_update_fs.append(self._update_warnrec)
+        self._instr_sched.add(self._update_warnrec)
         self._instr_cleanup_fs.append(self._cleanup_warnrec)
 
         self._warnrec_incoming_range = 8000.0 # keep equal to _imt_rocket_fardist?
@@ -2458,14 +2461,11 @@ class Cockpit (object):
             # Check for tracking missiles.
             if not self._warnrec_active:
                 trackers = []
-                for family in self._warnrec_tracker_families:
-                    for body in self.world.iter_bodies(family):
-                        if not body.alive:
-                            continue
-                        if (body.target is acp and
-                            body.dist(acp) < self._warnrec_incoming_range):
-                            trackers.append(body)
-                            break # need only yes/no
+                for body in self.world.targeting_bodies(
+                    acp, self._warnrec_tracker_families):
+                    if body.dist(acp) < self._warnrec_incoming_range:
+                        trackers.append(body)
+                        break # need only yes/no
                 if trackers:
                     self._warnrec_active = "incoming"
 
@@ -2533,7 +2533,7 @@ class Cockpit (object):
 
         if False:
             return False
-        self._instr_update_fs.append(self._update_power)
+        self._instr_sched.add(self._update_power)
         self._instr_cleanup_fs.append(self._cleanup_power)
 
         # Afterburner light.
@@ -2591,7 +2591,7 @@ class Cockpit (object):
 
         if False:
             return False
-        self._instr_update_fs.append(self._update_weapons)
+        self._instr_sched.add(self._update_weapons)
         self._instr_cleanup_fs.append(self._cleanup_weapons)
 
         # Gun counter.
@@ -2714,7 +2714,7 @@ class Cockpit (object):
 
         if False:
             return False
-        self._instr_update_fs.append(self._update_boresight)
+        self._instr_sched.add(self._update_boresight)
         self._instr_cleanup_fs.append(self._cleanup_boresight)
 
         self._boresight_on = False
@@ -2776,11 +2776,11 @@ class Cockpit (object):
 
             bodies_in_bore = []
             wp_against = selwp.against()
+            acpos = self.ac.pos()
             for family in self._boresight_target_families:
                 if family in wp_against:
-                    for body in self.world.iter_bodies(family):
-                        if not body.alive:
-                            continue
+                    for body in self.world.bodies_within(
+                        acpos, self._boresight_maxdist, family):
                         bdist = self.ac.dist(body)
                         boffb = self.ac.offbore(body)
                         if (bdist < self._boresight_maxdist and
@@ -2810,7 +2810,6 @@ class Cockpit (object):
         screennd = self._model.find("**/compass_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_compass)
         self._instr_cleanup_fs.append(self._cleanup_compass)
 
         screennd.setShaderInput(self._shdinp.ambln, self._amblnd_instr_bright)
@@ -2850,7 +2849,9 @@ class Cockpit (object):
         marker_node.setColor(rgba(255, 0, 0, 1))
 
         self._compass_update_period = 0.117
-        self._compass_wait_update = 0.0
+        self._instr_sched.add(self._update_compass,
+                              period=self._compass_update_period,
+                              inputf=lambda: round(self.ac.hpr()[0], 1))
 
         return True
 
@@ -2862,14 +2863,10 @@ class Cockpit (object):
 
     def _update_compass (self, dt):
 
-        self._compass_wait_update -= dt
-        if self._compass_wait_update <= 0.0:
-            self._compass_wait_update += self._compass_update_period
-
-            phpr = self.ac.hpr()
-            phdg = to_navhead(phpr[0])
-            offu = phdg / 360
-            self._compass_bar_node.setTexOffset(texstage_color, offu, 0.0)
+        phpr = self.ac.hpr()
+        phdg = to_navhead(phpr[0])
+        offu = phdg / 360
+        self._compass_bar_node.setTexOffset(texstage_color, offu, 0.0)
 
 
     def _init_fuelpanel (self):
@@ -2877,7 +2874,6 @@ class Cockpit (object):
         screennd = self._model.find("**/fuelpanel_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_fuelpanel)
         self._instr_cleanup_fs.append(self._cleanup_fuelpanel)
 
         glassnd = self._model.find("**/fuelpanel_glass")
@@ -2938,7 +2934,9 @@ class Cockpit (object):
         self._fuelpanel_bar2_fuel = bar2_fuel
 
         self._fuelpanel_update_period = 1.17
-        self._fuelpanel_wait_update = 0.0
+        self._instr_sched.add(self._update_fuelpanel,
+                              period=self._fuelpanel_update_period,
+                              inputf=lambda: round(self.ac.fuel))
 
         return True
 
@@ -2950,18 +2948,14 @@ class Cockpit (object):
 
     def _update_fuelpanel (self, dt):
 
-        self._fuelpanel_wait_update -= dt
-        if self._fuelpanel_wait_update <= 0.0:
-            self._fuelpanel_wait_update += self._fuelpanel_update_period
-
-            fuel = self.ac.fuel
+        fuel = self.ac.fuel
 
-            fuel1 = max(min(fuel, self._fuelpanel_bar1_fuel), 0.0)
-            sz1 = fuel1 / self._fuelpanel_bar1_fuel
-            self._fuelpanel_bar1_node.setSz(sz1)
+        fuel1 = max(min(fuel, self._fuelpanel_bar1_fuel), 0.0)
+        sz1 = fuel1 / self._fuelpanel_bar1_fuel
+        self._fuelpanel_bar1_node.setSz(sz1)
 
-            fuel2 = max(min(fuel - fuel1, self._fuelpanel_bar2_fuel), 0.0)
-            self._fuelpanel_bar2_node.setSz(fuel2 / self._fuelpanel_bar2_fuel)
+        fuel2 = max(min(fuel - fuel1, self._fuelpanel_bar2_fuel), 0.0)
+        self._fuelpanel_bar2_node.setSz(fuel2 / self._fuelpanel_bar2_fuel)
 
 
     def _init_tachometer (self):
@@ -2969,7 +2963,6 @@ class Cockpit (object):
         screennd = self._model.find("**/tachometer_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_tachometer)
         self._instr_cleanup_fs.append(self._cleanup_tachometer)
 
         glassnd = self._model.find("**/tachometer_glass")
@@ -3015,7 +3008,9 @@ class Cockpit (object):
         self._tachometer_hand_node = tachhandnd
 
         self._tachometer_update_period = 0.043
-        self._tachometer_wait_update = 0.0
+        self._instr_sched.add(self._update_tachometer,
+                              period=self._tachometer_update_period,
+                              inputf=lambda: round(self.ac.dynstate.tl, 3))
 
         return True
 
@@ -3027,21 +3022,17 @@ class Cockpit (object):
 
     def _update_tachometer (self, dt):
 
-        self._tachometer_wait_update -= dt
-        if self._tachometer_wait_update <= 0.0:
-            self._tachometer_wait_update += self._tachometer_update_period
-
-            pthr = self.ac.dynstate.tl
-            if pthr <= 1.0:
-                roll0 = self._tachometer_hand_roll0
-                roll1 = self._tachometer_hand_roll1
-                ifac = pthr
-            else:
-                roll0 = self._tachometer_hand_roll1
-                roll1 = self._tachometer_hand_roll1ab
-                ifac = (pthr - 1.0) / (2.0 - 1.0)
-            roll = roll0 + ifac * (roll1 - roll0)
-            self._tachometer_hand_node.setR(roll)
+        pthr = self.ac.dynstate.tl
+        if pthr <= 1.0:
+            roll0 = self._tachometer_hand_roll0
+            roll1 = self._tachometer_hand_roll1
+            ifac = pthr
+        else:
+            roll0 = self._tachometer_hand_roll1
+            roll1 = self._tachometer_hand_roll1ab
+            ifac = (pthr - 1.0) / (2.0 - 1.0)
+        roll = roll0 + ifac * (roll1 - roll0)
+        self._tachometer_hand_node.setR(roll)
 
 
     def _init_airclock (self):
@@ -3049,7 +3040,7 @@ class Cockpit (object):
         screennd = self._model.find("**/airclock_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_airclock)
+        self._instr_sched.add(self._update_airclock)
         self._instr_cleanup_fs.append(self._cleanup_airclock)
 
         glassnd = self._model.find("**/airclock_glass")
@@ -3157,7 +3148,6 @@ class Cockpit (object):
         screennd = self._model.find("**/radaraltimeter_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_radaraltimeter)
         self._instr_cleanup_fs.append(self._cleanup_radaraltimeter)
 
         glassnd = self._model.find("**/radaraltimeter_glass")
@@ -3214,7 +3204,8 @@ class Cockpit (object):
         self._radaraltimeter_hand_node = handnd
 
         self._radaraltimeter_update_period = 0.047
-        self._radaraltimeter_wait_update = 0.0
+        self._instr_sched.add(self._update_radaraltimeter,
+                              period=self._radaraltimeter_update_period)
 
         return True
 
@@ -3226,15 +3217,11 @@ class Cockpit (object):
 
     def _update_radaraltimeter (self, dt):
 
-        self._radaraltimeter_wait_update -= dt
-        if self._radaraltimeter_wait_update <= 0.0:
-            self._radaraltimeter_wait_update += self._radaraltimeter_update_period
-
-            ppos = self.ac.pos()
-            potralt = self.world.otr_altitude(ppos)
-            potralt1 = clamp(potralt, 0.0, self._radaraltimeter_scale_max)
-            hroll = self._radaraltimeter_hand_roll_table(potralt1)
-            self._radaraltimeter_hand_node.setR(hroll)
+        ppos = self.ac.pos()
+        potralt = self.world.otr_altitude(ppos)
+        potralt1 = clamp(potralt, 0.0, self._radaraltimeter_scale_max)
+        hroll = self._radaraltimeter_hand_roll_table(potralt1)
+        self._radaraltimeter_hand_node.setR(hroll)
 
 
     def _init_aoa (self):
@@ -3242,7 +3229,6 @@ class Cockpit (object):
         screennd = self._model.find("**/aoa_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_aoa)
         self._instr_cleanup_fs.append(self._cleanup_aoa)
 
         glassnd = self._model.find("**/aoa_glass")
@@ -3301,7 +3287,10 @@ class Cockpit (object):
         self._aoa_hand_lfac_node = lfachandnd
 
         self._aoa_update_period = 0.037
-        self._aoa_wait_update = 0.0
+        self._instr_sched.add(self._update_aoa,
+                              period=self._aoa_update_period,
+                              inputf=lambda: (round(self.ac.dynstate.a, 4),
+                                              round(self.ac.dynstate.n, 2)))
 
         return True
 
@@ -3313,19 +3302,15 @@ class Cockpit (object):
 
     def _update_aoa (self, dt):
 
-        self._aoa_wait_update -= dt
-        if self._aoa_wait_update <= 0.0:
-            self._aoa_wait_update += self._aoa_update_period
+        roll = intl01vr(self.ac.dynstate.a,
+                        self._aoa_hand_aoa_min, self._aoa_hand_aoa_max,
+                        self._aoa_hand_aoa_min_roll, self._aoa_hand_aoa_max_roll)
+        self._aoa_hand_aoa_node.setR(roll)
 
-            roll = intl01vr(self.ac.dynstate.a,
-                            self._aoa_hand_aoa_min, self._aoa_hand_aoa_max,
-                            self._aoa_hand_aoa_min_roll, self._aoa_hand_aoa_max_roll)
-            self._aoa_hand_aoa_node.setR(roll)
-
-            roll = intl01vr(self.ac.dynstate.n,
-                            self._aoa_hand_lfac_min, self._aoa_hand_lfac_max,
-                            self._aoa_hand_lfac_min_roll, self._aoa_hand_lfac_max_roll)
-            self._aoa_hand_lfac_node.setR(roll)
+        roll = intl01vr(self.ac.dynstate.n,
+                        self._aoa_hand_lfac_min, self._aoa_hand_lfac_max,
+                        self._aoa_hand_lfac_min_roll, self._aoa_hand_lfac_max_roll)
+        self._aoa_hand_lfac_node.setR(roll)
 
 
     def _init_machmeter (self):
@@ -3333,7 +3318,6 @@ class Cockpit (object):
         screennd = self._model.find("**/machmeter_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_machmeter)
         self._instr_cleanup_fs.append(self._cleanup_machmeter)
 
         glassnd = self._model.find("**/machmeter_glass")
@@ -3407,7 +3391,10 @@ class Cockpit (object):
         self._machmeter_hand_node = handnd
 
         self._machmeter_update_period = 0.153
-        self._machmeter_wait_update = 0.0
+        self._instr_sched.add(self._update_machmeter,
+                              period=self._machmeter_update_period,
+                              inputf=lambda: (round(self.ac.dynstate.vias, 1),
+                                              round(self.ac.dynstate.ma, 3)))
 
         return True
 
@@ -3419,43 +3406,39 @@ class Cockpit (object):
 
     def _update_machmeter (self, dt):
 
-        self._machmeter_wait_update -= dt
-        if self._machmeter_wait_update <= 0.0:
-            self._machmeter_wait_update += self._machmeter_update_period
-
-            pspd = self.ac.dynstate.vias
-            if pspd < self._machmeter_speed_min:
-                roll = self._machmeter_speed_min_roll
-            elif pspd < self._machmeter_speed_lin:
-                roll = intl01vr(pspd,
-                                self._machmeter_speed_min,
+        pspd = self.ac.dynstate.vias
+        if pspd < self._machmeter_speed_min:
+            roll = self._machmeter_speed_min_roll
+        elif pspd < self._machmeter_speed_lin:
+            roll = intl01vr(pspd,
+                            self._machmeter_speed_min,
+                            self._machmeter_speed_lin,
+                            self._machmeter_speed_min_roll,
+                            self._machmeter_speed_lin_roll)
+        elif pspd < self._machmeter_speed_max:
+            geom_exp = intl01vr(pspd,
                                 self._machmeter_speed_lin,
-                                self._machmeter_speed_min_roll,
-                                self._machmeter_speed_lin_roll)
-            elif pspd < self._machmeter_speed_max:
-                geom_exp = intl01vr(pspd,
-                                    self._machmeter_speed_lin,
-                                    self._machmeter_speed_max,
-                                    0.0,
-                                    self._machmeter_speed_max_geom_exp)
-                geom_mul = self._machmeter_speed_geom_mul
-                droll1 = self._machmeter_speed_geom_droll
-                droll = droll1 * (1.0 - geom_mul ** geom_exp) / (1.0 - geom_mul)
-                roll = self._machmeter_speed_lin_roll + droll
-            else:
-                roll = self._machmeter_speed_max_roll
-            self._machmeter_hand_node.setR(roll)
-            hand_roll = roll
+                                self._machmeter_speed_max,
+                                0.0,
+                                self._machmeter_speed_max_geom_exp)
+            geom_mul = self._machmeter_speed_geom_mul
+            droll1 = self._machmeter_speed_geom_droll
+            droll = droll1 * (1.0 - geom_mul ** geom_exp) / (1.0 - geom_mul)
+            roll = self._machmeter_speed_lin_roll + droll
+        else:
+            roll = self._machmeter_speed_max_roll
+        self._machmeter_hand_node.setR(roll)
+        hand_roll = roll
 
-            pmach = self.ac.dynstate.ma
-            roll = intl01vr(pmach,
-                            self._machmeter_mach_min,
-                            self._machmeter_mach_max,
-                            self._machmeter_mach_min_roll,
-                            self._machmeter_mach_max_roll)
-            droll = roll - self._machmeter_mach_min_roll
-            self._machmeter_mach_cover_node.setR(hand_roll)
-            self._machmeter_mach_scale_node.setR(hand_roll - droll)
+        pmach = self.ac.dynstate.ma
+        roll = intl01vr(pmach,
+                        self._machmeter_mach_min,
+                        self._machmeter_mach_max,
+                        self._machmeter_mach_min_roll,
+                        self._machmeter_mach_max_roll)
+        droll = roll - self._machmeter_mach_min_roll
+        self._machmeter_mach_cover_node.setR(hand_roll)
+        self._machmeter_mach_scale_node.setR(hand_roll - droll)
 
 
     def _init_adi (self):
@@ -3463,7 +3446,6 @@ class Cockpit (object):
         screennd = self._model.find("**/adi_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_adi)
         self._instr_cleanup_fs.append(self._cleanup_adi)
 
         glassnd = self._model.find("**/adi_glass")
@@ -3534,7 +3516,10 @@ class Cockpit (object):
         self._adi_bank_pointer = bpointnd
 
         self._adi_update_period = 0.049
-        self._adi_wait_update = 0.0
+        self._instr_sched.add(self._update_adi,
+                              period=self._adi_update_period,
+                              inputf=lambda: (round(self.ac.dynstate.pch, 4),
+                                              round(self.ac.dynstate.bnk, 4)))
 
         return True
 
@@ -3546,16 +3531,12 @@ class Cockpit (object):
 
     def _update_adi (self, dt):
 
-        self._adi_wait_update -= dt
-        if self._adi_wait_update <= 0.0:
-            self._adi_wait_update += self._adi_update_period
-
-            ppch = self.ac.dynstate.pch
-            offv = ppch / pi
-            self._adi_bar_node.setTexOffset(texstage_color, 0.0, offv)
+        ppch = self.ac.dynstate.pch
+        offv = ppch / pi
+        self._adi_bar_node.setTexOffset(texstage_color, 0.0, offv)
 
-            pbnk = self.ac.dynstate.bnk
-            self._adi_bank_pointer.setR(degrees(pbnk))
+        pbnk = self.ac.dynstate.bnk
+        self._adi_bank_pointer.setR(degrees(pbnk))
 
 
     def _init_vvi (self):
@@ -3563,7 +3544,6 @@ class Cockpit (object):
         screennd = self._model.find("**/vvi_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_vvi)
         self._instr_cleanup_fs.append(self._cleanup_vvi)
 
         glassnd = self._model.find("**/vvi_glass")
@@ -3636,7 +3616,10 @@ class Cockpit (object):
         self._vvi_climb_max_roll = +(4 * 17.0 + 12.0 + 3 * 20.0)
 
         self._vvi_update_period = 0.039
-        self._vvi_wait_update = 0.0
+        self._instr_sched.add(self._update_vvi,
+                              period=self._vvi_update_period,
+                              inputf=lambda: (round(self.ac.dynstate.cr, 1),
+                                              round(self.ac.dynstate.tr, 4)))
 
         return True
 
@@ -3648,30 +3631,26 @@ class Cockpit (object):
 
     def _update_vvi (self, dt):
 
-        self._vvi_wait_update -= dt
-        if self._vvi_wait_update <= 0.0:
-            self._vvi_wait_update += self._vvi_update_period
-
-            crate = self.ac.dynstate.cr
-            if crate < self._vvi_climb_min:
-                croll = self._vvi_climb_min_roll
-            elif crate < self._vvi_climb_neg:
-                croll = intl01vr(crate, self._vvi_climb_min, self._vvi_climb_neg,
-                                 self._vvi_climb_min_roll, self._vvi_climb_neg_roll)
-            elif crate < self._vvi_climb_pos:
-                croll = intl01vr(crate, self._vvi_climb_neg, self._vvi_climb_pos,
-                                 self._vvi_climb_neg_roll, self._vvi_climb_pos_roll)
-            elif crate < self._vvi_climb_max:
-                croll = intl01vr(crate, self._vvi_climb_pos, self._vvi_climb_max,
-                                 self._vvi_climb_pos_roll, self._vvi_climb_max_roll)
-            else:
-                croll = self._vvi_climb_max_roll
-            self._vvi_climb_hand_node.setR(croll)
+        crate = self.ac.dynstate.cr
+        if crate < self._vvi_climb_min:
+            croll = self._vvi_climb_min_roll
+        elif crate < self._vvi_climb_neg:
+            croll = intl01vr(crate, self._vvi_climb_min, self._vvi_climb_neg,
+                             self._vvi_climb_min_roll, self._vvi_climb_neg_roll)
+        elif crate < self._vvi_climb_pos:
+            croll = intl01vr(crate, self._vvi_climb_neg, self._vvi_climb_pos,
+                             self._vvi_climb_neg_roll, self._vvi_climb_pos_roll)
+        elif crate < self._vvi_climb_max:
+            croll = intl01vr(crate, self._vvi_climb_pos, self._vvi_climb_max,
+                             self._vvi_climb_pos_roll, self._vvi_climb_max_roll)
+        else:
+            croll = self._vvi_climb_max_roll
+        self._vvi_climb_hand_node.setR(croll)
 
-            trate = self.ac.dynstate.tr
-            troll = intl01vr(trate, self._vvi_turn_min, self._vvi_turn_max,
-                             self._vvi_turn_min_roll, self._vvi_turn_max_roll)
-            self._vvi_turn_hand_node.setR(troll)
+        trate = self.ac.dynstate.tr
+        troll = intl01vr(trate, self._vvi_turn_min, self._vvi_turn_max,
+                         self._vvi_turn_min_roll, self._vvi_turn_max_roll)
+        self._vvi_turn_hand_node.setR(troll)
 
 
     def _init_bpa (self):
@@ -3679,7 +3658,6 @@ class Cockpit (object):
         screennd = self._model.find("**/bpa_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_bpa)
         self._instr_cleanup_fs.append(self._cleanup_bpa)
 
         glassnd = self._model.find("**/bpa_glass")
@@ -3731,7 +3709,9 @@ class Cockpit (object):
         self._bpa_hand_inner_node = ihandnd
 
         self._bpa_update_period = 0.059
-        self._bpa_wait_update = 0.0
+        self._instr_sched.add(self._update_bpa,
+                              period=self._bpa_update_period,
+                              inputf=lambda: round(self.ac.dynstate.h))
 
         return True
 
@@ -3743,16 +3723,12 @@ class Cockpit (object):
 
     def _update_bpa (self, dt):
 
-        self._bpa_wait_update -= dt
-        if self._bpa_wait_update <= 0.0:
-            self._bpa_wait_update += self._bpa_update_period
-
-            alt = self.ac.dynstate.h
-            alt1 = clamp(alt, 0.0, self._bpa_alt_max)
-            oroll = (alt1 / 1000.0 - int(alt1 / 1000.0)) * 360.0
-            self._bpa_hand_outer_node.setR(oroll)
-            iroll = (alt1 / self._bpa_alt_max) * 360.0
-            self._bpa_hand_inner_node.setR(iroll)
+        alt = self.ac.dynstate.h
+        alt1 = clamp(alt, 0.0, self._bpa_alt_max)
+        oroll = (alt1 / 1000.0 - int(alt1 / 1000.0)) * 360.0
+        self._bpa_hand_outer_node.setR(oroll)
+        iroll = (alt1 / self._bpa_alt_max) * 360.0
+        self._bpa_hand_inner_node.setR(iroll)
 
 
     _mfd_tvdisp_buffer = None
@@ -3763,7 +3739,7 @@ class Cockpit (object):
         screennd = self._model.find("**/tvpanel_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_mfd)
+        self._instr_sched.add(self._update_mfd)
         self._instr_cleanup_fs.append(self._cleanup_mfd)
 
         glassnd = self._model.find("**/tvpanel_glass")
@@ -3973,8 +3949,8 @@ class Cockpit (object):
                 "images/cockpit/cockpit_mig29_mfd_tvdisp_reticle_locked_tex.png",
                 pos=Point3(0.0, 0.0, 0.0), size=(8 * un),
                 filtr=False, parent=self._mfd_tvdisp_overlay_node)
-            self._mfd_tvdisp_target_dist_text = make_text(
-                width=0.5, pos=Point3(0.0, 0.0, -4.5 * un),
+            self._mfd_tvdisp_target_dist_text = make_digit_text(
+                numchars=6, width=0.5, pos=Point3(0.0, 0.0, -4.5 * un),
                 font=self._mfd_font, size=tvdisp_font_size,
                 color=tvdisp_font_color, align="c", anchor="tc",
                 parent=self._mfd_tvdisp_overlay_node)
@@ -4445,8 +4421,8 @@ void main ()
                     tdist = target.dist(self.ac, offset=toff)
                 else:
                     tdist = 0.0
-                update_text(self._mfd_tvdisp_target_dist_text,
-                            text=_rn("%.1f" % (tdist / 1000)))
+                update_digit_text(self._mfd_tvdisp_target_dist_text,
+                                  _rn("%.1f" % (tdist / 1000)))
 
             elif mfd_mode == "targid":
                 target = self.player.target_body
@@ -4651,7 +4627,7 @@ void main ()
 
         if False:
             return False
-        self._instr_update_fs.append(self._update_countermeasures)
+        self._instr_sched.add(self._update_countermeasures)
         self._instr_cleanup_fs.append(self._cleanup_countermeasures)
 
         # Flare-chaff counter.
@@ -4711,7 +4687,7 @@ void main ()
         screennd = self._model.find("**/rwr_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_rwr)
+        self._instr_sched.add(self._update_rwr)
         self._instr_cleanup_fs.append(self._cleanup_rwr)
 
         glassnd = self._model.find("**/rwr_glass")
@@ -4780,7 +4756,7 @@ void main ()
         screennd = self._model.find("**/imt_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_imt)
+        self._instr_sched.add(self._update_imt)
         self._instr_cleanup_fs.append(self._cleanup_imt)
 
         glassnd = self._model.find("**/imt_glass")
@@ -4909,15 +4885,13 @@ void main ()
             self._imt_wait_update += self._imt_update_period
 
             trackers = set()
-            for family in self._imt_tracker_families:
-                for body in self.world.iter_bodies(family):
-                    if not body.alive:
-                        continue
-                    if body.target is acp and body.sensorpack:
-                        contact = body.sensorpack.contacts_by_body().get(acp)
-                        if (contact and
-                            "radar" in body.sensorpack.sensors_by_contact().get(contact)):
-                            trackers.add(body)
+            for body in self.world.targeting_bodies(
+                acp, self._imt_tracker_families):
+                if body.sensorpack:
+                    contact = body.sensorpack.contacts_by_body().get(acp)
+                    if (contact and
+                        "radar" in body.sensorpack.sensors_by_contact().get(contact)):
+                        trackers.add(body)
             #print "--imt-trackers", trackers
 
             lock_sect_inds = set()
@@ -4936,9 +4910,8 @@ void main ()
             self._imt_lock_sectors_active = lock_sect_inds
 
             rockets = set()
-            for body in self.world.iter_bodies("rocket"):
-                if not body.alive:
-                    continue
+            for body in self.world.bodies_within(
+                acp.pos(), self._imt_rocket_fardist, "rocket"):
                 if body.dist(acp) < self._imt_rocket_fardist:
                     rockets.add(body)
             #print "--imt-rockets", rockets
@@ -5037,7 +5010,7 @@ void main ()
         screennd = self._model.find("**/mdi_screen")
         if screennd.isEmpty():
             return False
-        self._instr_update_fs.append(self._update_mdi)
+        self._instr_sched.add(self._update_mdi)
         self._instr_cleanup_fs.append(self._cleanup_mdi)
 
         glassnd = self._model.find("**/mdi_glass")
@@ -5175,15 +5148,15 @@ void main ()
                 color=self._hud_color,
                 align="r", anchor="tl", parent=navbarnd)
             # Heading to waypoint.
-            headnd = make_text(
-                width=0.5,
+            headnd = make_digit_text(
+                numchars=3, width=0.5,
                 pos=Point3(0.0, 0.0, -0.12),
                 font=self._hud_font, size=(0.85 * bfsz),
                 color=self._hud_color,
                 align="r", anchor="tl", parent=navbarnd)
             # Distance to waypoint.
-            distnd = make_text(
-                width=0.5,
+            distnd = make_digit_text(
+                numchars=7, width=0.5,
                 pos=Point3(0.0, 0.0, -0.22),
                 font=self._hud_font, size=(0.85 * bfsz),
                 color=self._hud_color,
@@ -5191,8 +5164,8 @@ void main ()
             # Altitude difference to waypoint.
             daltnd = None
             if height is None or height >= 0.0:
-                daltnd = make_text(
-                    width=0.5,
+                daltnd = make_digit_text(
+                    numchars=7, width=0.5,
                     pos=Point3(0.0, 0.0, -0.32),
                     font=self._hud_font, size=(0.85 * bfsz),
                     color=self._hud_color,
@@ -5471,8 +5444,8 @@ class VirtualCockpit (object):
             "images/cockpit/cockpit_mig29_hud_horizon_tex.png",
             pos=Point2(0.0, 0.0), size=(16 * un),
             filtr=False, parent=self._attitude_horizon_node)
-        self._attitude_pitch_text = make_text(
-            width=0.5, pos=Point2(0.40, 0.0),
+        self._attitude_pitch_text = make_digit_text(
+            numchars=4, width=0.5, pos=Point2(0.40, 0.0),
             font=self._attitude_font, size=(0.85 * bfsz),
             color=self._attitude_color,
             align="l", anchor="bl", parent=self._attitude_horizon_node,
@@ -5512,8 +5485,8 @@ class VirtualCockpit (object):
             ptcm = clamp(ptc, -ptcmlim, ptcmlim)
             sz = -ptcm * self._attitude_pitch_ptc2scr
             self._attitude_horizon_node.setZ(sz)
-            update_text(self._attitude_pitch_text,
-                        text=("% .0f" % degrees(ptc)))
+            update_digit_text(self._attitude_pitch_text,
+                              ("% .0f" % degrees(ptc)))
 
         self._attitude_wait_roll -= dt
         if self._attitude_wait_roll <= 0.0:
@@ -5522,6 +5495,71 @@ class VirtualCockpit (object):
             self._attitude_roll_attitude_node.setR(degrees(sroll))
 
 
+class InstrumentScheduler (object):
+    """
+    Updater of cockpit instruments.
+
+    Each instrument is added with its update period, and optionally
+    a function returning its (suitably rounded) input quantities,
+    in which case it is updated only when these have changed.
+    The update function is given the time since its previous update.
+    Initial waits are spread over update periods, so that instruments
+    with equal periods tend to be updated in different frames.
+    Number of updates and time spent per instrument are reported
+    periodically as debug output.
+    """
+
+    _report_period = 10.0
+
+    def __init__ (self, name):
+
+        self.name = name
+
+        self._instrs = []
+        self._wait_report = self._report_period
+
+
+    def add (self, updf, period=0.0, inputf=None):
+
+        # Golden ratio fractions, to spread any number of instruments.
+        phase = (len(self._instrs) * 0.618034) % 1.0
+        instr = SimpleProps(updf=updf, period=period, inputf=inputf,
+                            wait=(period * phase), elapsed=0.0,
+                            input=None, numupd=0, cost=0.0)
+        self._instrs.append(instr)
+
+
+    def update (self, dt):
+
+        for instr in self._instrs:
+            instr.elapsed += dt
+            instr.wait -= dt
+            if instr.wait > 0.0:
+                continue
+            instr.wait = max(instr.wait + instr.period, 0.0)
+            if instr.inputf is not None:
+                inp = instr.inputf()
+                if inp == instr.input:
+                    continue
+                instr.input = inp
+            t0 = time()
+            instr.updf(instr.elapsed)
+            instr.cost += time() - t0
+            instr.numupd += 1
+            instr.elapsed = 0.0
+
+        self._wait_report -= dt
+        if self._wait_report <= 0.0:
+            self._wait_report = self._report_period
+            for instr in self._instrs:
+                dbgval(2, "%s-instrument" % self.name,
+                       (instr.updf.__name__, "%s", "func"),
+                       (instr.numupd, "%d", "numupd"),
+                       (instr.cost * 1e3, "%.2f", "cost", "ms"))
+                instr.numupd = 0
+                instr.cost = 0.0
+
+
 class TexsceneManager (object):
 
     _have_panda = True
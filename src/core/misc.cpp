@@ -713,3 +713,21 @@ std::vector<std::string> dec_lst_string (ENC_LST_STRING enc_lst)
     return lst;
 }
 
+#include <cstring>
+std::vector<double> dec_lst_double (ENC_LST_DOUBLE enc_lst)
+{
+    std::vector<double> lst(enc_lst.size() / sizeof(double));
+    if (!lst.empty()) {
+        std::memcpy(&lst[0], enc_lst.data(), lst.size() * sizeof(double));
+    }
+    return lst;
+}
+
+std::string enc_lst_double (const std::vector<double> &lst)
+{
+    if (lst.empty()) {
+        return std::string();
+    }
+    return std::string(reinterpret_cast<const char*>(&lst[0]),
+                       lst.size() * sizeof(double));
+}
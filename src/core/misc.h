@@ -341,4 +341,10 @@ std::vector<bool> EXPORT dec_lst_bool (ENC_LST_BOOL enc_lst);
 typedef const std::string & ENC_LST_STRING;
 std::vector<std::string> EXPORT dec_lst_string (ENC_LST_STRING enc_lst);
 
+#include <vector>
+#include <string>
+typedef const std::string & ENC_LST_DOUBLE;
+std::vector<double> EXPORT dec_lst_double (ENC_LST_DOUBLE enc_lst);
+std::string EXPORT enc_lst_double (const std::vector<double> &lst);
+
 #endif
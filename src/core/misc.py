@@ -1,5 +1,7 @@
 # -*- coding: UTF-8 -*-
 
+from array import array
+import atexit
 from collections import deque
 import cPickle as pickle
 from hashlib import md5
@@ -16,7 +18,7 @@ from direct.particles.Particles import Particles
 from pandac.PandaModules import VBase2, VBase2D, VBase3, VBase3D, VBase4, VBase4D
 from pandac.PandaModules import Vec3, Vec3D, Vec4, Point3, Point3D
 from pandac.PandaModules import Quat, QuatD
-from pandac.PandaModules import NodePath, TextNode, LODNode
+from pandac.PandaModules import NodePath, TextNode, LODNode, SwitchNode
 from pandac.PandaModules import InternalName, GeomVertexData, GeomVertexWriter
 from pandac.PandaModules import GeomVertexArrayFormat, GeomVertexFormat
 from pandac.PandaModules import Geom, GeomNode, GeomTriangles
@@ -494,19 +496,8 @@ def make_text (text="", width=1.0, pos=Point3(), font=None, size=10,
     - text node (NodePath)
     """
 
-    if not font:
-        font = ui_font_path
-    if isinstance(font, basestring):
-        if olcolor is not None and olcolor != _black_text:
-            fgcolor = color
-            color = None
-        else:
-            fgcolor = None
-        font = base.load_font(category="data", font_path=font,
-                              pixels_per_unit=ppunit,
-                              line_height=lheight, fg_color=fgcolor,
-                              outline_color=olcolor, outline_width=olwidth,
-                              outline_feather=olfeather)
+    font, color = _load_text_font(font, ppunit, lheight, color,
+                                  olcolor, olwidth, olfeather)
 
     if not parent:
         parent = NodePath("text")
@@ -552,6 +543,25 @@ def make_text (text="", width=1.0, pos=Point3(), font=None, size=10,
     return ndpath
 
 
+def _load_text_font (font, ppunit, lheight, color,
+                     olcolor, olwidth, olfeather):
+
+    if not font:
+        font = ui_font_path
+    if isinstance(font, basestring):
+        if olcolor is not None and olcolor != _black_text:
+            fgcolor = color
+            color = None
+        else:
+            fgcolor = None
+        font = base.load_font(category="data", font_path=font,
+                              pixels_per_unit=ppunit,
+                              line_height=lheight, fg_color=fgcolor,
+                              outline_color=olcolor, outline_width=olwidth,
+                              outline_feather=olfeather)
+    return font, color
+
+
 def _set_text_node (nd, ndpath,
                     text, width, size, color, shcolor, align, anchor, wrap,
                     height, heightbase):
@@ -590,6 +600,25 @@ def _set_text_node (nd, ndpath,
                 etext = etext.rstrip() + elipsis
                 nd.setText(etext.encode(UI_TEXT_ENC))
 
+    posx, posz = _text_anchor_offset(width, height, heightbase, align, anchor)
+
+    if color is not None:
+        nd.setTextColor(*color)
+
+    if shcolor is not None:
+        nd.setShadow(0.1, 0.1)
+        nd.setShadowColor(*shcolor)
+    else:
+        nd.clearShadow()
+
+    ndpath.setPos(posx, 0.0, posz)
+    ndpath.setScale(scale)
+
+    return height, heightbase
+
+
+def _text_anchor_offset (width, height, heightbase, align, anchor):
+
     if "l" in anchor:
         if "c" in align:
             posx = 0.5 * width
@@ -620,19 +649,7 @@ def _set_text_node (nd, ndpath,
         posz = 0.5 * height
     posz -= heightbase
 
-    if color is not None:
-        nd.setTextColor(*color)
-
-    if shcolor is not None:
-        nd.setShadow(0.1, 0.1)
-        nd.setShadowColor(*shcolor)
-    else:
-        nd.clearShadow()
-
-    ndpath.setPos(posx, 0.0, posz)
-    ndpath.setScale(scale)
-
-    return height, heightbase
+    return posx, posz
 
 
 def update_text (textnd, text=None, color=None, shcolor=None):
@@ -679,6 +696,142 @@ def update_text (textnd, text=None, color=None, shcolor=None):
     textnd.setPythonTag("heightbase", heightbase)
 
 
+_digit_text_chars = u"0123456789.,-+ "
+
+def make_digit_text (text="", numchars=8, width=1.0, pos=Point3(),
+                     font=None, size=10, ppunit=30, lheight=None,
+                     color=(1.0, 1.0, 1.0, 1.0), shcolor=None,
+                     olcolor=None, olwidth=1.0, olfeather=0.0,
+                     align="l", anchor="mc", chars=_digit_text_chars,
+                     shader=None, parent=None):
+    """
+    Show a short piece of numeric 2D text on the screen,
+    to be updated often.
+
+    The geometry of each character from the given set is generated
+    once, and each character slot of the text holds an instance of
+    all of them, switching which one is visible. Updating the text
+    by update_digit_text then only switches and moves slots,
+    without generating any new geometry.
+    The text is always on one line, and is not wrapped or elided.
+
+    Parameters are as in make_text, with additionally:
+    - numchars (int): maximum number of characters in the text.
+    - chars (string): all characters that can appear in the text.
+    Returns:
+    - text node (NodePath)
+    """
+
+    font, color = _load_text_font(font, ppunit, lheight, color,
+                                  olcolor, olwidth, olfeather)
+
+    if not parent:
+        parent = NodePath("text")
+
+    ndpath = parent.attachNewNode("digit-text-node-parent")
+    if isinstance(pos, VBase2):
+        pos = Point3(pos[0], 0.0, pos[1])
+    ndpath.setPos(pos)
+
+    scale = font_scale_for_ptsize(size)
+    mnd = TextNode("digit-text-measure")
+    mnd.setFont(font)
+    mnd.setText("bq") # for full height above and below baseline
+    heightbase = mnd.getHeight() * scale * 0.75
+    mnd.setText("0")
+    height = mnd.getHeight() * scale
+    width0 = mnd.getWidth()
+    posx, posz = _text_anchor_offset(width, height, heightbase, align, anchor)
+    subndpath = ndpath.attachNewNode("digit-text-node")
+    subndpath.setPos(posx, 0.0, posz)
+    subndpath.setScale(scale)
+    if shader is not None:
+        subndpath.setShader(shader)
+
+    gnd = TextNode("digit-text-glyph")
+    gnd.setFont(font)
+    gnd.setAlign(TextNode.ALeft)
+    if color is not None:
+        gnd.setTextColor(*color)
+    if shcolor is not None:
+        gnd.setShadow(0.1, 0.1)
+        gnd.setShadowColor(*shcolor)
+    glyphs = []
+    charinds = {}
+    charadvs = {}
+    for i, c in enumerate(chars):
+        cenc = c.encode(UI_TEXT_ENC)
+        gnd.setText(cenc)
+        glyphs.append(NodePath(gnd.generate()))
+        charinds[c] = i
+        mnd.setText(cenc + "0")
+        charadvs[c] = mnd.getWidth() - width0
+
+    slots = []
+    for j in range(numchars):
+        swnd = SwitchNode("digit-text-slot")
+        slotnd = subndpath.attachNewNode(swnd)
+        for glyph in glyphs:
+            glyph.instanceTo(slotnd)
+        swnd.setVisibleChild(len(glyphs)) # none visible
+        slots.append((slotnd, swnd))
+
+    ndpath.setPythonTag("slots", slots)
+    ndpath.setPythonTag("charinds", charinds)
+    ndpath.setPythonTag("charadvs", charadvs)
+    ndpath.setPythonTag("nochar", len(glyphs))
+    ndpath.setPythonTag("align", align)
+    ndpath.setPythonTag("text", None)
+    update_digit_text(ndpath, text)
+
+    return ndpath
+
+
+def update_digit_text (textnd, text):
+    """
+    Update numeric UI text object.
+
+    Characters not in the set given to make_digit_text are left blank,
+    and so is the whole text if it is longer than the number of slots.
+
+    Parameters:
+    - textnd (NodePath): the text node created by make_digit_text
+    - text (string): the new text
+    """
+
+    if text == textnd.getPythonTag("text"):
+        return
+    textnd.setPythonTag("text", text)
+
+    slots = textnd.getPythonTag("slots")
+    charinds = textnd.getPythonTag("charinds")
+    charadvs = textnd.getPythonTag("charadvs")
+    nochar = textnd.getPythonTag("nochar")
+    align = textnd.getPythonTag("align")
+
+    # Text which cannot be shown (e.g. formatted NaN) leaves
+    # blank slots, such that a bad value cannot break the display.
+    if len(text) > len(slots):
+        text = ""
+    blankadv = charadvs.get(" ", 0.0)
+    advs = [charadvs.get(c, blankadv) for c in text]
+
+    twidth = sum(advs)
+    if "c" in align:
+        posx = -0.5 * twidth
+    elif "r" in align:
+        posx = -twidth
+    else: # "l" in align
+        posx = 0.0
+    for j, (slotnd, swnd) in enumerate(slots):
+        if j < len(text):
+            swnd.setVisibleChild(charinds.get(text[j], nochar))
+            slotnd.setX(posx)
+            posx += advs[j]
+        else:
+            swnd.setVisibleChild(nochar)
+
+
 def node_unfold_text (textnd, wpmspeed=150, time=None):
 
     text = textnd.getPythonTag("text")
@@ -2058,7 +2211,7 @@ def get_pointer (imgpath, size=0.1, offset=Point3(), pos=None):
     pnode.reparentTo(base.square_root)
     base.mouse_watcher.node().setGeometry(pnode.node())
 
-    if pos is not None:
+    if pos is not None and not base.headless:
         hw = base.aspect_ratio
         sx = int(base.window.getXSize() * (1.0 - (hw - pos[0]) / (hw * 2)))
         sy = int(base.window.getYSize() * ((1.0 - pos[2]) / (1.0 * 2)))
@@ -3316,10 +3469,99 @@ def get_cache_key_section (filepath, segmark):
     return "".join(cklines)
 
 
+_file_hash_manifest = None
+_file_hash_manifest_updates = {}
+_file_hash_manifest_path = "filehash.pkl"
+
+def _load_file_hash_manifest ():
+
+    global _file_hash_manifest
+    if _file_hash_manifest is not None:
+        return
+
+    _file_hash_manifest = {}
+    if path_exists("cache", _file_hash_manifest_path):
+        try:
+            fh = open(real_path("cache", _file_hash_manifest_path), "rb")
+            _file_hash_manifest = pickle.load(fh)
+            fh.close()
+        except Exception:
+            warning("Cannot read file hash manifest, ignoring it.")
+    atexit.register(save_file_hash_manifest)
+
+
+def file_hash_hex (category, path):
+    """
+    Content hash of the file with the given path.
+
+    Content hashes are kept in a persistent manifest, together with
+    the file size, modification time and inode at the moment of hashing.
+    The file is read and hashed only if it is not in the manifest,
+    or if any of these has changed since.
+    """
+
+    _load_file_hash_manifest()
+
+    rpath = real_path(category, path)
+    st = os.stat(rpath)
+    fprint = (st.st_size, st.st_mtime, st.st_ino)
+    entry = _file_hash_manifest.get(rpath)
+    if entry is not None and entry[0] == fprint:
+        return entry[1]
+
+    fh = open(rpath, "rb")
+    hx = md5(fh.read()).hexdigest()
+    fh.close()
+    entry = (fprint, hx)
+    _file_hash_manifest[rpath] = entry
+    _file_hash_manifest_updates[rpath] = entry
+    return hx
+
+
+def save_file_hash_manifest ():
+    """
+    Write any updated content hashes into the persistent manifest.
+
+    The manifest on disk is merged with updates, since other
+    processes may have updated it in the meantime.
+    """
+
+    if not _file_hash_manifest_updates:
+        return
+
+    manifest = {}
+    if path_exists("cache", _file_hash_manifest_path):
+        try:
+            fh = open(real_path("cache", _file_hash_manifest_path), "rb")
+            manifest = pickle.load(fh)
+            fh.close()
+        except Exception:
+            pass
+    manifest.update(_file_hash_manifest_updates)
+
+    # Write to temporary file and rename, so that readers
+    # never see a partially written manifest.
+    rpath = real_path("cache", _file_hash_manifest_path)
+    rdir = os.path.dirname(rpath)
+    if not os.path.isdir(rdir):
+        os.makedirs(rdir)
+    tmprpath = "%s.%d.tmp" % (rpath, os.getpid())
+    fh = open(tmprpath, "wb")
+    pickle.dump(manifest, fh, -1)
+    fh.close()
+    try:
+        os.rename(tmprpath, rpath)
+    except OSError:
+        # Windows does not replace existing files on rename.
+        os.remove(rpath)
+        os.rename(tmprpath, rpath)
+    _file_hash_manifest_updates.clear()
+
+
 def key_to_hex (key, fckey=None):
 
     return md5("".join(map(repr, key)) +
-               "".join(open(real_path("data", f), "rb").read()
+               "".join(file_hash_hex("data", f)
                        for f in sorted(fckey or []))).hexdigest()
 
 
@@ -3472,6 +3714,18 @@ def have_segment_intersect (a1, a2, b1, b2):
             not _on_same_side(b1, b2, a1, a2))
 
 
+# Distance of point c to segment (p0, p1).
+def segment_point_dist (p0, p1, c):
+
+    d = p1 - p0
+    dd = d.lengthSquared()
+    if dd > 0.0:
+        t = min(max((c - p0).dot(d) / dd, 0.0), 1.0)
+    else:
+        t = 0.0
+    return (p0 + d * t - c).length()
+
+
 # Check if 2D point a is inside 2D polygon p.
 def is_inside_poly (p, a):
 
@@ -3955,6 +4209,14 @@ def dec_lst_string (enc_lst):
     else:
         return []
 
+def enc_lst_double (lst):
+    enc_lst = array("d", lst).tostring()
+    return enc_lst
+def dec_lst_double (enc_lst):
+    lst = array("d")
+    lst.fromstring(enc_lst)
+    return lst
+
 
 if USE_COMPILED:
     from misc_c import *
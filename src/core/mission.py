@@ -8,6 +8,7 @@ from pandac.PandaModules import ClockObject
 from src.core import join_path, path_exists, real_path
 from src.core.misc import AutoProps, as_sequence
 from src.core.misc import report
+from src.core.shader import precompile_shaders, record_shader_variants
 from src.core.transl import *
 from src.core.interface import MISSION_ESCBUTTON
 
@@ -28,6 +29,8 @@ class Mission (object):
         self._zone_exitfs = {}
         self._zone_loopfs = {}
         self._zone_coords = {}
+        self._zone_prefetchfs = {}
+        self._zone_prefetches = {}
 
         self._zone_enterfs_base = {}
         self._zone_exitfs_base = {}
@@ -42,8 +45,10 @@ class Mission (object):
         self.zone_switch_pause = 2.0
 
         self._mission_stage = "iload0"
+        self._switch_prefetched = False
 
         self._loading_info = None
+        self._loading_info_note = ""
 
         self.context = self._mission_context
 
@@ -97,8 +102,13 @@ class Mission (object):
                 self._mission_stage = "zexit0"
 
         if self._mission_stage == "zloop0":
-            # Wait one frame per core to load stuff from cache.
-            if self._switch_dframe < base.gameconf.cpu.use_cores:
+            # Wait one frame per core to load stuff from cache,
+            # unless models have already been loaded in background.
+            # Textures alone are not enough, geometry may still be
+            # constructed or read from cache on first frames.
+            if self._switch_prefetched:
+                self._mission_stage = "zloop"
+            elif self._switch_dframe < base.gameconf.cpu.use_cores:
                 self._switch_dframe += 1
             else:
                 self._mission_stage = "zloop"
@@ -113,6 +123,7 @@ class Mission (object):
             done = self._step_zonef(self._mission_context.zone,
                                     self._zone_exitfs, self._zone_exitfs_base)
             if done:
+                record_shader_variants(self.ident)
                 self._mission_stage = "zvoid"
                 self._switch_dframe = 0
                 self._switch_dtime = 0
@@ -146,10 +157,19 @@ class Mission (object):
                 self._loading_info[1] = (
                     _("First entry into this zone, "
                       "generating data may take several minutes."))
+            self._loading_info_note = self._loading_info[1]
             report(_("Switching to zone: %s") % self._mission_context.zone)
 
         if self._mission_stage == "zenter0b":
-            if self._switch_dframe < 2: # for loading screen to update
+            # Wait for completion of background loading for the zone.
+            zname = self._mission_context.zone
+            self.prefetch_zone(zname)
+            numdone, numtotal = self.loading_progress(zname)
+            if numdone < numtotal:
+                self._loading_info = [
+                    _("Loading zone... %d%%") % (100 * numdone // numtotal),
+                    self._loading_info_note]
+            elif self._switch_dframe < 2: # for loading screen to update
                 self._switch_dframe += 1
             else:
                 self._mission_stage = "zenter"
@@ -168,6 +188,10 @@ class Mission (object):
                     #base.global_clock.reset()
                 self._loading_info = False
             if done:
+                futures = self._zone_prefetches.pop(self._mission_context.zone,
+                                                    None)
+                self._switch_prefetched = any(f.loads_model
+                                              for f in futures or ())
                 self._mission_context.prev_zone = None
                 self._mission_stage = "zloop0"
                 self._switch_dframe = 0
@@ -182,6 +206,7 @@ class Mission (object):
             done = self._step_zonef(self._mission_context.zone,
                                     self._zone_exitfs, self._zone_exitfs_base)
             if done:
+                record_shader_variants(self.ident)
                 self.alive = False
                 self._cleanup()
                 return task.done
@@ -196,6 +221,11 @@ class Mission (object):
                       "generating data may take several minutes."))
             self._mission_stage = "iload0b"
             self._switch_dframe = 0
+            # Overlap loading of the first zone with mission loading.
+            if self._mission_context.next_zone:
+                self.prefetch_zone(self._mission_context.next_zone)
+            # Shaders are compiled while the loading screen is rendered.
+            precompile_shaders(self.ident)
 
         if self._mission_stage == "iload0b":
             if self._switch_dframe < 2: # for loading screen to update
@@ -299,7 +329,7 @@ class Mission (object):
 
 
     def add_zone (self, name, clat, clon,
-                  enterf=None, exitf=None, loopf=None):
+                  enterf=None, exitf=None, loopf=None, prefetchf=None):
 
         if name in self._zone_contexts:
             raise StandardError(
@@ -309,6 +339,7 @@ class Mission (object):
         self._zone_exitfs[name] = list(as_sequence(exitf))
         self._zone_loopfs[name] = list(as_sequence(loopf))
         self._zone_coords[name] = (radians(clat), radians(clon))
+        self._zone_prefetchfs[name] = prefetchf
 
         # If this is the first added zone,
         # set it to activate unless overridden by switch_zone.
@@ -328,10 +359,53 @@ class Mission (object):
 
         if name != "!end":
             self._mission_context.next_zone = name
+            # Load in background while the current zone exits.
+            self.prefetch_zone(name)
         else:
             self.end()
 
 
+    def prefetch_zone (self, name):
+        """
+        Start loading data of the zone in background.
+
+        The zone prefetch function, if given when the zone was added,
+        is called with zone, mission and game context, and should
+        return a sequence of futures of the background loader
+        (e.g. as returned by base.load_model_async).
+        Entering the zone waits until all these futures are done.
+        If any of them loaded a model, the frames otherwise waited
+        after entering the zone for loading from cache are skipped.
+        Prefetching is started automatically when switching to the zone,
+        and can be started earlier by calling this method,
+        e.g. while the player is approaching the zone exit.
+        Repeated calls for the same zone do nothing.
+        """
+
+        if name in self._zone_prefetches:
+            return
+        prefetchf = self._zone_prefetchfs.get(name)
+        if prefetchf is not None:
+            zc = self._zone_contexts[name]
+            mc = self._mission_context
+            gc = self._game_context
+            futures = list(prefetchf(zc, mc, gc) or [])
+        else:
+            futures = []
+        self._zone_prefetches[name] = futures
+
+
+    def loading_progress (self, name):
+        """
+        Return the number of completed and of all background loads
+        prefetching data for the zone.
+        """
+
+        futures = self._zone_prefetches.get(name, [])
+        numdone = sum(1 for f in futures if f.done())
+        return numdone, len(futures)
+
+
     def switching_zones (self):
 
         return self._mission_stage != "zloop"
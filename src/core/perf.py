@@ -0,0 +1,407 @@
+# -*- coding: UTF-8 -*-
+
+import codecs
+from collections import deque
+import json
+import os
+
+from pandac.PandaModules import AsyncTask, TrueClock
+
+from src.core.misc import report, warning
+from src.core.transl import *
+
+
+class TaskTimer (object):
+    """
+    Wall time measurement of task functions.
+
+    Timer replaces the task manager's add method, such that every
+    task function added afterwards is wrapped in a timing function.
+    Time spent in tasks is accumulated by task name within the frame,
+    until taken by calling take_frame().
+    Timer should be created before any tasks that should be measured
+    are added to the task manager.
+
+    If aggregation is requested, timing statistics are also collected
+    over all calls, by task name and by body family of the task owner.
+    The owner of a task is the object of a method task function,
+    and its family is taken from the owner itself if it is a body,
+    or else from the owner's parent body; if neither is a body,
+    the class name of the owner is used in parenthesis.
+    """
+
+    def __init__ (self, taskmgr, aggregate=False, numsamples=10000):
+
+        self._taskmgr = taskmgr
+        self._clock = TrueClock.getGlobalPtr()
+
+        self._frame_times = {}
+        self._frame_calls = {}
+
+        self._aggregate = aggregate
+        self._numsamples = numsamples
+        self._stats_by_name = {}
+        self._stats_by_family = {}
+
+        self._orig_add = taskmgr.add
+        taskmgr.add = self._add
+
+        self.alive = True
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        if self._taskmgr.add == self._add:
+            del self._taskmgr.add
+        self.alive = False
+
+
+    def _add (self, funcOrTask, name=None, *args, **kwargs):
+
+        if not self.alive or isinstance(funcOrTask, AsyncTask):
+            return self._orig_add(funcOrTask, name, *args, **kwargs)
+
+        func = funcOrTask
+        if name is None:
+            name = getattr(func, "__name__", "task")
+        timedf = self._make_timed_func(func, name)
+        return self._orig_add(timedf, name, *args, **kwargs)
+
+
+    def _make_timed_func (self, func, name):
+
+        clock = self._clock
+        frame_times = self._frame_times
+        frame_calls = self._frame_calls
+
+        if self._aggregate:
+            family = TaskTimer._owner_family(func)
+            name_stats = self._get_stats(self._stats_by_name, name)
+            family_stats = self._get_stats(self._stats_by_family, family)
+        else:
+            name_stats = None
+            family_stats = None
+
+        def timedf (*args, **kwargs):
+            t0 = clock.getShortTime()
+            ret = func(*args, **kwargs)
+            dt = clock.getShortTime() - t0
+            frame_times[name] = frame_times.get(name, 0.0) + dt
+            frame_calls[name] = frame_calls.get(name, 0) + 1
+            if name_stats is not None:
+                name_stats.add(dt)
+                family_stats.add(dt)
+            return ret
+
+        timedf.__name__ = name
+        return timedf
+
+
+    def _get_stats (self, stats_by_key, key):
+
+        stats = stats_by_key.get(key)
+        if stats is None:
+            stats = TimeStats(self._numsamples)
+            stats_by_key[key] = stats
+        return stats
+
+
+    @staticmethod
+    def _owner_family (func):
+
+        owner = getattr(func, "im_self", None)
+        if owner is None:
+            return "(none)"
+        family = getattr(owner, "family", None)
+        if not isinstance(family, basestring):
+            parent = getattr(owner, "parent", None)
+            family = getattr(parent, "family", None)
+        if not isinstance(family, basestring):
+            family = "(%s)" % type(owner).__name__
+        return family
+
+
+    def add_untimed (self, funcOrTask, name=None, *args, **kwargs):
+
+        return self._orig_add(funcOrTask, name, *args, **kwargs)
+
+
+    def take_frame (self):
+        """
+        Return times and call counts of tasks since the previous call,
+        as two dictionaries keyed by task name.
+        """
+
+        frame_times = dict(self._frame_times)
+        frame_calls = dict(self._frame_calls)
+        # Clear in place, timing functions keep references.
+        self._frame_times.clear()
+        self._frame_calls.clear()
+        return frame_times, frame_calls
+
+
+    def time (self):
+
+        return self._clock.getShortTime()
+
+
+    def stats (self, byfamily=False):
+        """
+        Return aggregated timing statistics, as dictionary of
+        TimeStats objects keyed by task name or by body family.
+        """
+
+        if byfamily:
+            return dict(self._stats_by_family)
+        else:
+            return dict(self._stats_by_name)
+
+
+    def reset_stats (self):
+
+        # Reset in place, timing functions keep references.
+        for stats in self._stats_by_name.itervalues():
+            stats.reset()
+        for stats in self._stats_by_family.itervalues():
+            stats.reset()
+
+
+    def format_stats (self, byfamily=False, sortby="total", maxlines=None):
+
+        stats_by_key = self.stats(byfamily)
+        keyf = {
+            "total": (lambda e: -e[1].total),
+            "mean": (lambda e: -e[1].mean()),
+            "p99": (lambda e: -e[1].quantile(0.99)),
+            "count": (lambda e: -e[1].count),
+            "name": (lambda e: e[0]),
+        }[sortby]
+        items = sorted(((k, s) for k, s in stats_by_key.iteritems()
+                        if s.count > 0), key=keyf)
+        if maxlines is not None:
+            items = items[:maxlines]
+        kname = "family" if byfamily else "task"
+        kwidth = max([len(kname)] + [len(k) for k, s in items])
+        ls = []
+        ls.append("%-*s  %10s  %10s  %10s  %10s  %10s" %
+                  (kwidth, kname, "count", "total[ms]", "mean[ms]",
+                   "p99[ms]", "max[ms]"))
+        for key, stats in items:
+            ls.append("%-*s  %10d  %10.1f  %10.4f  %10.4f  %10.4f" %
+                      (kwidth, key, stats.count, stats.total * 1000,
+                       stats.mean() * 1000, stats.quantile(0.99) * 1000,
+                       stats.max * 1000))
+        return "\n".join(ls)
+
+
+    def dump_stats (self, path=None, sortby="total", maxlines=None):
+        """
+        Write aggregated timing statistics by task name and by body family,
+        into the given file, or into the log if no file is given.
+        """
+
+        text = "\n\n".join([
+            self.format_stats(byfamily=False, sortby=sortby, maxlines=maxlines),
+            self.format_stats(byfamily=True, sortby=sortby, maxlines=maxlines),
+        ])
+        if path is not None:
+            fh = codecs.open(path, "w", "utf8")
+            fh.write(text + "\n")
+            fh.close()
+        else:
+            report(_("Task timing statistics:\n%s") % text)
+
+
+class TimeStats (object):
+    """
+    Timing statistics of repeated calls.
+
+    Count, total and maximum time are computed over all calls,
+    while quantiles are computed over the given number of latest calls.
+    """
+
+    def __init__ (self, numsamples=10000):
+
+        self._numsamples = numsamples
+        self.reset()
+
+
+    def add (self, dt):
+
+        self.count += 1
+        self.total += dt
+        if self.max < dt:
+            self.max = dt
+        self._samples.append(dt)
+
+
+    def mean (self):
+
+        return self.total / self.count if self.count > 0 else 0.0
+
+
+    def quantile (self, q):
+
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        k = min(int(q * len(samples)), len(samples) - 1)
+        return samples[k]
+
+
+    def reset (self):
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=self._numsamples)
+
+
+class Benchmark (object):
+    """
+    Per-frame timing report of a running world.
+
+    Frames are recorded only while the world is alive and
+    its mission (if any) is not switching zones,
+    and after the given number of warm-up frames.
+    When the requested number of frames has been recorded,
+    the report is written and the game exits.
+    """
+
+    def __init__ (self, timer, reppath, numframes, skipframes=20):
+
+        self._timer = timer
+        self._reppath = reppath
+        self._numframes = numframes
+        self._skipframes = skipframes
+
+        self._world = None
+        self._skipped = 0
+        self._prev_time = None
+        self._frame_rows = []
+        self._task_names = set()
+
+        self.alive = True
+        # Should run after everything else in the frame.
+        timer.add_untimed(self._loop, "benchmark-loop", sort=99)
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+
+
+    def set_world (self, world):
+
+        self._world = world
+        self._skipped = 0
+        self._prev_time = None
+
+
+    def _loop (self, task):
+
+        if not self.alive:
+            return task.done
+
+        frame_times, frame_calls = self._timer.take_frame()
+        now = self._timer.time()
+
+        world = self._world
+        if (world is None or not world.alive or
+            (world.mission is not None and world.mission.switching_zones())):
+            self._prev_time = None
+            return task.cont
+
+        if self._skipped < self._skipframes:
+            self._skipped += 1
+            self._prev_time = now
+            return task.cont
+
+        if self._prev_time is not None:
+            frame_time = now - self._prev_time
+            self._frame_rows.append((world.frame, world.time, frame_time,
+                                     frame_times, frame_calls))
+            self._task_names.update(frame_times.keys())
+        self._prev_time = now
+
+        if len(self._frame_rows) >= self._numframes:
+            self._write_report()
+            self.destroy()
+            exit(0)
+
+        return task.cont
+
+
+    def _write_report (self):
+
+        task_names = sorted(self._task_names)
+        if self._reppath.endswith(".json"):
+            self._write_report_json(task_names)
+        else:
+            self._write_report_csv(task_names)
+        numrows = len(self._frame_rows)
+        avg_frame_time = sum(r[2] for r in self._frame_rows) / max(numrows, 1)
+        report(_("Benchmark report with %(num)d frames "
+                 "(average %(dur).2f ms) written to '%(path)s'.") %
+               dict(num=numrows, dur=(avg_frame_time * 1000),
+                    path=self._reppath.decode("utf8", "replace")))
+
+
+    def _write_report_json (self, task_names):
+
+        rows = self._frame_rows
+        numrows = len(rows)
+        tasks = {}
+        for name in task_names:
+            times = [r[3].get(name, 0.0) for r in rows]
+            calls = [r[4].get(name, 0) for r in rows]
+            tasks[name] = dict(
+                time=times,
+                calls=calls,
+                mean_time=(sum(times) / numrows if numrows else 0.0),
+                max_time=max(times or [0.0]),
+            )
+        frame_times = [r[2] for r in rows]
+        spec = dict(
+            fixed_time_step=base.fixdt,
+            random_seed=base.randseed,
+            num_frames=numrows,
+            frame=[r[0] for r in rows],
+            world_time=[r[1] for r in rows],
+            frame_time=frame_times,
+            mean_frame_time=(sum(frame_times) / numrows if numrows else 0.0),
+            max_frame_time=max(frame_times or [0.0]),
+            tasks=tasks,
+        )
+        self._make_report_dir()
+        fh = open(self._reppath, "wb")
+        json.dump(spec, fh, indent=1, sort_keys=True)
+        fh.close()
+
+
+    def _write_report_csv (self, task_names):
+
+        self._make_report_dir()
+        fh = codecs.open(self._reppath, "w", "utf8")
+        header = ["frame", "world_time", "frame_time"] + task_names
+        fh.write(",".join(header) + "\n")
+        for frame, wtime, ftime, frame_times, frame_calls in self._frame_rows:
+            els = ["%d" % frame, "%.4f" % wtime, "%.6f" % ftime]
+            els.extend("%.6f" % frame_times.get(name, 0.0)
+                       for name in task_names)
+            fh.write(",".join(els) + "\n")
+        fh.close()
+
+
+    def _make_report_dir (self):
+
+        repdir = os.path.dirname(os.path.abspath(self._reppath))
+        if not os.path.isdir(repdir):
+            try:
+                os.makedirs(repdir)
+            except OSError:
+                warning(_("Cannot create directory for benchmark report."))
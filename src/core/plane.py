@@ -3,6 +3,7 @@
 from math import degrees, radians, pi, sin, cos, asin, acos, tan, atan, atan2
 from math import sqrt
 import os
+from time import time
 
 from direct.directtools.DirectGeometry import LineNodePath
 from pandac.PandaModules import Vec2, Vec3, Vec4, Vec3D, Point2, Point3, Point3D
@@ -41,7 +42,7 @@ from src.core.sensor import Rwr, Comm, DataLink, MagicTargeted
 from src.core.sensor import FighterVisualCollisionWarning
 from src.core.sensor import TransportVisualCollisionWarning
 from src.core.shader import make_shader
-from src.core.shell import Shell, Cannon
+from src.core.shell import Cannon
 from src.core.sound import Sound3D, Sound2D
 from src.core.trail import PolyBraid, PolyExhaust, PolyTrail
 
@@ -534,6 +535,7 @@ class Plane (Body):
                 wlnd.wrtReparentTo(wing_arm_left)
                 if self.varsweephitbox and mlevel == 0:
                     hbx_left.cnode.wrtReparentTo(wing_arm_left)
+                    hbx_left.moving = True
                 self._varsweep_arm_lefts.append(wing_arm_left)
                 # - right
                 prnd = model.attachNewNode("pivot-wing-right")
@@ -544,6 +546,7 @@ class Plane (Body):
                 wrnd.wrtReparentTo(wing_arm_right)
                 if self.varsweephitbox and mlevel == 0:
                     hbx_right.cnode.wrtReparentTo(wing_arm_right)
+                    hbx_right.moving = True
                 self._varsweep_arm_rights.append(wing_arm_right)
             # Set initial sweep.
             self._varsweep_force_relang = None
@@ -631,6 +634,10 @@ class Plane (Body):
         # Autopilot constants and state.
         self._act_state = AutoProps()
         self._act_shootdist = 700.0
+        self._act_sched = ActScheduler.for_world(world)
+        self._act_level = 0
+        self._act_hold = 0.0
+        self._act_deferred = 0
         self._act_input_controlout = None
         # FIXME: Dirty way of firing missiles.
         # Remove when proper missile modes become available.
@@ -1382,19 +1389,19 @@ class Plane (Body):
                 self._jm_wait = self._jm_period + uniform(-pfl, pfl)
                 allied_sides = self.world.get_allied_sides(self.side)
                 self.jammed = False
-                for family in self._jm_carrier_families:
-                    for body in self.world.iter_bodies(family):
+                families = self._jm_carrier_families
+                maxjdist = self.world.max_body_value(families, "jamdist",
+                                                     Plane._jam_dist)
+                if maxjdist:
+                    for body in self.world.bodies_within(pos, maxjdist,
+                                                         families):
                         if (not body.shotdown and body.jammers and
                             body.side not in allied_sides):
-                            jdist = 0.0
-                            for jammer in body.jammers:
-                                jdist += jammer.ptype.jamradius * len(jammer.points)
+                            jdist = Plane._jam_dist(body)
                             bdist = self.dist(body)
                             if bdist < jdist:
                                 self.jammed = True
                                 break
-                    if self.jammed:
-                        break
                 if not self.jammed:
                     for carpet in JammingCarpet.iter_carpets():
                         if (carpet.alive and carpet.active and
@@ -1498,7 +1505,7 @@ class Plane (Body):
             self.damage = self.strength
         self._shake_last_hitforce += obody.hitforce
 
-        if isinstance(obody, Shell):
+        if obody.family == "shell":
             self._breakup_track_hits_gun_level += obody.hitforce
         else: # volume hits, e.g. explosion or collision
             self._breakup_track_hits_vol.append((obody.hitforce, self.world.time))
@@ -2273,6 +2280,7 @@ class Plane (Body):
                 self._attacking_missile = min(contacts_selected)[1]
                 if self.evade_missile_manouver:
                     self._act_pause = 0.0
+                    self._act_hold = 0.0
                     if not self._aatk_paused:
                         self._evade_missile_aatk_paused = True
                         self._aatk_paused = True
@@ -2285,6 +2293,7 @@ class Plane (Body):
                     self._aatk_paused = False
                 if self.evade_missile_manouver:
                     self._act_pause = 0.0
+                    self._act_hold = 0.0
 
         # Update decoys.
         if self.evade_missile_decoy:
@@ -2344,8 +2353,14 @@ class Plane (Body):
                 self._act_target = None
 
         # Apply autopilot.
+        # Between decisions, the control programs set by the last one
+        # are held, for at least the period given by the scheduler.
         self._act_pause -= dt
-        if self._act_active and self._act_pause <= 0.5 * dt:
+        self._act_hold -= dt
+        if (self._act_active and self._act_pause <= 0.5 * dt and
+            self._act_hold <= 0.5 * dt and self._admit_act()):
+            t0 = time()
+            self._act_hold = self._act_sched.hold_period(self._act_level)
             self.target = None
             if self._attacking_missile and self.evade_missile_manouver:
                 # Nevertheless register pre-evasion target, for game logic.
@@ -2379,6 +2394,19 @@ class Plane (Body):
                                  sublead=self._act_sublead)
             else:
                 self._act_pause = self._act_input_nav()
+            self._act_sched.charge(time() - t0)
+
+
+    def _admit_act (self):
+
+        sched = self._act_sched
+        self._act_level = sched.relevance(self)
+        if sched.admit(self._act_level, self._act_deferred):
+            self._act_deferred = 0
+            return True
+        else:
+            self._act_deferred += 1
+            return False
 
 
     def _update_act_2 (self, dt):
@@ -2414,6 +2442,15 @@ class Plane (Body):
         #self.sensorpack.start_scanning(families)
 
 
+    @staticmethod
+    def _jam_dist (body):
+
+        jdist = 0.0
+        for jammer in (getattr(body, "jammers", None) or ()):
+            jdist += jammer.ptype.jamradius * len(jammer.points)
+        return jdist
+
+
     def _choose_target (self, families):
 
         allied_sides = self.world.get_allied_sides(self.side)
@@ -2444,6 +2481,10 @@ class Plane (Body):
         # Do not attack contact already under attack by another aircraft
         # from the same formation, if there is another nearby to attack.
         others_form = Plane._collect_other_in_formation(self)
+        num_atk_by_target = {}
+        for other in others_form:
+            num_atk_by_target[other.target] = (
+                num_atk_by_target.get(other.target, 0) + 1)
         contacts_by_family = self.sensorpack.contacts_by_family()
         contacts_selected = []
         other_attack_penalty_dist = 5e3
@@ -2452,8 +2493,8 @@ class Plane (Body):
                 if not contact.body.alive or contact.body.shotdown:
                     continue
                 if contact.side not in allied_sides and contact.pos is not None:
-                    condist = (self.pos() - contact.pos).length()
-                    num_atk = sum(o.target is contact.body for o in others_form)
+                    condist = (pos - contact.pos).length()
+                    num_atk = num_atk_by_target.get(contact.body, 0)
                     if num_atk:
                         condist += other_attack_penalty_dist
                     contacts_selected.append((condist, contact, num_atk))
@@ -2546,6 +2587,7 @@ class Plane (Body):
         # Clean previous autopilot-specific state.
         self._act_state = AutoProps()
         self._act_pause = 0.0
+        self._act_hold = 0.0
 
         self._act_active = True
 
@@ -3782,6 +3824,127 @@ class Plane (Body):
         return ret
 
 
+class ActScheduler (object):
+    """
+    Scheduler of autopilot decisions of planes in a world.
+
+    Each plane is assigned a relevance level, by distance to the player
+    and the camera, and by whether it is in combat or engaged with
+    the player. The level gives the minimum period between decisions,
+    during which the plane holds the control programs of the last one.
+    Decisions of planes below top relevance are further deferred
+    when the time spent on decisions in the frame exceeds the budget,
+    but not for more than a few frames in a row.
+
+    There is one scheduler per world, obtained by for_world().
+    """
+
+    # Maximum distance and minimum period between decisions, by level.
+    _levels = (
+        (8000.0, 0.0),
+        (20000.0, 0.2),
+        (40000.0, 0.5),
+        (None, 1.0),
+    )
+    # Wall time for decisions per frame [s].
+    _budget = 0.004
+    # Maximum number of frames to defer a decision.
+    _maxdefer = 4
+
+    def __init__ (self, world):
+
+        self.world = world
+
+        self._refpos = []
+        self._playerac = None
+        self._spent = 0.0
+
+        self.alive = True
+        # Should run after world pre-loop, and before planes.
+        base.taskMgr.add(self._loop, "act-scheduler-loop", sort=-9)
+
+
+    @staticmethod
+    def for_world (world):
+
+        sched = world.act_scheduler
+        if sched is None or not sched.alive:
+            sched = ActScheduler(world)
+            world.act_scheduler = sched
+        return sched
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+
+
+    def _loop (self, task):
+
+        if not self.alive:
+            return task.done
+        world = self.world
+        if not world.alive:
+            self.destroy()
+            return task.done
+
+        self._spent = 0.0
+
+        self._refpos = [world.camera.getPos(world.node)]
+        player = world.player
+        if player and player.ac.alive:
+            self._playerac = player.ac
+            self._refpos.append(player.ac.pos())
+        else:
+            self._playerac = None
+
+        return task.cont
+
+
+    def relevance (self, plane):
+        """
+        Relevance level of the plane, 0 being the highest.
+        """
+
+        pac = self._playerac
+        if pac is not None and (pac.target is plane or
+                                plane._act_target is pac):
+            return 0
+        pos = plane.pos()
+        dist = min((pos - rpos).length() for rpos in self._refpos)
+        for level, (maxdist, period) in enumerate(self._levels):
+            if maxdist is None or dist < maxdist:
+                break
+        if level > 0 and (plane._act_target or plane._attacking_missile):
+            level -= 1
+        return level
+
+
+    def hold_period (self, level):
+
+        return self._levels[level][1]
+
+
+    def admit (self, level, deferred):
+        """
+        Whether a plane at given relevance level, with decision deferred
+        for given number of frames, should make the decision now.
+        """
+
+        return (level == 0 or self._spent < self._budget or
+                deferred >= self._maxdefer)
+
+
+    def charge (self, dtw):
+        """
+        Add wall time spent on a decision.
+        """
+
+        self._spent += dtw
+
+
 class Ejection (object):
 
     def __init__ (self, plane, wrefbody=False):
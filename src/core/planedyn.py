@@ -18,7 +18,7 @@ from src.core.misc import uniform, randvec
 from src.core.misc import debug, dbgval
 from src.core.misc import absmax
 from src.core.misc import TimeMaxed, TimeAveraged
-from src.core.table import Table2, Table3
+from src.core.table import Table2, Table3, table_cache_key
 
 
 fudge = AutoProps(
@@ -120,7 +120,8 @@ class PlaneDynamics (object):
         this_path = internal_path("data", __file__)
         ckey = (sorted(ad.props()), sorted(pd.props()), sorted(fudge.props()),
                 get_cache_key_section(this_path.replace(".pyc", ".py"),
-                                     "plane-dynamics"))
+                                     "plane-dynamics"),
+                table_cache_key())
 
         ddcpath = join_path("pldyn", self.name, "basedat.pkl")
         dd = read_cache_object(ddcpath, ckey)
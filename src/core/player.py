@@ -1761,13 +1761,16 @@ class Player (DirectObject):
     def _navjump_allowed (self):
 
         acp = self.ac
-        friendlies = self.world.get_friendlies(
-            self._no_navjump_when_attacked_families, acp.side)
+        allied_sides = self.world.get_allied_sides(acp.side)
+        attacked_families = self._no_navjump_when_attacked_families
         for family in self._no_navjump_when_target_families:
             for body in self.world.iter_bodies(family):
                 if not body.alive:
                     continue
-                if body.target in friendlies and body is not acp:
+                target = body.target
+                if (target is not None and body is not acp and
+                    target.family in attacked_families and
+                    target.side in allied_sides):
                     return False
 
         return True
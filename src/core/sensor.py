@@ -214,7 +214,7 @@ class SensorPack (object):
             contact.update_for_motion()
 
         if self._num_bodies_to_test == 0:
-            self._test_bodies = self.world.select_bodies(self._scan_families, cache=True)
+            self._test_bodies = self._select_test_bodies()
             self._num_bodies_to_test = len(self._test_bodies)
 
             self._contacts = self._new_contacts
@@ -240,6 +240,7 @@ class SensorPack (object):
             self._tracked_contacts = tracked_contacts
 
         scan_next = self._scan_current + self._scan_speed * self.world.dt
+        ppos = None
         for k in xrange(int(self._scan_current), int(scan_next)):
             if self._num_bodies_to_test == 0:
                 break
@@ -248,10 +249,21 @@ class SensorPack (object):
             if not body.alive or body is self.parent:
                 continue
 
+            # Distance is computed once for all sensors, to skip
+            # full tests of sensors which cannot reach the body.
+            # Sensors may be offset within the parent, hence the slack.
+            if ppos is None:
+                ppos = self.parent.pos()
+                pslack = self.parent.bboxdiag
+            bdist = (body.pos() - ppos).length()
+
             contact = None
             seen_by_sensors = set()
             for applied_sensors_1 in self._applied_sensors:
                 for name, sensor in applied_sensors_1.iteritems():
+                    maxrange = sensor.max_range(body)
+                    if maxrange is not None and bdist > maxrange + pslack:
+                        continue
                     tcontact = sensor.test(body)
                     if tcontact is not None:
                         contacts = self._new_contacts_by_sensor.get(name)
@@ -296,6 +308,49 @@ class SensorPack (object):
         return task.cont
 
 
+    def _select_test_bodies (self):
+
+        # Each sensor contributes the bodies it may detect:
+        # those it can select by itself, those within its reach
+        # from the spatial index, or else all bodies of its families.
+        # Reach is extended for motion during the scan period.
+        ppos = self.parent.pos()
+        scan_families = self._scan_families
+        full_families = set()
+        bodies = []
+        selected = set()
+        slack = None
+        for applied_sensors_1 in self._applied_sensors:
+            for sensor in applied_sensors_1.itervalues():
+                families = sensor.dfamilies.intersection(scan_families)
+                if not families:
+                    continue
+                sbodies = sensor.candidates(families)
+                if sbodies is None:
+                    reach = sensor.max_reach(families)
+                    if reach is None:
+                        full_families.update(families)
+                        continue
+                    if slack is None:
+                        maxspeed = self.world.max_body_value(
+                            scan_families, "speed", lambda b: b.speed())
+                        slack = (self.parent.bboxdiag +
+                                 (self.parent.speed() + (maxspeed or 0.0)) *
+                                 (self._scan_period + self._scan_period_fluct))
+                    sbodies = self.world.bodies_within(ppos, reach + slack,
+                                                       families)
+                for body in sbodies:
+                    if body not in selected:
+                        selected.add(body)
+                        bodies.append(body)
+        if full_families:
+            families = tuple(sorted(full_families))
+            for body in self.world.select_bodies(families, cache=True):
+                if body not in selected:
+                    bodies.append(body)
+        return bodies
+
+
     def update (self, scanperiod=None, relspfluct=None, maxtracked=None):
 
         if scanperiod is not None:
@@ -463,6 +518,30 @@ class Sensor (object):
         return None
 
 
+    # Upper bound on the distance at which the given body can be detected,
+    # if the sensor can cheaply compute it, or else None.
+    # Used to skip full test of bodies that are certainly too far.
+    def max_range (self, body):
+
+        return None
+
+
+    # Upper bound on the distance at which any body of the given families
+    # can be detected, if the sensor can compute it from per-frame maxima
+    # of body properties, or else None.
+    # Used to select bodies to test from the spatial index of the world.
+    def max_reach (self, families):
+
+        return None
+
+
+    # Bodies of the given families which the sensor may detect,
+    # if the sensor can select them without testing all bodies, or else None.
+    def candidates (self, families):
+
+        return None
+
+
     def note (self, contact, expire):
 
         pass
@@ -530,6 +609,20 @@ class Radar (Sensor):
         return contact
 
 
+    def max_range (self, body):
+
+        if body.family not in self.dfamilies:
+            return None
+        return self.detection_range(rcs=body.rcs)
+
+
+    def max_reach (self, families):
+
+        maxrcs = self.world.max_body_value(families, "rcs",
+                                           lambda b: b.rcs)
+        return self.detection_range(rcs=(maxrcs or 0.0))
+
+
     _refrcs = 5.0
     # ...of a medium-size non-stealth fighter.
 
@@ -619,6 +712,27 @@ class Irst (Sensor):
         return contact
 
 
+    def max_range (self, body):
+
+        if body.family not in self.dfamilies:
+            return None
+        # Emission aspect factor is largest head-on.
+        pwrfac = sqrt(body.ireqpower / Irst._refireqpower)
+        aspfac = 1.0 + abs(body.iraspect)
+        return self._ref_range * pwrfac * aspfac
+
+
+    def max_reach (self, families):
+
+        maxpwr = self.world.max_body_value(families, "ireqpower",
+                                           lambda b: b.ireqpower)
+        maxasp = self.world.max_body_value(families, "iraspect",
+                                           lambda b: abs(b.iraspect))
+        pwrfac = sqrt((maxpwr or 0.0) / Irst._refireqpower)
+        aspfac = 1.0 + (maxasp or 0.0)
+        return self._ref_range * pwrfac * aspfac
+
+
     _refireqpower = 250.0 * 40e3
      # ...of fighter flying 250 m/s with 40 kN thrust.
 
@@ -719,6 +833,29 @@ class Visual (Sensor):
         return True
 
 
+    def max_range (self, body):
+
+        # Being close to the sun can only reduce the range.
+        if body.family not in self.dfamilies:
+            return None
+        elif self._ref_size_type == SIZEREF.DIAG:
+            return self.detection_range(refsize=body.bboxdiag)
+        else:
+            return None
+
+
+    def max_reach (self, families):
+
+        # Projected area is at most the length of the vector of side areas.
+        if self._ref_size_type == SIZEREF.DIAG:
+            maxsize = self.world.max_body_value(families, "bboxdiag",
+                                                lambda b: b.bboxdiag)
+        elif self._ref_size_type == SIZEREF.PROJAREA:
+            maxsize = self.world.max_body_value(families, "bboxarea",
+                                                lambda b: b.bboxarea.length())
+        return self.detection_range(refsize=(maxsize or 0.0))
+
+
     _refdetrange = 15e3
     _refdiaglen = 20.0
     _refprojarea = 200.0
@@ -866,6 +1003,27 @@ class Tv (Sensor):
         return contact
 
 
+    def max_range (self, body):
+
+        if body.family not in self.dfamilies:
+            return None
+        elif self._ref_size_type == SIZEREF.DIAG:
+            return self.detection_range(refsize=body.bboxdiag)
+        else:
+            # Limit of detection range for any size.
+            return self._ref_range * sqrt(3.0)
+
+
+    def max_reach (self, families):
+
+        if self._ref_size_type == SIZEREF.DIAG:
+            maxdiag = self.world.max_body_value(families, "bboxdiag",
+                                                lambda b: b.bboxdiag)
+            return self.detection_range(refsize=(maxdiag or 0.0))
+        else:
+            return self._ref_range * sqrt(3.0)
+
+
     _refdiaglen = 8.0
     _refprojarea = 28.0
     # ...of an MBT.
@@ -937,6 +1095,19 @@ class Rwr (Sensor):
         return contact
 
 
+    def max_reach (self, families):
+
+        # Radar wash falls with square of distance from reference range.
+        def radio_range (body):
+            if body.sensorpack is None:
+                return 0.0
+            sensors = body.sensorpack.get_emitting(emtype=EMISSION.RADIO)
+            return max([s._ref_range for s in sensors] or [0.0])
+        maxrange = self.world.max_body_value(families, "radio-range",
+                                             radio_range)
+        return (maxrange or 0.0) / sqrt(self._min_wash)
+
+
 class CollisionWarning (Sensor):
 
     emissive = EMISSION.NONE
@@ -980,6 +1151,18 @@ class CollisionWarning (Sensor):
         return contact
 
 
+    def max_reach (self, families):
+
+        # Bodies approaching each other at most at sum of their speeds.
+        maxdiag = self.world.max_body_value(families, "bboxdiag",
+                                            lambda b: b.bboxdiag)
+        maxspeed = self.world.max_body_value(families, "speed",
+                                             lambda b: b.speed())
+        maxdvel = self.parent.speed() + (maxspeed or 0.0)
+        return (self._inside_dist + (maxdiag or 0.0) * 0.5 +
+                maxdvel * self._inside_time)
+
+
     def detect (self, body):
 
         contact = Contact(body=body,
@@ -1087,6 +1270,16 @@ class DataLink (Sensor):
         return contact
 
 
+    def candidates (self, families):
+
+        bodies = []
+        if self._can_recv:
+            for tag in self._recv_tags:
+                bodies.extend(b for b in self.world.tagged_bodies(tag=tag)
+                              if b.family in families)
+        return bodies
+
+
     def note (self, contact, expire):
 
         if (contact.firsthand and self._can_send and contact.trackable() and
@@ -1148,6 +1341,12 @@ class Comm (Sensor):
         return contact
 
 
+    def candidates (self, families):
+
+        return [b for b in self.world.tagged_bodies(tag=self._comm_tag)
+                if b.family in families]
+
+
     def note (self, contact, expire):
 
         if contact.firsthand:
@@ -1195,3 +1394,8 @@ class MagicTargeted (Sensor):
         return contact
 
 
+    def candidates (self, families):
+
+        return self.world.targeting_bodies(self.parent, families)
+
+
@@ -5,11 +5,170 @@ from math import pi, sqrt, exp, sin, cos
 from pandac.PandaModules import Shader, Vec3, Vec4
 
 from src import GLSL_PROLOGUE, GLSL_VERSION
+from src import internal_path, join_path
 from src.core.misc import SimpleProps
-from src.core.misc import debug
+from src.core.misc import read_cache_object, write_cache_object
+from src.core.misc import debug, warning
+from src.core.transl import *
 
 
+_glsl_makers = {}
+_glsl_store = None
+_glsl_store_keys = None
+_glsl_store_updated = False
+_glsl_store_path = join_path("shaders", "glsl.pkl")
+_glsl_used = set()
+
+def register_shader_maker (maker, memo, modpath, withextra=False):
+    """
+    Register in-process cache of a shader making function,
+    such that shaders from the persistent cache can be put into it.
+
+    The maker is the name under which shaders are stored,
+    the memo is the dictionary of shaders by shader key,
+    and the module path is of the module where shader source is generated.
+    If the function stores extra data together with the shader
+    in the memo, as (shader, extra) tuples, it must be indicated.
+    """
+
+    _glsl_makers[maker] = (memo, modpath, withextra)
+
+
+def _driver_ident ():
+
+    window = getattr(base, "window", None)
+    gsg = window.getGsg() if window is not None else None
+    if gsg is None:
+        return None
+    return (gsg.getDriverVendor(), gsg.getDriverRenderer(),
+            gsg.getDriverVersion())
+
+
+def _glsl_store_key ():
+
+    ckey = (GLSL_VERSION, GLSL_PROLOGUE, _driver_ident())
+    fckey = sorted(set(e[1] for e in _glsl_makers.itervalues()))
+    return ckey, fckey
+
+
+def _load_glsl_store ():
+
+    global _glsl_store, _glsl_store_keys
+    if _glsl_store is not None:
+        return _glsl_store
+    if _driver_ident() is None:
+        # No persistent cache without graphics driver.
+        return None
+
+    # Keep the key for writing, such that the store is written
+    # under the same key under which it is read in the next run.
+    _glsl_store_keys = _glsl_store_key()
+    ckey, fckey = _glsl_store_keys
+    try:
+        _glsl_store = read_cache_object(_glsl_store_path, ckey, fckey)
+    except Exception:
+        _glsl_store = None
+    if _glsl_store is None:
+        _glsl_store = dict(sources={}, variants={})
+    return _glsl_store
+
+
+def save_shader_cache ():
+    """
+    Write the persistent shader cache, if anything was added to it.
+    """
+
+    global _glsl_store_updated
+    if not _glsl_store_updated:
+        return
+    ckey, fckey = _glsl_store_keys
+    try:
+        write_cache_object(_glsl_store, _glsl_store_path, ckey, fckey)
+    except Exception as e:
+        warning(_("Cannot write shader cache: %s") % e)
+    _glsl_store_updated = False
+
+
+def make_glsl_shader (maker, shdkey, vshstr, fshstr, extra=None):
+    """
+    Create GLSL shader from source, and record the source
+    in the persistent shader cache under the maker and shader key.
+
+    Extra data is stored with the source if the maker
+    stores extra data in its in-process cache.
+    """
+
+    global _glsl_store_updated
+    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    store = _load_glsl_store()
+    if store is not None:
+        skey = (maker, shdkey)
+        if skey not in store["sources"]:
+            store["sources"][skey] = (vshstr, fshstr, extra)
+            _glsl_store_updated = True
+        _glsl_used.add(skey)
+    return shader
+
+
+def precompile_shaders (variant):
+    """
+    Create and prepare for rendering all shaders recorded for the variant
+    (e.g. a mission) in the persistent shader cache.
+
+    Created shaders are put into in-process caches of their makers,
+    and the driver compiles them when the next frame is rendered.
+    Recording of shaders used by the variant is started anew.
+
+    Returns the number of shaders created.
+    """
+
+    _glsl_used.clear()
+    store = _load_glsl_store()
+    if store is None or variant is None:
+        return 0
+    pobjs = base.window.getGsg().getPreparedObjects()
+    nummade = 0
+    for skey in store["variants"].get(variant, ()):
+        maker, shdkey = skey
+        mspec = _glsl_makers.get(maker)
+        src = store["sources"].get(skey)
+        if mspec is None or src is None:
+            continue
+        memo, modpath, withextra = mspec
+        if shdkey in memo:
+            continue
+        vshstr, fshstr, extra = src
+        shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+        memo[shdkey] = (shader, extra) if withextra else shader
+        shader.prepare(pobjs)
+        nummade += 1
+    return nummade
+
+
+def record_shader_variants (variant):
+    """
+    Record shaders created since the last recording for the variant
+    (e.g. a mission), for precompiling the next time it is started,
+    and write the persistent shader cache.
+    """
+
+    global _glsl_store_updated
+    store = _load_glsl_store()
+    if store is None or variant is None:
+        _glsl_used.clear()
+        return
+    if _glsl_used:
+        store["variants"].setdefault(variant, set()).update(_glsl_used)
+        _glsl_used.clear()
+        _glsl_store_updated = True
+    save_shader_cache()
+
+
+_this_path = internal_path("data", __file__).replace(".pyc", ".py")
+
 _shader_cache = {}
+register_shader_maker("make_shader", _shader_cache, _this_path,
+                      withextra=True)
 
 def make_shader (ambln=None, dirlns=[], pntlns=[],
                  fogn=None, fogsbl=(), camn=None,
@@ -20,6 +179,7 @@ def make_shader (ambln=None, dirlns=[], pntlns=[],
                  sunposn=None, sunbcoln=None, sunstr=0.0, sunopq=1.0,
                  shadowrefn=False, shadowdirlin=None, shadowblendn=None,
                  shadowpush=0.0, shadowblur=None,
+                 instn=None,
                  showas=None, getargs=False):
 
     if not dirlns and not pntlns:
@@ -52,7 +212,8 @@ def make_shader (ambln=None, dirlns=[], pntlns=[],
               uvscrn, uvoffscn, pntobrn, obrthr, color, normal, glow, gloss,
               modcol, selfalpha, glowfacn, glowaddn,
               sunposn, sunbcoln, sunstr, sunopq,
-              shadowrefn, shadowdirlin, shadowblendn, shadowpush, shadowblur)
+              shadowrefn, shadowdirlin, shadowblendn, shadowpush, shadowblur,
+              instn)
     ret = _shader_cache.get(shdkey)
     if ret is not None:
         shader, kwargs = ret
@@ -71,6 +232,18 @@ def make_shader (ambln=None, dirlns=[], pntlns=[],
             "fog-sun blending is activated.")
 
     vshstr = GLSL_PROLOGUE
+    if instn:
+        vshstr += """
+#extension GL_ARB_draw_instanced : require
+"""
+
+    # With instancing, vertex attributes are first transformed
+    # by the instance matrix, and the rest of the shader uses
+    # the transformed values instead of the originals.
+    if instn:
+        vertexn, normaln, tangentn = "vertex", "normal0", "tangent0"
+    else:
+        vertexn, normaln, tangentn = "p3d_Vertex", "p3d_Normal", "p3d_Tangent"
 
     need_texcoord = (color or normal or
                      (glow and not isinstance(glow, tuple)) or
@@ -181,11 +354,34 @@ uniform mat3 p3d_NormalMatrix;
 in vec2 p3d_MultiTexCoord0;
 out vec2 l_texcoord0;
 """
+    if instn:
+        vshstr += """
+uniform sampler2D %(instn)s;
+""" % locals()
     vshstr += """
 in vec4 p3d_Vertex;
 
 void main ()
 {
+"""
+    if instn:
+        # Instance texture has one row per instance, with three texels
+        # holding the top three rows of the instance affine matrix.
+        vshstr += """
+    int ki = gl_InstanceIDARB;
+    mat4 instmat = transpose(mat4(texelFetch(%(instn)s, ivec2(0, ki), 0),
+                                  texelFetch(%(instn)s, ivec2(1, ki), 0),
+                                  texelFetch(%(instn)s, ivec2(2, ki), 0),
+                                  vec4(0.0, 0.0, 0.0, 1.0)));
+    vec4 vertex = instmat * p3d_Vertex;
+""" % locals()
+        if dirlns or pntlns:
+            vshstr += """
+    vec3 normal0 = mat3(instmat) * p3d_Normal;
+"""
+            if normal:
+                vshstr += """
+    vec3 tangent0 = mat3(instmat) * p3d_Tangent;
 """
     if ambln or dirlns or pntlns or glow:
         vshstr += """
@@ -193,12 +389,12 @@ void main ()
 """
     if dirlns or pntlns:
         vshstr += """
-    vec3 normal = normalize(p3d_NormalMatrix * p3d_Normal);
-"""
+    vec3 normal = normalize(p3d_NormalMatrix * %(normaln)s);
+""" % locals()
         if normal:
             vshstr += """
-    vec3 tangent = normalize(p3d_NormalMatrix * p3d_Tangent);
-"""
+    vec3 tangent = normalize(p3d_NormalMatrix * %(tangentn)s);
+""" % locals()
     if ambln:
         vshstr += """
     amblit(%(ambln)s, 1.0, l_lit);
@@ -210,8 +406,8 @@ void main ()
 """ % locals()
     if pntlns or pntobrn or gloss:
         vshstr += """
-    l_vertpos = p3d_ModelViewMatrix * p3d_Vertex;
-"""
+    l_vertpos = p3d_ModelViewMatrix * %(vertexn)s;
+""" % locals()
     if pntlns or gloss or normal or shadowrefn:
         vshstr += """
     l_vertnrm = normal;
@@ -222,9 +418,9 @@ void main ()
 """
     if fogn:
         vshstr += """
-    vec4 pw = p3d_ModelMatrix * p3d_Vertex;
+    vec4 pw = p3d_ModelMatrix * %(vertexn)s;
     l_fog = vec4(0.0, 0.0, 0.0, 0.0);
-"""
+""" % locals()
         if fogsbl:
             vshstr += """
     fogbln(%(fogn)s, wspos_%(camn)s, pw,
@@ -236,8 +432,8 @@ void main ()
     fogbln(%(fogn)s, wspos_%(camn)s, pw, l_fog);
 """ % locals()
     vshstr += """
-    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
-"""
+    gl_Position = p3d_ModelViewProjectionMatrix * %(vertexn)s;
+""" % locals()
     if need_texcoord:
         vshstr += """
     l_texcoord0 = p3d_MultiTexCoord0;
@@ -256,13 +452,13 @@ void main ()
 """ % locals()
     if glowzerodist:
         vshstr += """
-    float4 vertpos = p3d_ModelViewMatrix * p3d_Vertex;
+    float4 vertpos = p3d_ModelViewMatrix * %(vertexn)s;
     float cdist = length(vspos_%(camn)s.xyz - vertpos.xyz);
     l_glwfac = 1.0 - clamp(cdist / %(glowzerodist)f, 0.0, 1.0);
 """ % locals()
     if shadowrefn:
         vshstr += """
-    l_shdcoord = shdcrd(trans_model_to_clip_of_%(shadowrefn)s, p3d_Vertex,
+    l_shdcoord = shdcrd(trans_model_to_clip_of_%(shadowrefn)s, %(vertexn)s,
                         %(shadowblendn)s);
     l_shddirli = %(shadowdirlin)s;
 """ % locals()
@@ -585,14 +781,15 @@ void main ()
     if showas:
         printsh((vshstr, fshstr), showas)
 
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
-
     kwargs = dict( # only the arguments influencing creation
         ambln=ambln, dirlns=dirlns, pntlns=pntlns, fogn=fogn, camn=camn,
         uvscrn=uvscrn, uvoffscn=uvoffscn, pntobrn=pntobrn, obrthr=obrthr,
         normal=normal, gloss=gloss_orig, glow=glow_orig,
         modcol=modcol, selfalpha=selfalpha)
 
+    shader = make_glsl_shader("make_shader", shdkey, vshstr, fshstr,
+                              extra=kwargs)
+
     _shader_cache[shdkey] = (shader, kwargs)
 
     if getargs:
@@ -959,6 +1156,7 @@ def make_stores_shader (world, normal=False, glow=False, gloss=False):
 
 
 _blur_shader_cache = {}
+register_shader_maker("make_blur_shader", _blur_shader_cache, _this_path)
 
 def make_blur_shader (dir, size, numsamples, randrot=False,
                       hfac=1.0, desat=0.0, showas=False):
@@ -1079,7 +1277,7 @@ void main ()
     if showas:
         printsh((vshstr, fshstr), showas)
 
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    shader = make_glsl_shader("make_blur_shader", shdkey, vshstr, fshstr)
 
     _blur_shader_cache[shdkey] = shader
     return shader
@@ -1114,6 +1312,7 @@ def _blur_distrib (x, size):
 
 
 _desat_shader_cache = {}
+register_shader_maker("make_desat_shader", _desat_shader_cache, _this_path)
 
 def make_desat_shader (avgfac=Vec3(0.30, 0.59, 0.11), desfacn=None,
                        raddesn=None, raddarkn=None,
@@ -1366,13 +1565,14 @@ void main ()
     if showas:
         printsh((vshstr, fshstr), showas)
 
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    shader = make_glsl_shader("make_desat_shader", shdkey, vshstr, fshstr)
 
     _desat_shader_cache[shdkey] = shader
     return shader
 
 
 _bloom_shader_cache = {}
+register_shader_maker("make_bloom_shader", _bloom_shader_cache, _this_path)
 
 def make_bloom_shader (limbrthr=1.0, limbrfac=1.0, visiblen=None,
                        showas=False):
@@ -1449,13 +1649,14 @@ void main ()
     if showas:
         printsh((vshstr, fshstr), showas)
 
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    shader = make_glsl_shader("make_bloom_shader", shdkey, vshstr, fshstr)
 
     _bloom_shader_cache[shdkey] = shader
     return shader
 
 
 _text_shader_cache = {}
+register_shader_maker("make_text_shader", _text_shader_cache, _this_path)
 
 def make_text_shader (shadow=False, glow=False, showas=None):
 
@@ -1591,12 +1792,13 @@ void main ()
 
     if showas:
         printsh((vshstr, fshstr), showas)
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    shader = make_glsl_shader("make_text_shader", shdkey, vshstr, fshstr)
     _text_shader_cache[shdkey] = shader
     return shader
 
 
 _shadow_shader_cache = {}
+register_shader_maker("make_shadow_shader", _shadow_shader_cache, _this_path)
 
 def make_shadow_shader (showas=False):
 
@@ -1641,7 +1843,7 @@ void main ()
     if showas:
         printsh((vshstr, fshstr), showas)
 
-    shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+    shader = make_glsl_shader("make_shadow_shader", shdkey, vshstr, fshstr)
 
     _shadow_shader_cache[shdkey] = shader
     return shader
@@ -1,9 +1,10 @@
 # -*- coding: UTF-8 -*-
 
 from sys import float_info
-from math import degrees, radians, pi, exp, atan
+from array import array
+from math import degrees, radians, pi, exp, atan, floor, sqrt
 
-from pandac.PandaModules import Vec3, Point3
+from pandac.PandaModules import Vec3, Point3, NodePath
 from pandac.PandaModules import ColorBlendAttrib
 
 from src import internal_path, join_path
@@ -15,6 +16,7 @@ from src.core.misc import get_cache_key_section
 from src.core.misc import read_cache_object, write_cache_object
 from src.core.misc import solve_linsys_3
 from src.core.misc import intl01v
+from src.core.misc import segment_point_dist
 from src.core.misc import uniform, randunit
 from src.core.misc import dbgval
 from src.core.sound import Sound3D, Sound2D
@@ -146,16 +148,7 @@ class Shell (Body):
         #if False:
         if self._vpuff and self.world.below_surface(self._pos):
             posg = self.world.intersect_surface(self._pos - self._vel * self.world.dt, self._pos)
-            size = 10.0 * (self.caliber / 0.030)
-            # Splash(world=self.world, pos=posg, size=3.0, relsink=0.5,
-                   # numquads=1, texture="images/particles/effects-rocket-exp-3.png",
-                   # texsplit=8, fps=24, numframes=28,
-                   # glowmap="images/particles/effects-rocket-exp-3_gw.png")
-            PolyExplosion(
-                world=self.world, pos=posg,
-                fireglow=rgba(255, 255, 255, 1.0),
-                firepool=1, smokepool=0,
-                sizefac=1.2, timefac=0.1, amplfac=-1)
+            _make_ground_puff(self.world, posg)
             self.destroy()
             return task.done
 
@@ -200,17 +193,7 @@ class Shell (Body):
         if inert:
             return True
 
-        if self.world.player and obody is self.world.player.ac:
-            snd = Sound3D(
-                "audio/sounds/cockpit-hit.ogg",
-                parent=obody, singleat=True,
-                volume=0.8, loop=0.2, fadetime=0.01)
-        else:
-            snd = Sound3D(
-                "audio/sounds/flight-hit.ogg",
-                parent=obody, singleat=True,
-                volume=0.8, loop=0.2, fadetime=0.01)
-        snd.play()
+        _play_hit_sound(self.world, obody)
 
         if not self._visible:
             self.destroy()
@@ -280,6 +263,357 @@ class Shell (Body):
                    (offmuzzle, "%6.1f", "offmuzzle", "m"))
 
 
+def _play_hit_sound (world, obody):
+
+    if world.player and obody is world.player.ac:
+        sndpath = "audio/sounds/cockpit-hit.ogg"
+    else:
+        sndpath = "audio/sounds/flight-hit.ogg"
+    snd = Sound3D(sndpath, parent=obody, singleat=True,
+                  volume=0.8, loop=0.2, fadetime=0.01)
+    snd.play()
+
+
+def _make_ground_puff (world, posg):
+
+    # Splash(world=world, pos=posg, size=3.0, relsink=0.5,
+           # numquads=1, texture="images/particles/effects-rocket-exp-3.png",
+           # texsplit=8, fps=24, numframes=28,
+           # glowmap="images/particles/effects-rocket-exp-3_gw.png")
+    PolyExplosion(
+        world=world, pos=posg,
+        fireglow=rgba(255, 255, 255, 1.0),
+        firepool=1, smokepool=0,
+        sizefac=1.2, timefac=0.1, amplfac=-1)
+
+
+class ShellSwarm (object):
+    """
+    Pool of invisible cannon shells in a world.
+
+    Shells which are not visible do not need to be bodies.
+    Their state is kept in flat arrays, and all of them are moved
+    and tested for hits in a single task.
+    Hits are tested by sweeping the segment of shell motion in the frame
+    against hitboxes of bodies near the shell, and reported to the
+    hit body through a ShellHit in place of the shell body.
+
+    There is one swarm per world, obtained by for_world().
+    """
+
+    # Size of cells for grouping shells to query nearby bodies.
+    _cellsize = 1000.0
+    # Maximum distance of hitbox surfaces from the body position.
+    _maxreach = 500.0
+
+    def __init__ (self, world):
+
+        self.world = world
+
+        self._px = array("d")
+        self._py = array("d")
+        self._pz = array("d")
+        self._vx = array("d")
+        self._vy = array("d")
+        self._vz = array("d")
+        self._ax = array("d")
+        self._ay = array("d")
+        self._az = array("d")
+        self._dist = array("d")
+        self._effrange = array("d")
+        self._vpuff = array("b")
+        self._stype = []
+        self._initiator = []
+        self._columns = (self._px, self._py, self._pz,
+                         self._vx, self._vy, self._vz,
+                         self._ax, self._ay, self._az,
+                         self._dist, self._effrange, self._vpuff,
+                         self._stype, self._initiator)
+
+        self.alive = True
+        # Should run after world pre-loop has moved the bodies,
+        # and before cannons add new shells in the frame.
+        base.taskMgr.add(self._loop, "shell-swarm-loop", sort=-5)
+
+
+    @staticmethod
+    def for_world (world):
+
+        swarm = world.shell_swarm
+        if swarm is None or not swarm.alive:
+            swarm = ShellSwarm(world)
+            world.shell_swarm = swarm
+        return swarm
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+        for col in self._columns:
+            del col[:]
+
+
+    def add (self, stype, pos, vel, acc, effrange,
+             initdt=0.0, vpuff=False, initiator=None):
+        """
+        Add a shell of given type to the swarm.
+
+        Parameters are the same as for the shell body.
+        """
+
+        self._px.append(pos[0])
+        self._py.append(pos[1])
+        self._pz.append(pos[2])
+        self._vx.append(vel[0])
+        self._vy.append(vel[1])
+        self._vz.append(vel[2])
+        self._ax.append(acc[0])
+        self._ay.append(acc[1])
+        self._az.append(acc[2])
+        self._dist.append(0.0)
+        self._effrange.append(effrange)
+        self._vpuff.append(1 if vpuff else 0)
+        self._stype.append(stype)
+        self._initiator.append(initiator)
+
+        if initdt != 0.0:
+            self._move(len(self._px) - 1, initdt)
+
+
+    def count (self):
+
+        return len(self._px)
+
+
+    def any_within (self, pos, radius):
+        """
+        Return True if any shell is within the given distance of the position.
+        """
+
+        x, y, z = pos[0], pos[1], pos[2]
+        radius2 = radius**2
+        px, py, pz = self._px, self._py, self._pz
+        for i in xrange(len(px)):
+            if (px[i] - x)**2 + (py[i] - y)**2 + (pz[i] - z)**2 <= radius2:
+                return True
+        return False
+
+
+    def _move (self, i, dt):
+
+        hdt2 = 0.5 * dt**2
+        ax, ay, az = self._ax[i], self._ay[i], self._az[i]
+        dx = self._vx[i] * dt + ax * hdt2
+        dy = self._vy[i] * dt + ay * hdt2
+        dz = self._vz[i] * dt + az * hdt2
+        self._px[i] += dx
+        self._py[i] += dy
+        self._pz[i] += dz
+        self._vx[i] += ax * dt
+        self._vy[i] += ay * dt
+        self._vz[i] += az * dt
+        self._dist[i] += sqrt(dx**2 + dy**2 + dz**2)
+
+
+    def _remove (self, indices):
+
+        # Fill removed slots from the end, highest index first,
+        # so that moved shells are never among those still to remove.
+        for i in sorted(indices, reverse=True):
+            for col in self._columns:
+                col[i] = col[-1]
+                col.pop()
+
+
+    def _loop (self, task):
+
+        if not self.alive:
+            return task.done
+        world = self.world
+        if not world.alive:
+            self.destroy()
+            return task.done
+
+        dt = world.dt
+        num = len(self._px)
+        if dt == 0.0 or num == 0:
+            return task.cont
+
+        px, py, pz = self._px, self._py, self._pz
+        vx, vy, vz = self._vx, self._vy, self._vz
+        ax, ay, az = self._ax, self._ay, self._az
+        dist, effrange = self._dist, self._effrange
+        vpuff, stype = self._vpuff, self._stype
+
+        # Move all shells, and collect segments of those armed.
+        hdt2 = 0.5 * dt**2
+        done = set()
+        armed = []
+        puffing = []
+        for i in xrange(num):
+            x0, y0, z0 = px[i], py[i], pz[i]
+            dx = vx[i] * dt + ax[i] * hdt2
+            dy = vy[i] * dt + ay[i] * hdt2
+            dz = vz[i] * dt + az[i] * hdt2
+            px[i] = x0 + dx
+            py[i] = y0 + dy
+            pz[i] = z0 + dz
+            vx[i] += ax[i] * dt
+            vy[i] += ay[i] * dt
+            vz[i] += az[i] * dt
+            d = dist[i] + sqrt(dx**2 + dy**2 + dz**2)
+            dist[i] = d
+            if d >= effrange[i]:
+                done.add(i)
+                continue
+            if d > stype[i]._hbxlen:
+                armed.append((i, x0, y0, z0))
+            if vpuff[i]:
+                puffing.append((i, x0, y0, z0))
+
+        # Evaluate hits.
+        for i, body, chbx, cpos in self._find_hits(armed):
+            done.add(i)
+            shit = ShellHit(world, stype[i], self._initiator[i],
+                            Point3(px[i], py[i], pz[i]),
+                            Vec3(vx[i], vy[i], vz[i]))
+            body.collide(shit, chbx, cpos)
+            _play_hit_sound(world, body)
+
+        # Evaluate ground hits.
+        for i, x0, y0, z0 in puffing:
+            if i in done:
+                continue
+            pos = Point3(px[i], py[i], pz[i])
+            if world.below_surface(pos):
+                posg = world.intersect_surface(Point3(x0, y0, z0), pos)
+                _make_ground_puff(world, posg)
+                done.add(i)
+
+        if done:
+            self._remove(done)
+
+        return task.cont
+
+
+    def _find_hits (self, segs):
+
+        world = self.world
+        wnode = world.node
+        px, py, pz = self._px, self._py, self._pz
+        stype = self._stype
+
+        # Group segments by horizontal cell, to query bodies once per group.
+        cs = self._cellsize
+        groups = {}
+        for seg in segs:
+            i = seg[0]
+            ckey = (int(floor(px[i] / cs)), int(floor(py[i] / cs)))
+            group = groups.get(ckey)
+            if group is None:
+                group = []
+                groups[ckey] = group
+            group.append(seg)
+
+        hits = []
+        for group in groups.itervalues():
+            xs = [px[s[0]] for s in group] + [s[1] for s in group]
+            ys = [py[s[0]] for s in group] + [s[2] for s in group]
+            zs = [pz[s[0]] for s in group] + [s[3] for s in group]
+            xmin, xmax = min(xs), max(xs)
+            ymin, ymax = min(ys), max(ys)
+            zmin, zmax = min(zs), max(zs)
+            gpos = Point3(0.5 * (xmin + xmax), 0.5 * (ymin + ymax),
+                          0.5 * (zmin + zmax))
+            grad = 0.5 * sqrt((xmax - xmin)**2 + (ymax - ymin)**2 +
+                              (zmax - zmin)**2)
+            targets = []
+            for body in world.bodies_within(gpos, grad + self._maxreach):
+                hbxs = [h for h in body.hitboxes if h.isinto and h.active]
+                if not hbxs:
+                    continue
+                brad = max(h.center.length() + h.radius for h in hbxs)
+                targets.append((body, hbxs, body.pos(), brad))
+            if not targets:
+                continue
+
+            for i, x0, y0, z0 in group:
+                p0 = Point3(x0, y0, z0)
+                p1 = Point3(px[i], py[i], pz[i])
+                rad = stype[i]._hbxrad
+                initiator = self._initiator[i]
+                hit = None
+                for body, hbxs, bpos, brad in targets:
+                    if body is initiator:
+                        # Segment starts at the muzzle, inside the firer.
+                        continue
+                    if segment_point_dist(p0, p1, bpos) > brad + rad:
+                        continue
+                    lp0 = body.node.getRelativePoint(wnode, p0)
+                    lp1 = body.node.getRelativePoint(wnode, p1)
+                    for hbx in hbxs:
+                        t = hbx.sweep_param(lp0, lp1, rad)
+                        if t is not None and (hit is None or t < hit[0]):
+                            cpos = lp0 + (lp1 - lp0) * t
+                            hit = (t, body, hbx, cpos)
+                if hit is not None:
+                    t, body, hbx, cpos = hit
+                    hits.append((i, body, hbx, cpos))
+
+        return hits
+
+
+class ShellHit (object):
+    """
+    Shell from a swarm, as seen by the body it hit.
+    """
+
+    family = "shell"
+    name = ""
+    passhitfx = True
+    hits_critical = True
+    alive = False
+
+    def __init__ (self, world, stype, initiator, pos, vel):
+
+        self.world = world
+        self.species = stype.species
+        self.caliber = stype.caliber
+        self.mass = stype.mass
+        self.hitforce = stype.hitforce
+        self.initiator = initiator
+        self._pos = pos
+        self._vel = vel
+
+
+    def _res_refnode (self, refbody):
+
+        if refbody is None:
+            refnode = self.world.node
+        elif isinstance(refbody, NodePath):
+            refnode = refbody
+        else:
+            refnode = refbody.node
+        return refnode
+
+
+    def pos (self, refbody=None, offset=None):
+
+        pos = self._pos
+        if offset is not None:
+            pos = pos + offset
+        refnode = self._res_refnode(refbody)
+        return refnode.getRelativePoint(self.world.node, pos)
+
+
+    def vel (self, refbody=None):
+
+        refnode = self._res_refnode(refbody)
+        return refnode.getRelativeVector(self.world.node, self._vel)
+
+
 class Cannon (object):
     """
     Generic cannon.
@@ -541,10 +875,15 @@ class Cannon (object):
                     isvis = False
                     isvzmd = False
                 isvpf = (self.ammo % self._vpfeach == 0)
-                shell = self.stype(self.world, spos, shpr, vel, acc, effrange,
-                                   initdt=ltime, visible=isvis, vzoomed=isvzmd,
-                                   vpuff=isvpf, target=self._target)
-                shell.initiator = self.parent
+                if isvis or isvzmd or self._target or self.stype._monpath:
+                    shell = self.stype(self.world, spos, shpr, vel, acc, effrange,
+                                       initdt=ltime, visible=isvis, vzoomed=isvzmd,
+                                       vpuff=isvpf, target=self._target)
+                    shell.initiator = self.parent
+                else:
+                    swarm = ShellSwarm.for_world(self.world)
+                    swarm.add(self.stype, spos, vel, acc, effrange,
+                              initdt=ltime, vpuff=isvpf, initiator=self.parent)
                 #if self.world.player and self.parent is self.world.player.ac:
                     #self.world.player.record_release(shell)
                 if self._fire_rounds > 0:
@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 
 from math import pi, radians, degrees, ceil, sin, cos, atan2, exp
+from array import array
 import os
 from shutil import rmtree
 from time import time
@@ -181,6 +182,8 @@ class Sky (object):
 
         self._updwait_slow = 0.0
         self._updperiod_slow = 4.87
+        self._updwait_colors = 0.0
+        self._updperiod_colors = 0.31
         self._updwait_fast = 0.0
         self._updperiod_fast = 0.043
 
@@ -215,6 +218,22 @@ class Sky (object):
 
         self._sun_halo_rot_fac = 2.0
 
+        # Interpolated day cycle, baked at regular times of day,
+        # for lookup on CPU and sampling in shaders.
+        self._day_table_size = 256
+        self._day_table, self._day_table_tex = self._make_day_table()
+        shdinp = self.world.shdinp
+        self.world.node.setShaderInput(shdinp.daytabn, self._day_table_tex)
+        self._daytime_spec = AmbientLight(shdinp.daytimen)
+        self.world.node.setShaderInput(shdinp.daytimen,
+                                       NodePath(self._daytime_spec))
+        # Without altitude modification, the dome samples its colors
+        # from the table, and they are not set on CPU at all.
+        if self.dome and not self._need_alt_color_mod:
+            numqs = len(self._day_table[0])
+            self.dome.set_day_table(shdinp.daytabn, shdinp.daytimen,
+                                    (4 + 0.5) / numqs, (5 + 0.5) / numqs)
+
         self.alive = True
         # Should come before body loops.
         task = base.taskMgr.add(self._loop, "sky-loop", sort=-1)
@@ -231,95 +250,60 @@ class Sky (object):
 
         eff_dt = self.world.dt * self.world.day_time_factor
 
-        if self.world.frame < 3:
-            self._updwait_slow = 0.0
-        self._updwait_slow -= eff_dt
-        if self._updwait_slow <= 0.0:
-            self._updwait_slow += self._updperiod_slow
+        # Day time for sampling the day table in shaders,
+        # offset to the centers of table texels.
+        t0 = self.world.day_time
+        dtfac = t0 / self.world.day_period + 0.5 / self._day_table_size
+        self._daytime_spec.setColor(Vec4(dtfac, 0.0, 0.0, 0.0))
 
-            ntpts = len(self._timepts)
-            t0 = self.world.day_time
-            for i1 in range(ntpts):
-                i2 = (i1 + 1) % ntpts
-                t1 = self._timepts[i1]
-                t2 = self._timepts[i2]
-                if t2 > t1:
-                    t = t0
-                    if t1 <= t < t2:
-                        break
-                else:
-                    t2 += self.world.day_period
-                    t = t0
-                    if t < t1:
-                        t += self.world.day_period
-                    if t1 <= t < t2:
-                        break
-            #(6, 12, 18, 0)
-            #(8, 14, 20, 2)
-            #(4, 10, 16, 22)
-            ifac_lin = (t - t1) / (t2 - t1)
-            ipw = self._cintpows[i1]
-            if ipw > 0.0:
-                ifac = ifac_lin**ipw
-            else:
-                ifac = 1.0 - (1.0 - ifac_lin)**(-ipw)
-
-            cs = self._suncolors
-            c = cs[i1] + (cs[i2] - cs[i1]) * ifac
-            self.sunlight.node().setColor(c)
-            # if self.sun:
-                # self.sun.node.setColorScale(c)
+        # Colors are only looked up in the day table,
+        # so they can be updated often enough not to change in steps.
+        if self.world.frame < 3:
+            self._updwait_colors = 0.0
+        self._updwait_colors -= eff_dt
+        if self._updwait_colors <= 0.0:
+            self._updwait_colors += self._updperiod_colors
 
-            cs = self._mooncolors
-            c = cs[i1] + (cs[i2] - cs[i1]) * ifac
-            self.moonlight.node().setColor(c)
-            # if self.moon:
-                # self.moon.node.setColorScale(c)
+            ret = self._day_values(t0)
+            sunc, moonc, ambc, ambsmc, sc, fc, sdc, sbc, shsc, sa, visst = ret
 
-            cs = self._ambientcolors
-            c = cs[i1] + (cs[i2] - cs[i1]) * ifac
-            self.amblight.node().setColor(c)
-            fs = self._ambientsmokefacs
-            f = fs[i1] + (fs[i2] - fs[i1]) * ifac
-            cavg = min(((c[0] + c[1] + c[2]) / 3) * f, 1.0)
-            c = Vec4(cavg, cavg, cavg, 1.0)
-            self.amblight_smoke.node().setColor(c)
+            self.sunlight.node().setColor(sunc)
+            self.moonlight.node().setColor(moonc)
+            self.amblight.node().setColor(ambc)
+            self.amblight_smoke.node().setColor(ambsmc)
 
             if self.dome:
-                scs = self._skycolors
-                sc = scs[i1] + (scs[i2] - scs[i1]) * ifac
                 self._curr_color_sky = sc
             if self.dome or self.fog:
-                fcs = self._fogcolors
-                fc = fcs[i1] + (fcs[i2] - fcs[i1]) * ifac
                 self._curr_color_fog = fc
             if self.fog and not self._need_alt_color_mod:
                 self.fog.set_color(fc)
             if self.sun:
-                sdcs = self._sundiskcolors
-                sdc = sdcs[i1] + (sdcs[i2] - sdcs[i1]) * ifac
                 self.sun.node.setColorScale(sdc)
                 scalenode = self.sun.halonode or self.sun.sunnode
-                shscs = self._sunhaloscales
-                shsc = shscs[i1] + (shscs[i2] - shscs[i1]) * ifac
-                scalenode.setScale(shsc)
+                scalenode.setScale(shsc[0])
                 self._curr_color_sdc = sdc
-                sbcs = self._sunbrightcolors
-                sbc = sbcs[i1] + (sbcs[i2] - sbcs[i1]) * ifac
                 self.sun_bright_color = sbc
             elif self.dome:
                 sdc = sc
                 self._curr_color_sdc = sdc
             if self.moon:
-                mas = self._staralphas
-                ma = mas[i1] + (mas[i2] - mas[i1]) * ifac
-                self.moon.node.setSa(ma)
+                self.moon.node.setSa(sa[0])
             if self.stars:
-                sas = self._staralphas
-                sa = sas[i1] + (sas[i2] - sas[i1]) * ifac
-                self.stars.node.setSa(sa)
-            if self.dome and not self._need_alt_color_mod:
-                self.dome.set_color(sc, fc)
+                self.stars.node.setSa(sa[0])
+
+            self.relative_visibility = visst[0]
+
+            self.sun_strength = visst[1]
+
+        # After colors, for correct first update.
+        if self.world.frame < 3:
+            self._updwait_slow = 0.0
+        self._updwait_slow -= eff_dt
+        if self._updwait_slow <= 0.0:
+            self._updwait_slow += self._updperiod_slow
+
+            i1, i2, ifac_lin = self._day_interval(t0)
 
             h1, h2 = self._sunhdgs[i1], self._sunhdgs[i2]
             if h2 > h1:
@@ -356,16 +340,8 @@ class Sky (object):
                 h = h1 + (h2 - h1) * ifac_lin
                 self.stars.node.setHpr(h, 0, 0)
 
-            rvs = self._relative_visibilities
-            rv = rvs[i1] + (rvs[i2] - rvs[i1]) * ifac
-            self.relative_visibility = rv
-
             self.sun_dir = -hprtovec(self.sunlight.getHpr(self.world.node))
 
-            sts = self._sun_strengths
-            st = sts[i1] + (sts[i2] - sts[i1]) * ifac
-            self.sun_strength = st
-
             for terrain in self.world.terrains:
                 for ngfn1 in terrain.nightglowfacn:
                     terrain.node.setShaderInput(ngfn1, 1.0 - self.sun_strength)
@@ -412,6 +388,105 @@ class Sky (object):
         return task.cont
 
 
+    def _day_interval (self, t0):
+
+        ntpts = len(self._timepts)
+        for i1 in range(ntpts):
+            i2 = (i1 + 1) % ntpts
+            t1 = self._timepts[i1]
+            t2 = self._timepts[i2]
+            if t2 > t1:
+                t = t0
+                if t1 <= t < t2:
+                    break
+            else:
+                t2 += self.world.day_period
+                t = t0
+                if t < t1:
+                    t += self.world.day_period
+                if t1 <= t < t2:
+                    break
+        #(6, 12, 18, 0)
+        #(8, 14, 20, 2)
+        #(4, 10, 16, 22)
+        ifac_lin = (t - t1) / (t2 - t1)
+        return i1, i2, ifac_lin
+
+
+    def _make_day_table (self):
+
+        def ipc (cs, i1, i2, ifac):
+            if cs is None:
+                return Vec4()
+            c = cs[i1] + (cs[i2] - cs[i1]) * ifac
+            if isinstance(c, (float, int)):
+                c = Vec4(c, 0.0, 0.0, 0.0)
+            return Vec4(c)
+
+        size = self._day_table_size
+        dp = self.world.day_period
+        table = []
+        for k in xrange(size):
+            t0 = dp * (float(k) / size)
+            i1, i2, ifac_lin = self._day_interval(t0)
+            ipw = self._cintpows[i1]
+            if ipw > 0.0:
+                ifac = ifac_lin**ipw
+            else:
+                ifac = 1.0 - (1.0 - ifac_lin)**(-ipw)
+
+            ambc = ipc(self._ambientcolors, i1, i2, ifac)
+            f = ipc(self._ambientsmokefacs, i1, i2, ifac)[0]
+            cavg = min(((ambc[0] + ambc[1] + ambc[2]) / 3) * f, 1.0)
+            ambsmc = Vec4(cavg, cavg, cavg, 1.0)
+            rv = ipc(self._relative_visibilities, i1, i2, ifac)[0]
+            st = ipc(self._sun_strengths, i1, i2, ifac)[0]
+            table.append([
+                ipc(self._suncolors, i1, i2, ifac),
+                ipc(self._mooncolors, i1, i2, ifac),
+                ambc,
+                ambsmc,
+                ipc(self._skycolors, i1, i2, ifac),
+                ipc(self._fogcolors, i1, i2, ifac),
+                ipc(self._sundiskcolors, i1, i2, ifac),
+                ipc(self._sunbrightcolors, i1, i2, ifac),
+                ipc(self._sunhaloscales, i1, i2, ifac),
+                ipc(self._staralphas, i1, i2, ifac),
+                Vec4(rv, st, 0.0, 0.0),
+            ])
+
+        # Texture with time along u and quantity along v.
+        # Texture RAM images are in BGRA component order.
+        numqs = len(table[0])
+        data = array("f")
+        for iq in xrange(numqs):
+            for k in xrange(size):
+                c = table[k][iq]
+                data.extend((c[2], c[1], c[0], c[3]))
+        tex = Texture("day-table")
+        tex.setup2dTexture(size, numqs, Texture.TFloat, Texture.FRgba32)
+        tex.setRamImage(data.tostring())
+        tex.setWrapU(Texture.WMRepeat)
+        tex.setWrapV(Texture.WMClamp)
+        tex.setMinfilter(Texture.FTLinear)
+        tex.setMagfilter(Texture.FTLinear)
+
+        return table, tex
+
+
+    def _day_values (self, t0):
+
+        size = self._day_table_size
+        x = (t0 / self.world.day_period) * size
+        k1 = int(x)
+        f = x - k1
+        k1 %= size
+        k2 = (k1 + 1) % size
+        row1 = self._day_table[k1]
+        row2 = self._day_table[k2]
+        return [c1 + (c2 - c1) * f for c1, c2 in zip(row1, row2)]
+
+
     def _mod_color_alt (self, col, altfac, alt):
 
         acmr, acmg, acmb = [exp(alt * f) for f in altfac]
@@ -488,6 +563,7 @@ class Dome (object):
         self._shdinp = SimpleProps()
         self._shdinp.basecoln = "INbasecol"
         self._shdinp.horizcoln = "INhorizcol"
+        self._sunblend = sunblend
         shader = Dome._make_shader(self.world.shdinp.camn,
                                    self._shdinp.basecoln,
                                    self._shdinp.horizcoln,
@@ -641,13 +717,19 @@ class Dome (object):
 
     @staticmethod
     def _make_shader (camn, basecoln, horizcoln,
-                      sunblend, sunposn, sunbcoln):
+                      sunblend, sunposn, sunbcoln,
+                      daytabn=None, daytimen=None, basecolv=0.0, horizcolv=0.0):
 
         if not sunblend:
             camn = None
+        if not daytabn:
+            daytimen = None
+            basecolv = 0.0
+            horizcolv = 0.0
 
         shdkey = (camn, basecoln, horizcoln,
-                  tuple(sunblend), sunposn, sunbcoln)
+                  tuple(sunblend), sunposn, sunbcoln,
+                  daytabn, daytimen, basecolv, horizcolv)
         shader = Dome._shader_cache.get(shdkey)
         if shader is not None:
             return shader
@@ -666,6 +748,11 @@ struct HorizColSpec {
 };
 uniform HorizColSpec %(basecoln)s;
 uniform HorizColSpec %(horizcoln)s;
+""" % locals()
+        if daytabn:
+            vshstr += """
+uniform sampler2D %(daytabn)s;
+uniform HorizColSpec %(daytimen)s;
 """ % locals()
         if sunblend:
             vshstr += """
@@ -683,9 +770,19 @@ out vec4 l_bloom;
 void main ()
 {
     gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
-
+""" % locals()
+        if daytabn:
+            vshstr += """
+    float daytime = %(daytimen)s.ambient.x;
+    vec4 basecol = textureLod(%(daytabn)s, vec2(daytime, %(basecolv)f), 0.0);
+    vec4 horizcol = textureLod(%(daytabn)s, vec2(daytime, %(horizcolv)f), 0.0);
+""" % locals()
+        else:
+            vshstr += """
     vec4 basecol = %(basecoln)s.ambient;
     vec4 horizcol = %(horizcoln)s.ambient;
+""" % locals()
+        vshstr += """
     float altblfac = p3d_Color.a;
     l_color.rgb = mix(basecol.rgb, horizcol.rgb, altblfac);
     l_bloom = vec4(0.0, 0.0, 0.0, 0.0);
@@ -764,6 +861,22 @@ void main ()
         self._horizcol_spec.setColor(horizcol)
 
 
+    def set_day_table (self, daytabn, daytimen, basecolv, horizcolv):
+        """
+        Sample base and horizon colors from the day table in the shader,
+        at given v-coordinates, instead of taking them from set_color().
+        """
+
+        shader = Dome._make_shader(self.world.shdinp.camn,
+                                   self._shdinp.basecoln,
+                                   self._shdinp.horizcoln,
+                                   self._sunblend,
+                                   self.world.shdinp.sunposn,
+                                   self.world.shdinp.sunbcoln,
+                                   daytabn, daytimen, basecolv, horizcolv)
+        self.node.setShader(shader)
+
+
 class Fog (object):
 
     def __init__ (self, world, onsetdist=None, opaquedist=None,
@@ -4,7 +4,7 @@ from pandac.PandaModules import AudioSound
 from pandac.PandaModules import Vec3
 
 from src import full_path
-from src.core.misc import AutoProps
+from src.core.misc import AutoProps, SimpleProps
 from src.core.misc import dbgval
 
 
@@ -132,15 +132,226 @@ def _sound_report (event, sndprop):
                ((sp.is3d and "3d" or "2d"), "%s", "dim"))
 
 
+class SoundMixer (object):
+    """
+    Mixer of all 3D sounds.
+
+    Every playing Sound3D is a virtual voice, whose fading and play time
+    are advanced here, in one task for all voices. Only the most audible
+    voices, ranked by volume, distance to the listener and priority,
+    are given real audio sounds, up to a fixed number.
+    A voice rising in the ranking takes over a real sound at its
+    current play time, and a voice falling out of it has its real sound
+    stopped and returned to the pool.
+
+    Real sounds are pooled by path and reused, so that the data
+    of each sound file is loaded and decoded once.
+
+    There is one mixer, obtained by get().
+    """
+
+    _instance = [None]
+
+    def __init__ (self, maxreal):
+
+        self._maxreal = maxreal
+
+        self._voices = []
+        self._slots = {}
+
+        self._free_sounds = {}
+        self._lengths = {}
+
+        # The loop should run after world's post-loop,
+        # and before 3D audio manager's update loop,
+        # in order to detach sounds from removed bodies before
+        # the audio manager triples on removed nodes.
+        base.taskMgr.add(self._loop, "sound3d-mixer", sort=20)
+
+
+    @staticmethod
+    def get ():
+
+        mixer = SoundMixer._instance[0]
+        if mixer is None:
+            mixer = SoundMixer(maxreal=base.sound_max_voices)
+            SoundMixer._instance[0] = mixer
+        return mixer
+
+
+    def sound_length (self, path):
+
+        length = self._lengths.get(path)
+        if length is None:
+            sound = self._acquire(path)
+            length = sound.length()
+            self._release(path, sound)
+            self._lengths[path] = length
+        return length
+
+
+    def _acquire (self, path):
+
+        free = self._free_sounds.get(path)
+        if free:
+            return free.pop()
+        return _sound_load(path, base.audio3d_manager)
+
+
+    def _release (self, path, sound):
+
+        free = self._free_sounds.get(path)
+        if free is None:
+            free = []
+            self._free_sounds[path] = free
+        free.append(sound)
+
+
+    def add (self, voice):
+
+        self._voices.append(voice)
+        if voice._singleat:
+            skey = (voice._pnode.getKey(), voice._path)
+        else:
+            skey = voice._id
+        slot = self._slots.get(skey)
+        if slot is None:
+            slot = SimpleProps(key=skey, path=voice._path,
+                               pnode=voice._pnode, snode=None,
+                               parent=voice._parent, world=voice._world,
+                               mindist=voice._min_dist,
+                               maxdist=voice._max_dist,
+                               priority=voice._priority,
+                               voices=[], sound=None,
+                               volume=0.0, playtime=0.0, last_pos=None)
+            self._slots[skey] = slot
+        slot.voices.append(voice)
+        voice._slot = slot
+        voice._snode = slot.snode
+
+
+    def _remove (self, voice):
+
+        slot = voice._slot
+        voice._slot = None
+        slot.voices.remove(voice)
+        if not slot.voices:
+            if slot.sound is not None:
+                self._virtualize(slot)
+            if slot.snode is not None:
+                slot.snode.removeNode()
+            self._slots.pop(slot.key)
+
+
+    def _loop (self, task):
+
+        # Advance voices.
+        voices = self._voices
+        numvoices = len(voices)
+        kept = []
+        for i in xrange(numvoices):
+            voice = voices[i]
+            if voice._update():
+                kept.append(voice)
+            else:
+                voice._inloop = False
+                self._remove(voice)
+        kept.extend(voices[numvoices:])
+        self._voices = kept
+
+        # Rank slots by audibility.
+        ranked = []
+        for slot in self._slots.itervalues():
+            volume = 0.0
+            playtime = 0.0
+            for voice in slot.voices:
+                volume = max(volume, voice._current_volume)
+                playtime = max(playtime, voice._playtime)
+            slot.playtime = playtime
+            if slot.snode is None and slot.pnode.isEmpty():
+                # Attach sound to a temporary node, to stop properly.
+                if slot.last_pos is not None:
+                    slot.snode = slot.world.node.attachNewNode("sound-temp")
+                    slot.snode.setPos(slot.last_pos)
+                    if slot.sound is not None:
+                        base.audio3d_manager.attachSoundToObject(
+                            slot.sound, slot.snode)
+                    for voice in slot.voices:
+                        voice._snode = slot.snode
+                else:
+                    volume = 0.0
+            slot.target_volume = volume
+            if volume > 0.0 and slot.world.alive:
+                # Distance to the listener, which is the world camera.
+                snode = slot.snode or slot.pnode
+                dist = snode.getDistance(slot.world.camera)
+                audibility = (volume * slot.priority *
+                              slot.mindist / max(dist, slot.mindist))
+                if slot.sound is not None:
+                    audibility *= 1.2 # prefer keeping current real sounds
+                ranked.append((audibility, slot))
+        ranked.sort(key=lambda x: -x[0])
+
+        # Assign real sounds to the most audible slots.
+        real = set(slot.key for audibility, slot in ranked[:self._maxreal])
+        for slot in self._slots.itervalues():
+            if slot.sound is not None and slot.key not in real:
+                self._virtualize(slot)
+        for audibility, slot in ranked[:self._maxreal]:
+            if slot.sound is None:
+                self._realize(slot)
+            elif slot.volume != slot.target_volume:
+                slot.volume = slot.target_volume
+                slot.sound.setVolume(slot.volume)
+            if slot.snode is None:
+                slot.last_pos = slot.pnode.getPos(slot.world.node)
+                if base.with_sound_doppler:
+                    # Set sound velocity for Doppler effect.
+                    if hasattr(slot.parent, "vel"):
+                        svel = slot.parent.vel()
+                    else:
+                        svel = Vec3()
+                    base.audio3d_manager.setSoundVelocity(slot.sound, svel)
+
+        return task.cont
+
+
+    def _realize (self, slot):
+
+        sound = self._acquire(slot.path)
+        dist_scale = base.sound_distance_scale
+        sound.set3dMinDistance(slot.mindist / dist_scale)
+        sound.set3dMaxDistance(slot.maxdist / dist_scale)
+        sound.setLoop(True)
+        base.audio3d_manager.attachSoundToObject(sound,
+                                                 slot.snode or slot.pnode)
+        slot.volume = slot.target_volume
+        sound.setVolume(slot.volume)
+        # Real sounds always loop, so wrap play time to sound length.
+        length = self._lengths.get(slot.path)
+        if length is None:
+            length = sound.length()
+            self._lengths[slot.path] = length
+        starttime = slot.playtime % length if length > 0.0 else 0.0
+        _sound_start(sound, starttime)
+        slot.sound = sound
+        if slot.snode is None:
+            slot.last_pos = slot.pnode.getPos(slot.world.node)
+
+
+    def _virtualize (self, slot):
+
+        _sound_stop(slot.sound)
+        base.audio3d_manager.detachSound(slot.sound)
+        self._release(slot.path, slot.sound)
+        slot.sound = None
+        slot.volume = 0.0
+
+
 class Sound3D (object):
 
     _id_cnt = [0l]
 
-    _singleat_groups = {}
-    _singleat_cframes = {}
-    _singleat_cvols = {}
-    _singleat_ptimes = {}
-
     _limnum_maxs = {}
     _limnum_groups = {}
     _limnum_cframes = {}
@@ -148,7 +359,7 @@ class Sound3D (object):
 
     def __init__ (self, path, parent, subnode=None,
                   mindist=None, maxdist=None, limnum=None, singleat=False,
-                  volume=1.0, loop=False, fadetime=0.0,
+                  volume=1.0, loop=False, fadetime=0.0, priority=1.0,
                   play=False):
 
         self._id = self._id_cnt[0]
@@ -162,20 +373,13 @@ class Sound3D (object):
         self._singleat = singleat
         self._volume = volume
         self._fadetime = fadetime
+        self._priority = priority
 
         if subnode is not None:
             self._pnode = subnode
         else:
             self._pnode = parent.node
 
-        if singleat:
-            skey = (self._pnode, self._path)
-            if skey not in self._singleat_groups:
-                self._singleat_groups[skey] = []
-                self._singleat_cframes[skey] = None
-            self._singleat_group = self._singleat_groups[skey]
-            self._singleat_group.append(self)
-
         if limnum is not None:
             if limnum not in self._limnum_groups:
                 raise StandardError(
@@ -183,29 +387,21 @@ class Sound3D (object):
             self._limnum_group = self._limnum_groups[limnum]
             self._nearord = None
 
-        if not singleat or self._singleat_group[0] is self:
-            self._world = parent.world
-            self._sndmgr = base.audio3d_manager
-            self._sound = _sound_load(path, self._sndmgr)
-            dist_scale = base.sound_distance_scale
-            min_dist = self._mindist
-            if min_dist is None:
-                min_dist = (getattr(parent, "bboxdiag", 1.0) * 0.5) * 6.0 #2.0
-            self._sound.set3dMinDistance(min_dist / dist_scale)
-            max_dist = self._maxdist
-            if max_dist is None:
-                max_dist = 10000.0
-            self._sound.set3dMaxDistance(max_dist / dist_scale)
-            self._sound.setLoop(True)
-            self._snode = None
-        else:
-            self._world = self._singleat_group[0]._world
-            self._sndmgr = self._singleat_group[0]._sndmgr
-            self._sound = self._singleat_group[0]._sound
-            self._snode = self._singleat_group[0]._snode
+        self._world = parent.world
+        self._mixer = SoundMixer.get()
+        self._slot = None
+        self._snode = None
+        min_dist = self._mindist
+        if min_dist is None:
+            min_dist = (getattr(parent, "bboxdiag", 1.0) * 0.5) * 6.0 #2.0
+        self._min_dist = min_dist
+        max_dist = self._maxdist
+        if max_dist is None:
+            max_dist = 10000.0
+        self._max_dist = max_dist
 
         if loop is False:
-            self._duration = self._sound.length()
+            self._duration = self._mixer.sound_length(path)
         elif loop is True:
             self._duration = None
         elif isinstance(loop, (float, int)):
@@ -215,10 +411,8 @@ class Sound3D (object):
         self._stopping = False
         self._paused = False
         self._current_volume = 0.0
-        self._current_volume_mod = 0.0
         self._playtime = 0.0
         self._set_fading(fadetime)
-        self._last_pos = self._pnode.getPos(self._world.node)
 
         self._init_frame = self._world.frame
         self._inloop = False
@@ -227,7 +421,9 @@ class Sound3D (object):
             self.play()
 
 
-    def _loop (self, task):
+    def _update (self):
+        # Called by the mixer.
+        # Return False when the sound has ended.
 
         if self._init_frame == self._world.frame:
             dt = 0.0
@@ -238,32 +434,7 @@ class Sound3D (object):
             target_volume = 0.0
             self._stopping = True
             self._current_volume = 0.0
-        elif self._snode is None:
-            if self._pnode.isEmpty():
-                self._stopping = True
-                # Attach sound to a temporary node, to stop properly.
-                if not self._singleat or self._singleat_group[0] is self:
-                    #print "--sound-switch-to-snode", self._id, self._path, getattr(self._parent, "name", None), self._world.time, self._world.frame
-                    self._snode = self._world.node.attachNewNode("sound-temp")
-                    self._snode.setPos(self._last_pos)
-                    self._sndmgr.attachSoundToObject(self._sound, self._snode)
-                    if self._singleat:
-                        for sound in self._singleat_group[1:]:
-                            sound._snode = self._snode
-            else:
-                if self._first_inloop:
-                    if not self._singleat or self._singleat_group[0] is self:
-                        self._sndmgr.attachSoundToObject(self._sound, self._pnode)
-                self._last_pos = self._pnode.getPos(self._world.node)
-                if base.with_sound_doppler:
-                    # Set sound velocity for Doppler effect.
-                    if not self._singleat or self._singleat_group[0] is self:
-                        if hasattr(self._parent, "vel"):
-                            svel = self._parent.vel()
-                        else:
-                            svel = Vec3()
-                        self._sndmgr.setSoundVelocity(self._sound, svel)
-        else:
+        elif self._pnode.isEmpty():
             self._stopping = True
 
         if (self._duration is not None and
@@ -323,63 +494,18 @@ class Sound3D (object):
         else:
             next_volume = self._current_volume
 
-        if not self._singleat or self._singleat_group[0] is self:
-            if self._singleat:
-                skey = (self._pnode, self._path)
-                if self._singleat_cframes.get(skey) != self._world.frame:
-                    self._singleat_cframes[skey] = self._world.frame
-                    cvol = max(s._current_volume for s in self._singleat_group)
-                    ptime = max(s._playtime for s in self._singleat_group)
-                    self._singleat_cvols[skey] = cvol
-                    self._singleat_ptimes[skey] = ptime
-                next_volume_mod = max(next_volume, self._singleat_cvols[skey])
-                playtime_mod = max(self._playtime, self._singleat_ptimes[skey])
-            else:
-                next_volume_mod = next_volume
-                playtime_mod = self._playtime
-
-            #print "--sound-volume", self._id, self._path, getattr(self._parent, "name", None), next_volume_mod, playtime_mod, self._world.time, self._world.frame
-            if self._current_volume_mod != next_volume_mod:
-                self._current_volume_mod = next_volume_mod
-                if next_volume_mod > 0.0:
-                    self._sound.setVolume(next_volume_mod)
-                    if not self._playing:
-                        #print "--sound-starting", self._id, self._path, getattr(self._parent, "name", None), next_volume_mod, playtime_mod, self._world.time, self._world.frame
-                        _sound_start(self._sound, playtime_mod)
-                        self._playing = True
-                else:
-                    if self._playing:
-                        #print "--sound-stopping", self._id, self._path, getattr(self._parent, "name", None), next_volume_mod, playtime_mod, self._world.time, self._world.frame
-                        _sound_stop(self._sound)
-                        self._playing = False
-        else:
-            self._playing = self._singleat_group[0]._playing
-            self._snode = self._singleat_group[0]._snode
         self._current_volume = next_volume
+        self._playing = (next_volume > 0.0)
 
         self._playtime += dt
 
         if next_volume == 0.0 and self._stopping:
-            #print "--sound-end-loop", self._id, self._path, getattr(self._parent, "name", None), self._world.time, self._world.frame
-            if self._singleat:
-                self._singleat_group.remove(self)
-                if not self._singleat_group:
-                    self._singleat_groups.pop((self._pnode, self._path))
             if self._limnum is not None:
                 self._limnum_group.remove(self)
-            if not self._singleat or not self._singleat_group:
-                if self._playing:
-                    #print "--sound-stopping-outside", self._id, getattr(self._parent, "name", None), next_volume_mod, self._world.time, self._world.frame
-                    _sound_stop(self._sound)
-                self._sndmgr.detachSound(self._sound)
-                if self._snode is not None:
-                    self._snode.removeNode()
             self._stopping = False
-            self._inloop = False
-            return task.done
+            return False
 
-        self._first_inloop = False
-        return task.cont
+        return True
 
 
     def play (self, fadetime=None):
@@ -388,17 +514,11 @@ class Sound3D (object):
         if not self._paused:
             self._playtime = 0.0
         self._paused = False
-        # The loop should run after world's post-loop,
-        # and before 3D audio manager's update loop,
-        # in order to detach sounds from removed bodies before
-        # the audio manager triples on removed nodes.
         if not self._inloop:
             self._inloop = True
-            self._first_inloop = True
             if self._limnum:
                 self._limnum_group.append(self)
-            base.taskMgr.add(self._loop, "sound3d-playloop", sort=20)
-            #print "--sound-start-loop", self._id, self._path, getattr(self._parent, "name", None), self._world.time, self._world.frame
+            self._mixer.add(self)
 
 
     def stop (self, fadetime=None):
@@ -458,7 +578,7 @@ class Sound3D (object):
 
     def length (self):
 
-        return self._sound.length()
+        return self._mixer.sound_length(self._path)
 
 
     def pnode (self):
@@ -469,13 +589,6 @@ class Sound3D (object):
             return self._snode
 
 
-    if _track_sounds:
-        def __del__ (self):
-
-            if not self._singleat or not self._singleat_group:
-                _sound_unload(self._sound)
-
-
     @staticmethod
     def set_limnum_group (name, nmax, byord=False):
 
@@ -920,12 +1033,16 @@ class ActionMusic (object):
                    self._world.player.ac))
         if parent:
             if not self._always_attacked:
-                # Select all bodies friendly to parent (including parent).
-                friendlies = self._world.get_friendlies(self._attacked_families,
-                                                        parent.side)
+                # Bodies friendly to parent (including parent).
+                allied_sides = self._world.get_allied_sides(parent.side)
+                attacked_families = self._attacked_families
+                def friendly (body):
+                    return (body is not None and
+                            body.family in attacked_families and
+                            body.side in allied_sides)
                 # Check if any friendly under attack.
                 for body in parent.world.iter_bodies(self._attacking_families):
-                    if body not in friendlies and body.target in friendlies:
+                    if not friendly(body) and friendly(body.target):
                         if body.family == "rocket":
                             visdist = 20000.0
                             if getattr(body.target, "radarrange", None):
@@ -5,7 +5,8 @@ from bisect import bisect
 
 from pandac.PandaModules import PNMImage, Point2D
 
-from src import USE_COMPILED
+from src import USE_COMPILED, internal_path
+from src.core.misc import get_cache_key_section
 
 
 class Table1 (object):
@@ -43,42 +44,59 @@ class Table1 (object):
         return v
 
 
+    def many (self, p1s, clamp=False):
+        """
+        Evaluate the table at each parameter in the sequence.
+        """
+
+        return [self(p1, clamp) for p1 in p1s]
+
+
+# @cache-key-start: table-layout
 class Table2 (object):
     """
     Tabulated function of two parameters.
     Linear interpolation inside the range,
     linear or clamping extrapolation outside.
+
+    The second parameter may be given either as one sequence
+    shared by all values of the first parameter, or as one sequence
+    per value of the first parameter (ragged table).
+    Values are either numbers or equal-length sequences of numbers.
+
+    Data is stored in flat arrays, with per-row offsets
+    into the second parameter and the values.
     """
 
     def __init__ (self, p1, p2, v, name=None):
 
         self.name = name
 
-        self._p1 = tuple(p1)
-        if not isinstance(p2[0], float):
-            self._v = tuple(Table1(x, y) for x, y in zip(p2, v))
-        else:
-            self._v = tuple(Table1(p2, y) for y in v)
+        self._p1 = array("d", p1)
+        if isinstance(p2[0], float):
+            p2 = [p2] * len(self._p1)
+        self._o2 = array("l", [0])
+        self._p2 = array("d")
+        for p2r in p2:
+            self._p2.extend(p2r)
+            self._o2.append(len(self._p2))
+        self._nv, self._v = _flatten_values(y for vr in v for y in vr)
 
 
     def __call__ (self, p1, p2, clamp=False):
 
-        il, ir = _get_interp_indices(self._p1, p1)
-        p1l = self._p1[il]
-        p1r = self._p1[ir]
-        v1l = self._v[il](p2, clamp)
-        v1r = self._v[ir](p2, clamp)
-        if not clamp or p1l < p1 < p1r:
-            ifac = (p1 - p1l) / float(p1r - p1l)
-            if isinstance(v1l, (tuple, list)):
-                v = [(v1l1 + (v1r1 - v1l1) * ifac) for v1l1, v1r1 in zip(v1l, v1r)]
-            else:
-                v = v1l + (v1r - v1l) * ifac
-        elif p1 <= p1l:
-            return v1l
-        else: # p1 >= p1r
-            return v1r
-        return v
+        return _table2_value(self._p1, self._o2, self._p2,
+                             self._nv, self._v, p1, p2, clamp)
+
+
+    def many (self, pts, clamp=False):
+        """
+        Evaluate the table at each (p1, p2) pair in the sequence.
+        """
+
+        tp1, o2, tp2, nv, tv = self._p1, self._o2, self._p2, self._nv, self._v
+        return [_table2_value(tp1, o2, tp2, nv, tv, p1, p2, clamp)
+                for p1, p2 in pts]
 
 
 class Table3 (object):
@@ -86,48 +104,146 @@ class Table3 (object):
     Tabulated function of three parameters.
     Linear interpolation inside the range,
     linear or clamping extrapolation outside.
+
+    The second and the third parameter may be shared or ragged
+    in the same way as the second parameter of Table2.
+
+    Data is stored in flat arrays, with offsets into the second
+    parameter per first parameter row, and offsets into the third
+    parameter and the values per second parameter point.
     """
 
     def __init__ (self, p1, p2, p3, v, name=None):
 
         self.name = name
 
-        self._p1 = tuple(p1)
-        if not isinstance(p2[0], float):
-            self._v = tuple(Table2(x, y, z) for x, y, z in zip(p2, p3, v))
-        else:
-            self._v = tuple(Table2(p2, p3, z) for z in v)
+        self._p1 = array("d", p1)
+        n1 = len(self._p1)
+        if isinstance(p2[0], float):
+            p2 = [p2] * n1
+            p3 = [p3] * n1
+        self._o2 = array("l", [0])
+        self._p2 = array("d")
+        self._o3 = array("l", [0])
+        self._p3 = array("d")
+        for p2r, p3r in zip(p2, p3):
+            self._p2.extend(p2r)
+            self._o2.append(len(self._p2))
+            if isinstance(p3r[0], float):
+                p3r = [p3r] * len(p2r)
+            for p3rr in p3r:
+                self._p3.extend(p3rr)
+                self._o3.append(len(self._p3))
+        self._nv, self._v = _flatten_values(z for vr in v for vrr in vr
+                                            for z in vrr)
 
 
     def __call__ (self, p1, p2, p3, clamp=False):
 
-        il, ir = _get_interp_indices(self._p1, p1)
-        p1l = self._p1[il]
-        p1r = self._p1[ir]
-        v1l = self._v[il](p2, p3, clamp)
-        v1r = self._v[ir](p2, p3, clamp)
-        if not clamp or p1l < p1 < p1r:
-            ifac = (p1 - p1l) / float(p1r - p1l)
-            if isinstance(v1l, (tuple, list)):
-                v = [(v1l1 + (v1r1 - v1l1) * ifac) for v1l1, v1r1 in zip(v1l, v1r)]
-            else:
-                v = v1l + (v1r - v1l) * ifac
-        elif p1 <= p1l:
-            return v1l
-        else: # p1 >= p1r
-            return v1r
-        return v
+        return _table3_value(self._p1, self._o2, self._p2, self._o3, self._p3,
+                             self._nv, self._v, p1, p2, p3, clamp)
+
+
+    def many (self, pts, clamp=False):
+        """
+        Evaluate the table at each (p1, p2, p3) triplet in the sequence.
+        """
+
+        tp1, o2, tp2, o3, tp3 = self._p1, self._o2, self._p2, self._o3, self._p3
+        nv, tv = self._nv, self._v
+        return [_table3_value(tp1, o2, tp2, o3, tp3, nv, tv, p1, p2, p3, clamp)
+                for p1, p2, p3 in pts]
+
+
+def _flatten_values (vals):
+
+    nv = None
+    fvals = array("d")
+    for val in vals:
+        if nv is None:
+            nv = len(val) if isinstance(val, (tuple, list)) else 0
+        if nv:
+            fvals.extend(val)
+        else:
+            fvals.append(val)
+    return nv, fvals
+
+
+def _get_value (nv, tv, k):
+
+    if nv:
+        return list(tv[k * nv:(k + 1) * nv])
+    else:
+        return tv[k]
+
 
+def _interp_values (pl, pr, vl, vr, p, clamp):
 
-def _get_interp_indices (seq, val):
+    if not clamp or pl < p < pr:
+        ifac = (p - pl) / float(pr - pl)
+        if isinstance(vl, list):
+            v = [(vl1 + (vr1 - vl1) * ifac) for vl1, vr1 in zip(vl, vr)]
+        else:
+            v = vl + (vr - vl) * ifac
+    elif p <= pl:
+        return vl
+    else: # p >= pr
+        return vr
+    return v
+
+
+def _row_value (tp, lo, hi, nv, tv, p, clamp):
+
+    il, ir = _get_interp_indices(tp, p, lo, hi)
+    return _interp_values(tp[il], tp[ir],
+                          _get_value(nv, tv, il), _get_value(nv, tv, ir),
+                          p, clamp)
+
+
+def _table2_value (tp1, o2, tp2, nv, tv, p1, p2, clamp):
+
+    il, ir = _get_interp_indices(tp1, p1)
+    v1l = _row_value(tp2, o2[il], o2[il + 1], nv, tv, p2, clamp)
+    v1r = _row_value(tp2, o2[ir], o2[ir + 1], nv, tv, p2, clamp)
+    return _interp_values(tp1[il], tp1[ir], v1l, v1r, p1, clamp)
+
+
+def _table3_value (tp1, o2, tp2, o3, tp3, nv, tv, p1, p2, p3, clamp):
 
-    ir = bisect(seq, val)
+    il, ir = _get_interp_indices(tp1, p1)
+    v1lr = []
+    for i in (il, ir):
+        jl, jr = _get_interp_indices(tp2, p2, o2[i], o2[i + 1])
+        v2l = _row_value(tp3, o3[jl], o3[jl + 1], nv, tv, p3, clamp)
+        v2r = _row_value(tp3, o3[jr], o3[jr + 1], nv, tv, p3, clamp)
+        v1lr.append(_interp_values(tp2[jl], tp2[jr], v2l, v2r, p2, clamp))
+    v1l, v1r = v1lr
+    return _interp_values(tp1[il], tp1[ir], v1l, v1r, p1, clamp)
+
+
+def _get_interp_indices (seq, val, lo=0, hi=None):
+
+    if hi is None:
+        hi = len(seq)
+    ir = bisect(seq, val, lo, hi)
     il = ir - 1
-    if il < 0:
+    if il < lo:
         il += 1; ir += 1
-    elif ir >= len(seq):
+    elif ir >= hi:
         il -= 1; ir -= 1
     return il, ir
+# @cache-key-end: table-layout
+
+
+def table_cache_key ():
+    """
+    Part of the cache key for cached objects which contain tables,
+    so that they are rebuilt when the table layout changes.
+    """
+
+    this_path = internal_path("data", __file__)
+    return get_cache_key_section(this_path.replace(".pyc", ".py"),
+                                 "table-layout")
 
 
 # :also-compiled:
@@ -99,10 +99,12 @@ TerrainGeom::TerrainGeom (
     double maxheight, bool havemaxheight,
     int numtilesx, int numtilesy,
     double celldensity, bool periodic,
-    ENC_LST_STRING cutmaskpaths_, ENC_LST_BOOL levints_)
+    ENC_LST_STRING cutmaskpaths_, ENC_LST_BOOL levints_,
+    ENC_LST_BOOL skiptiles_)
 {
     std::vector<std::string> cutmaskpaths = dec_lst_string(cutmaskpaths_);
     std::vector<bool> levints = dec_lst_bool(levints_);
+    std::vector<bool> skiptiles = dec_lst_bool(skiptiles_);
 
     bool timeit = false;
 
@@ -120,7 +122,7 @@ TerrainGeom::TerrainGeom (
         maxheight, havemaxheight,
         numtilesx, numtilesy,
         celldensity, periodic,
-        cutmaskpaths, levints,
+        cutmaskpaths, levints, skiptiles,
         // celldata
         _numquadsx, _numquadsy, _numtilesx, _numtilesy,
         _tilesizex, _tilesizey, _numcuts,
@@ -333,6 +335,7 @@ void TerrainGeom::_construct(
     double celldensity, bool periodic,
     const std::vector<std::string> &cutmaskpaths,
     const std::vector<bool> &levints,
+    const std::vector<bool> &skiptiles,
     // celldata
     int &numquadsx_, int &numquadsy_, int &numtilesx_, int &numtilesy_,
     int &tilesizex_, int &tilesizey_, int &numcuts_,
@@ -520,7 +523,7 @@ void TerrainGeom::_construct(
             numtilesx, numtilesy, tilesizex, tilesizey,
             numtilequadsx, numtilequadsy,
             _gvformat,
-            verts, tris, quadmap, levints,
+            verts, tris, quadmap, levints, skiptiles,
             cut,
             tiles1, tilexys1);
     }
@@ -1794,6 +1797,7 @@ void TerrainGeom::_make_tiles (
     const std::vector<LVector4i> &tris,
     const std::vector<LVector2i> &quadmap,
     const std::vector<bool> &levints,
+    const std::vector<bool> &skiptiles,
     int cut,
     std::vector<std::vector<NodePath> > &tiles,
     std::vector<std::vector<LPoint2d> > &tilexys)
@@ -1801,7 +1805,15 @@ void TerrainGeom::_make_tiles (
     #undef Vt
     #define Vt LVector3d
 
-    int nverts = verts.size();
+    // Skipped tiles get an empty geometry node, to be filled later
+    // from the tile cache. If all are skipped, vertex data is not needed.
+    int numtiles = numtilesx * numtilesy;
+    bool anytile = false;
+    for (int ijt = 0; ijt < numtiles && !anytile; ++ijt) {
+        anytile = (ijt >= skiptiles.size() || !skiptiles[ijt]);
+    }
+
+    int nverts = anytile ? verts.size() : 0;
 
     // Compute vertex normals and tangents,
     // as area-weighted averages of adjoining triangles.
@@ -1811,7 +1823,7 @@ void TerrainGeom::_make_tiles (
     std::vector<LVector3d> vtangs(nverts, LVector3d(0.0, 0.0, 0.0));
     //Vt zdir = Vt(0.0, 0.0, 1.0);
     Vt xdir(1.0, 0.0, 0.0);
-    for (int k = 0; k < tris.size(); ++k) {
+    for (int k = 0; k < (anytile ? tris.size() : 0); ++k) {
         int c = tris[k][3];
         if (c != cut && (levints[cut] || levints[c])) {
             continue;
@@ -1857,13 +1869,21 @@ void TerrainGeom::_make_tiles (
         double xt = (it + 0.5) * tilesizex + offsetx;
         for (int jt = 0; jt < numtilesy; ++jt) {
             double yt = (jt + 0.5) * tilesizey + offsety;
-            NodePath tile = _make_tile(
-                offsetx, offsety,
-                numtilesx, numtilesy, tilesizex, tilesizey,
-                numquadsx, numquadsy, numtilequadsx, numtilequadsy,
-                verts, vnorms, vtangs, tris, quadmap, tilevertmap,
-                gvformat,
-                cut, it, jt, xt, yt);
+            int ijt = it * numtilesy + jt;
+            NodePath tile;
+            if (ijt < skiptiles.size() && skiptiles[ijt]) {
+                std::ostringstream tnamess;
+                tnamess << "tile" << "-i" << it << "-j" << jt << "-c" << cut;
+                tile = NodePath(new GeomNode(tnamess.str()));
+            } else {
+                tile = _make_tile(
+                    offsetx, offsety,
+                    numtilesx, numtilesy, tilesizex, tilesizey,
+                    numquadsx, numquadsy, numtilequadsx, numtilequadsy,
+                    verts, vnorms, vtangs, tris, quadmap, tilevertmap,
+                    gvformat,
+                    cut, it, jt, xt, yt);
+            }
             tiles1.push_back(tile);
             tilexys1.push_back(LPoint2d(xt, yt));
         }
@@ -2302,3 +2322,33 @@ void TerrainGeom::interpolate_z (
                    pcz, norm, wnorm, tvinds, wtvinds);
 }
 
+std::string TerrainGeom::interpolate_z_many (
+    ENC_LST_DOUBLE xs_, ENC_LST_DOUBLE ys_, const LPoint3 &ref1,
+    bool wnorm) const
+{
+    std::vector<double> xs = dec_lst_double(xs_);
+    std::vector<double> ys = dec_lst_double(ys_);
+
+    // Packed by columns: heights, cut indices, and if requested,
+    // normal x, y and z components.
+    int num = xs.size();
+    std::vector<double> ret(num * (wnorm ? 5 : 2));
+    LVector3d pcz, norm;
+    LVector3i tvinds;
+    for (int ip = 0; ip < num; ++ip) {
+        _interpolate_z(_sizex, _sizey, _offsetx, _offsety,
+                       _numquadsx, _numquadsy,
+                       _verts, _tris, _quadmap,
+                       xs[ip], ys[ip], ref1,
+                       pcz, norm, wnorm, tvinds, false);
+        ret[ip] = pcz[2];
+        ret[num + ip] = pcz[1];
+        if (wnorm) {
+            ret[2 * num + ip] = norm[0];
+            ret[3 * num + ip] = norm[1];
+            ret[4 * num + ip] = norm[2];
+        }
+    }
+    return enc_lst_double(ret);
+}
+
@@ -61,7 +61,8 @@ PUBLISHED:
         double maxheight, bool havemaxheight,
         int numtilesx, int numtilesy,
         double celldensity, bool periodic,
-        ENC_LST_STRING cutmaskpaths, ENC_LST_BOOL levints);
+        ENC_LST_STRING cutmaskpaths, ENC_LST_BOOL levints,
+        ENC_LST_BOOL skiptiles);
 
     ~TerrainGeom ();
 
@@ -81,6 +82,10 @@ PUBLISHED:
         LVector3d &norm, bool wnorm,
         LVector3i &tvinds, bool wtvinds) const;
 
+    std::string interpolate_z_many (
+        ENC_LST_DOUBLE xs, ENC_LST_DOUBLE ys, const LPoint3 &ref1,
+        bool wnorm) const;
+
     NodePath tile_root ();
     int num_quads_x () const;
     int num_quads_y () const;
@@ -133,6 +138,7 @@ private:
         double celldensity, bool periodic,
         const std::vector<std::string> &cutmaskpaths,
         const std::vector<bool> &levints,
+        const std::vector<bool> &skiptiles,
         // celldata
         int &numquadsx_, int &numquadsy_, int &numtilesx_, int &numtilesy_,
         int &tilesizex_, int &tilesizey_, int &numcuts_,
@@ -266,6 +272,7 @@ private:
         const std::vector<LVector4i> &tris,
         const std::vector<LVector2i> &quadmap,
         const std::vector<bool> &levints,
+        const std::vector<bool> &skiptiles,
         int cut,
         std::vector<std::vector<NodePath> > &tiles,
         std::vector<std::vector<LPoint2d> > &tilexys);
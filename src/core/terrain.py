@@ -4,10 +4,13 @@ from array import array
 import cPickle as pickle
 import codecs
 from ConfigParser import SafeConfigParser
-from gzip import GzipFile
+from ctypes import c_double, c_int32, sizeof
 from math import radians, ceil, sqrt, sin, cos
+import mmap
 import os
 from shutil import rmtree
+import struct
+import sys
 from time import time
 
 from pandac.PandaModules import Point2, Point2D, Point3, Point3D
@@ -20,7 +23,7 @@ from pandac.PandaModules import GeomVertexFormat
 from pandac.PandaModules import GeomVertexWriter, GeomVertexData
 from pandac.PandaModules import Geom, GeomNode, GeomTriangles
 from pandac.PandaModules import NodePath, LODNode
-from pandac.PandaModules import Shader, Triangulator
+from pandac.PandaModules import Triangulator
 
 from src import join_path, path_exists, path_dirname
 from src import internal_path, real_path, full_path
@@ -32,6 +35,7 @@ from src.core.misc import make_image
 from src.core.misc import report, dbgval
 from src.core.misc import enc_lst_string, dec_lst_string
 from src.core.misc import enc_lst_bool, dec_lst_bool
+from src.core.misc import enc_lst_double, dec_lst_double
 from src.core.planedyn import GROUND
 from src.core.shader import make_shdfunc_amblit, make_shdfunc_dirlit
 from src.core.shader import make_shdfunc_pntlit, printsh
@@ -39,6 +43,7 @@ from src.core.shader import make_shdfunc_fogbln, make_shdfunc_fogapl
 from src.core.shader import make_shdfunc_sunbln
 from src.core.shader import make_shdfunc_shdcrd, make_shdfunc_shdfac, SHADOWBLUR
 from src.core.shader import make_frag_outputs
+from src.core.shader import make_glsl_shader, register_shader_maker
 from src.core.table import UnitGrid2
 from src.core.transl import *
 
@@ -299,6 +304,35 @@ class Terrain (object):
         minheight, haveminheight = (0.0, False) if minheight is None else (minheight, True)
         maxheight, havemaxheight = (0.0, False) if maxheight is None else (maxheight, True)
 
+        # Tile geometry stored by earlier runs is kept while the terrain
+        # cache key is unchanged, and such tiles are not constructed.
+        self._page_name = name or None
+        pagekeyhx = None
+        stored = set()
+        if self._page_name is not None:
+            carg = AutoProps(
+                sizex=sizex, sizey=sizey,
+                offsetx=offsetx, offsety=offsety,
+                heightmappath=heightmappath, haveheightmappath=haveheightmappath,
+                hmdatapath=hmdatapath, havehmdatapath=havehmdatapath,
+                maxsizexa=maxsizexa, maxsizexb=maxsizexb, havemaxsizex=havemaxsizex,
+                maxsizey=maxsizey, havemaxsizey=havemaxsizey,
+                centerx=centerx, havecenterx=havecenterx,
+                centery=centery, havecentery=havecentery,
+                mingray=mingray, havemingray=havemingray,
+                maxgray=maxgray, havemaxgray=havemaxgray,
+                minheight=minheight, haveminheight=haveminheight,
+                maxheight=maxheight, havemaxheight=havemaxheight,
+                numtilesx=numtilesx, numtilesy=numtilesy,
+                celldensity=celldensity, periodic=periodic,
+                cutmaskpaths=cutmaskpaths, levints=levints,
+            )
+            pagekeyhx = _terrain_cache_key(carg)
+            stored = Terrain._stored_tiles(self._page_name, pagekeyhx,
+                                           numtilesx, numtilesy)
+        skiptiles = [((it, jt) in stored)
+                     for it in xrange(numtilesx) for jt in xrange(numtilesy)]
+
         if USE_COMPILED:
             report(_("Constructing terrain."))
             # For Python version reported from within TerrainGeom,
@@ -313,7 +347,8 @@ class Terrain (object):
             minheight, haveminheight, maxheight, havemaxheight,
             numtilesx, numtilesy,
             celldensity, periodic,
-            enc_lst_string(cutmaskpaths), enc_lst_bool(levints))
+            enc_lst_string(cutmaskpaths), enc_lst_bool(levints),
+            enc_lst_bool(skiptiles))
 
         numquadsx = self._geom.num_quads_x()
         numquadsy = self._geom.num_quads_y()
@@ -343,10 +378,12 @@ class Terrain (object):
         tileradius = 0.5 * sqrt(tilesizex**2 + tilesizey**2)
         maxaltitude = 30000.0
         outvisradius = sqrt((visradius + tileradius)**2 + maxaltitude**2)
+        self._tile_centers = [[None] * numtilesy for it in xrange(numtilesx)]
         it = 0; jt = 0
         for ijtlnp in tileroot.getChildren():
             ijtlod = ijtlnp.node()
             ijtlod.setSwitch(0, outvisradius, 0.0)
+            self._tile_centers[it][jt] = (ijtlnp.getX(), ijtlnp.getY())
             ijtile = ijtlnp.getChild(0)
             ic = 0
             for ctile in ijtile.getChildren():
@@ -568,6 +605,9 @@ class Terrain (object):
                 self.node.setP(0.0)
                 set_shader()
                 load_tex.removeNode()
+                self._page_active = self._page_name is not None
+                if self._page_active:
+                    self._page_in_near_tiles()
                 return task.done
             return task.cont
         task = taskMgr.add(remove_load_tex, "terrain-cache-tex")
@@ -585,11 +625,71 @@ class Terrain (object):
         self._virtsurf_store = []
         self._virtsurf_per_quad = {}
 
+        # Setup paging of tile geometry around the camera.
+        # Geometry of tiles farther than visibility radius plus margin
+        # is stored to per-tile cache and released, and read back
+        # in background when the camera approaches again.
+        # Both storing and reading is done on the background loader.
+        # Tiles already in the cache start paged out, and those near
+        # the camera are read synchronously once paging is activated.
+        # Elevation data is not paged, and the compiled version still
+        # triangulates the whole terrain on construction.
+        if self._page_name is not None and not stored:
+            Terrain._reset_tile_cache(self._page_name, pagekeyhx)
+        self._page_active = False # until textures are loaded
+        pagemargin = max(tilesizex, tilesizey)
+        self._page_inradius = visradius + tileradius + pagemargin
+        self._page_outradius = self._page_inradius + 0.5 * pagemargin
+        self._page_period = 0.5
+        self._page_wait = 0.0
+        self._paged_out = set(stored)
+        self._page_stored = set(stored)
+        self._page_storing = {}
+        self._page_loading = {}
+
         self._input_shader(0.0) # initialize
         self.alive = True
         base.taskMgr.add(self._loop, "terrain-loop")
 
 
+    @staticmethod
+    def prefetch (name, cuts=()):
+        """
+        Start loading textures given by the cut specifications
+        and cached geometry of the named terrain in background.
+        Geometry is prefetched only with the Python terrain geometry,
+        since the compiled one constructs it on creation.
+
+        Returns the list of futures of the background loader,
+        empty if there is nothing to load.
+        """
+
+        texpaths = set()
+        for cutspec in cuts:
+            if isinstance(cutspec.blendmask, basestring):
+                texpaths.add(cutspec.blendmask)
+            for blendspec in cutspec.blends:
+                if blendspec is None:
+                    continue
+                for layerspec in blendspec.layers:
+                    for spanspec in layerspec.spans:
+                        for texpath in (spanspec.texture, spanspec.normalmap,
+                                        spanspec.glowmap, spanspec.glossmap):
+                            if isinstance(texpath, basestring):
+                                texpaths.add(texpath)
+        futures = [base.load_texture_async("data", texpath)
+                   for texpath in sorted(texpaths)]
+
+        if not USE_COMPILED:
+            keypath = TerrainGeom._cache_key_path(name)
+            geomdatapath = TerrainGeom._cache_geomdata_path(name)
+            if (path_exists("cache", keypath) and
+                path_exists("cache", geomdatapath)):
+                futures.append(base.load_model_async("cache", geomdatapath,
+                                                     cache=False))
+        return futures
+
+
     def destroy (self):
 
         if not self.alive:
@@ -608,6 +708,8 @@ class Terrain (object):
                     tile.removeNode()
         self._tiles = []
         del self._geom
+        # Background writes keep their own references to tile roots.
+        self._page_storing = {}
 
 
     _shader_cache = {}
@@ -1324,7 +1426,7 @@ void main ()
 """
         if showas:
             printsh((vshstr, fshstr), showas)
-        shader = Shader.make(Shader.SLGLSL, vshstr, fshstr)
+        shader = make_glsl_shader("terrain", shdkey, vshstr, fshstr)
         Terrain._shader_cache[shdkey] = shader
         return shader
 
@@ -1394,9 +1496,202 @@ void main ()
 
         self._input_shader(dt)
 
+        if self._page_active:
+            self._page_wait -= dt
+            if self._page_wait <= 0.0:
+                self._page_wait = self._page_period
+                self._page_tiles()
+            if self._page_storing:
+                self._page_check_stored_tiles()
+            if self._page_loading:
+                self._page_in_loaded_tiles()
+
         return task.cont
 
 
+    def _page_tiles (self):
+
+        campos = self.world.camera.getPos(self.node)
+        cx, cy = campos[0], campos[1]
+        inradius2 = self._page_inradius**2
+        outradius2 = self._page_outradius**2
+        for it, centers in enumerate(self._tile_centers):
+            for jt, (x, y) in enumerate(centers):
+                ijt = (it, jt)
+                dist2 = (x - cx)**2 + (y - cy)**2
+                if ijt in self._paged_out:
+                    if dist2 < inradius2:
+                        if ijt in self._page_storing:
+                            self._page_in_stored_tile(it, jt)
+                        elif ijt not in self._page_loading:
+                            tilepath = Terrain._cache_tile_path(
+                                self._page_name, it, jt)
+                            self._page_loading[ijt] = base.load_model_async(
+                                "cache", tilepath, cache=False)
+                elif dist2 > outradius2:
+                    self._page_out_tile(it, jt)
+
+
+    def _page_in_near_tiles (self):
+
+        # Stored tiles around the camera are needed right away.
+        campos = self.world.camera.getPos(self.node)
+        cx, cy = campos[0], campos[1]
+        inradius2 = self._page_inradius**2
+        for it, centers in enumerate(self._tile_centers):
+            for jt, (x, y) in enumerate(centers):
+                ijt = (it, jt)
+                dist2 = (x - cx)**2 + (y - cy)**2
+                if ijt in self._paged_out and dist2 < inradius2:
+                    tilepath = Terrain._cache_tile_path(self._page_name, it, jt)
+                    tileroot = base.load_model("cache", tilepath, cache=False)
+                    base.drop_loaded_file("cache", tilepath)
+                    self._attach_tile_geoms(it, jt, tileroot)
+                    tileroot.removeNode()
+                    self._paged_out.discard(ijt)
+
+
+    def _page_out_tile (self, it, jt):
+
+        ijt = (it, jt)
+        ctiles = [t for t in self._tiles[it][jt] if t is not None]
+        if ijt not in self._page_stored and ijt not in self._page_storing:
+            # Only geometry is stored, state stays on the tile nodes.
+            # Geometry is moved to a detached root, which is kept
+            # until the background write is done.
+            # Tiles of all cuts are stored, also those without geometry,
+            # to be matched by order when read back.
+            tileroot = NodePath("tile-i%d-j%d" % (it, jt))
+            for ctile in ctiles:
+                cnode = GeomNode(ctile.getName())
+                if ctile.node().isGeomNode():
+                    cnode.addGeomsFrom(ctile.node())
+                tileroot.attachNewNode(cnode)
+            tilepath = Terrain._cache_tile_path(self._page_name, it, jt)
+            future = base.async_loader.submit(Terrain._write_tile,
+                                              tileroot, tilepath)
+            self._page_storing[ijt] = (tileroot, future)
+        for ctile in ctiles:
+            if ctile.node().isGeomNode():
+                ctile.node().removeAllGeoms()
+        self._paged_out.add(ijt)
+
+
+    @staticmethod
+    def _write_tile (tileroot, tilepath):
+
+        # Written under temporary name and then renamed, so that
+        # an interrupted write does not leave a tile for later runs.
+        tmptilepath = tilepath + ".tmp"
+        base.write_model_bam(tileroot, "cache", tmptilepath)
+        os.rename(real_path("cache", tmptilepath),
+                  real_path("cache", tilepath))
+
+
+    def _page_check_stored_tiles (self):
+
+        for ijt, (tileroot, future) in self._page_storing.items():
+            if not future.done():
+                continue
+            del self._page_storing[ijt]
+            try:
+                future.result()
+            except StandardError:
+                # Not stored (loader already warned), bring geometry back
+                # if needed, and store again when next paged out.
+                it, jt = ijt
+                if ijt in self._paged_out:
+                    self._attach_tile_geoms(it, jt, tileroot)
+                    self._paged_out.discard(ijt)
+            else:
+                self._page_stored.add(ijt)
+            tileroot.removeNode()
+
+
+    def _page_in_stored_tile (self, it, jt):
+
+        # Geometry still in memory, waiting for the background write.
+        ijt = (it, jt)
+        tileroot, future = self._page_storing[ijt]
+        self._attach_tile_geoms(it, jt, tileroot)
+        self._paged_out.discard(ijt)
+
+
+    def _page_in_loaded_tiles (self):
+
+        for ijt, future in self._page_loading.items():
+            if not future.done():
+                continue
+            del self._page_loading[ijt]
+            it, jt = ijt
+            tileroot = future.result()
+            tilepath = Terrain._cache_tile_path(self._page_name, it, jt)
+            base.drop_loaded_file("cache", tilepath)
+            self._attach_tile_geoms(it, jt, tileroot)
+            tileroot.removeNode()
+            self._paged_out.discard(ijt)
+
+
+    def _attach_tile_geoms (self, it, jt, tileroot):
+
+        ctiles = [t for t in self._tiles[it][jt] if t is not None]
+        for ctile, ltile in zip(ctiles, tileroot.getChildren()):
+            if ctile.node().isGeomNode():
+                ctile.node().addGeomsFrom(ltile.node())
+
+
+    @staticmethod
+    def _stored_tiles (tname, keyhx, numtilesx, numtilesy):
+
+        keypath = Terrain._cache_tile_key_path(tname)
+        if not path_exists("cache", keypath):
+            return set()
+        okeyhx = open(real_path("cache", keypath), "rb").read()
+        if okeyhx != keyhx:
+            return set()
+        stored = set()
+        for it in xrange(numtilesx):
+            for jt in xrange(numtilesy):
+                tilepath = Terrain._cache_tile_path(tname, it, jt)
+                if path_exists("cache", tilepath):
+                    stored.add((it, jt))
+        return stored
+
+
+    @staticmethod
+    def _reset_tile_cache (tname, keyhx):
+
+        tiledirpath = Terrain._cache_tile_dir_path(tname)
+        if path_exists("cache", tiledirpath):
+            rmtree(real_path("cache", tiledirpath))
+        os.makedirs(real_path("cache", tiledirpath))
+        keypath = Terrain._cache_tile_key_path(tname)
+        fh = open(real_path("cache", keypath), "wb")
+        fh.write(keyhx)
+        fh.close()
+
+
+    _cache_tile_pdir = "terrain"
+
+    @staticmethod
+    def _cache_tile_dir_path (tname):
+
+        return join_path(Terrain._cache_tile_pdir, tname, "tiles")
+
+
+    @staticmethod
+    def _cache_tile_path (tname, it, jt):
+
+        return join_path(Terrain._cache_tile_dir_path(tname),
+                         "tile-i%d-j%d.bam" % (it, jt))
+
+
+    @staticmethod
+    def _cache_tile_key_path (tname):
+
+        return join_path(Terrain._cache_tile_dir_path(tname), "tiles.key")
+
+
     def _input_shader (self, dt):
 
         pass
@@ -1459,6 +1754,49 @@ void main ()
         return z
 
 
+    def height_many (self, xs, ys, wnorm=False, flush=False):
+        """
+        Return heights at many points at once, as an array.
+
+        If wnorm is True, also return the tuple of arrays of normal
+        components and the array of ground types, as height() does.
+        Otherwise heights are as from height_q().
+        """
+
+        num = len(xs)
+        ret = dec_lst_double(self._geom.interpolate_z_many(
+            enc_lst_double(xs), enc_lst_double(ys), self._pos, wnorm))
+        zs = ret[:num]
+        cs = array("i", map(int, ret[num:2 * num]))
+        if wnorm:
+            ns = (ret[2 * num:3 * num], ret[3 * num:4 * num],
+                  ret[4 * num:5 * num])
+
+        if wnorm:
+            gtbc = self._ground_type_by_cut
+            ts = array("i", [gtbc[c] for c in cs])
+
+        if self._virtsurf_store:
+            for ip in xrange(num):
+                if wnorm:
+                    n = Vec3D(ns[0][ip], ns[1][ip], ns[2][ip])
+                    t = ts[ip]
+                else:
+                    n = None
+                    t = None
+                z, n, t = self._mod_height_virtsurf(xs[ip], ys[ip], zs[ip],
+                                                    n, t, flush=flush)
+                zs[ip] = z
+                if wnorm:
+                    ns[0][ip], ns[1][ip], ns[2][ip] = n[0], n[1], n[2]
+                    ts[ip] = t
+
+        if wnorm:
+            return zs, ns, ts
+        else:
+            return zs
+
+
     def max_height (self):
 
         return self._geom.max_z()
@@ -1577,6 +1915,29 @@ void main ()
                     set_texture(tile, extras=mod_texstack, clamp=False)
 
 
+register_shader_maker("terrain", Terrain._shader_cache,
+                      internal_path("data", __file__).replace(".pyc", ".py"))
+
+
+# @cache-key-start: terrain-generation
+def _terrain_cache_key (carg):
+
+    fckey = []
+    fckey.extend(carg.cutmaskpaths)
+    ecarg = AutoProps()
+    if carg.haveheightmappath:
+        fckey.append(carg.heightmappath)
+        if carg.havehmdatapath:
+            ecarg.hmdatapath = carg.hmdatapath
+            fckey.append(carg.hmdatapath)
+    this_path = internal_path("data", __file__)
+    key = (sorted(carg.props()), sorted(ecarg.props()),
+           get_cache_key_section(this_path.replace(".pyc", ".py"),
+                                 "terrain-generation"))
+    return key_to_hex(key, fckey)
+# @cache-key-end: terrain-generation
+
+
 # :also-compiled:
 class TerrainGeom (object):
 
@@ -1589,10 +1950,11 @@ class TerrainGeom (object):
                   minheight, haveminheight, maxheight, havemaxheight,
                   numtilesx, numtilesy,
                   celldensity, periodic,
-                  cutmaskpaths, levints):
+                  cutmaskpaths, levints, skiptiles):
 
         cutmaskpaths = dec_lst_string(cutmaskpaths)
         levints = dec_lst_bool(levints)
+        skiptiles = dec_lst_bool(skiptiles)
 
         timeit = False
 
@@ -1620,19 +1982,7 @@ class TerrainGeom (object):
         keyhx = None
         if name:
             tname = name
-            fckey = []
-            fckey.extend(cutmaskpaths)
-            ecarg = AutoProps()
-            if haveheightmappath:
-                fckey.append(heightmappath)
-                if havehmdatapath:
-                    ecarg.hmdatapath = hmdatapath
-                    fckey.append(hmdatapath)
-            this_path = internal_path("data", __file__)
-            key = (sorted(carg.props()), sorted(ecarg.props()),
-                   get_cache_key_section(this_path.replace(".pyc", ".py"),
-                                         "terrain-generation"))
-            keyhx = key_to_hex(key, fckey)
+            keyhx = _terrain_cache_key(carg)
 # @cache-key-end: terrain-generation
             if timeit:
                 t1 = time()
@@ -1671,6 +2021,18 @@ class TerrainGeom (object):
          self._maxsizexa, self._maxsizexb, self._maxsizey) = celldata
         self._tileroot, = geomdata
 
+        # Drop geometry of tiles to be taken from the tile cache.
+        # Unlike in the compiled version, these tiles have been
+        # constructed or loaded with the rest.
+        if any(skiptiles):
+            ijt = 0
+            for ijtlnp in self._tileroot.getChildren():
+                if ijt < len(skiptiles) and skiptiles[ijt]:
+                    for ctile in ijtlnp.getChild(0).getChildren():
+                        if ctile.node().isGeomNode():
+                            ctile.node().removeAllGeoms()
+                ijt += 1
+
         self._sizex = sizex
         self._sizey = sizey
         self._offsetx = offsetx
@@ -1680,28 +2042,17 @@ class TerrainGeom (object):
     def destroy (self):
 
         # Let it try harder to collect garbage.
-        e1, e2, e3 = self._verts
-        e1[:] = array("d", [0.0])
-        e2[:] = array("d", [0.0])
-        e3[:] = array("d", [0.0])
+        # Views into memory-mapped cache are simply dropped.
+        els = (list(self._verts) + list(self._tris) + list(self._quadmap) +
+               [self._maxqzs])
+        for e in els:
+            if isinstance(e, array):
+                e[:] = array(e.typecode, [0])
         self._verts = None
-        del e1, e2, e3
-        e1, e2, e3, e4 = self._tris
-        e1[:] = array("l", [0])
-        e2[:] = array("l", [0])
-        e3[:] = array("l", [0])
-        e4[:] = array("l", [0])
         self._tris = None
-        del e1, e2, e3, e4
-        e1, e2 = self._quadmap
-        e1[:] = array("l", [0])
-        e2[:] = array("l", [0])
         self._quadmap = None
-        del e1, e2
-        e1 = self._maxqzs
-        e1[:] = array("d", [0.0])
         self._maxqzs = None
-        del e1
+        del els
 
         self._tileroot.removeNode()
 
@@ -2065,7 +2416,15 @@ class TerrainGeom (object):
     @staticmethod
     def _cache_elevdata_path (tname):
 
-        return join_path(TerrainGeom._cache_pdir, tname, "elevdata.pkl.gz")
+        return join_path(TerrainGeom._cache_pdir, tname, "elevdata.bin")
+
+
+    # Elevation data cache file has a fixed header, followed by arrays of
+    # little-endian 64-bit floats and 32-bit integers, in this order:
+    # vertex x, y, z, quad maximum z; triangle vertex indices 1, 2, 3,
+    # triangle cut; quad first triangle, quad last triangle + 1.
+    _elevdata_magic = "LLELEV01"
+    _elevdata_header = "<8sqqqd" # magic, nverts, ntris, nquads, maxz
 
 
     @staticmethod
@@ -2083,6 +2442,9 @@ class TerrainGeom (object):
             return None
         okeyhx = open(real_path("cache", keypath), "rb").read()
         if okeyhx != keyhx:
+            # Geometry may have been prefetched from the outdated cache.
+            base.drop_loaded_file("cache",
+                                  TerrainGeom._cache_geomdata_path(tname))
             return None
 
         celldatapath = TerrainGeom._cache_celldata_path(tname)
@@ -2092,35 +2454,75 @@ class TerrainGeom (object):
         celldata = pickle.load(fh)
         fh.close()
 
-        #from time import sleep
-        #print "--terrain235 start-sleep"
-        #sleep(10)
-        #print "--terrain236 end-sleep"
         elevdatapath = TerrainGeom._cache_elevdata_path(tname)
         if not path_exists("cache", elevdatapath):
             return None
-        fh = GzipFile(real_path("cache", elevdatapath), "rb")
-        elevdata = pickle.loads(fh.read())
-        fh.close()
-        del fh # prevent memory consumption peak
-        #print "--terrain237 start-sleep"
-        #sleep(10)
-        #print "--terrain238 end-sleep"
-
-        #print "--terrain245 start-sleep"
-        #sleep(10)
-        #print "--terrain246 end-sleep"
+        elevdata = TerrainGeom._map_elevdata(real_path("cache", elevdatapath))
+        if elevdata is None:
+            return None
+
         geomdatapath = TerrainGeom._cache_geomdata_path(tname)
         if not path_exists("cache", geomdatapath):
             return None
         geomroot = base.load_model("cache", geomdatapath, cache=False)
         geomdata = geomroot.getChildren().getPaths()
-        #print "--terrain247 start-sleep"
-        #sleep(10)
-        #print "--terrain248 end-sleep"
 
         return celldata, elevdata, geomdata
 
+
+    @staticmethod
+    def _map_elevdata (fpath):
+
+        fh = open(fpath, "rb")
+        hsize = struct.calcsize(TerrainGeom._elevdata_header)
+        header = fh.read(hsize)
+        if len(header) < hsize:
+            fh.close()
+            return None
+        magic, nverts, ntris, nquads, maxz = (
+            struct.unpack(TerrainGeom._elevdata_header, header))
+        if magic != TerrainGeom._elevdata_magic:
+            fh.close()
+            return None
+        fsize = hsize + (3 * nverts + nquads) * 8 + (4 * ntris + 2 * nquads) * 4
+        if os.fstat(fh.fileno()).st_size != fsize:
+            fh.close()
+            return None
+
+        if sys.byteorder == "little":
+            # Arrays are views into copy-on-write mapping of the file,
+            # so that pages are shared with other processes until modified
+            # (e.g. quad maximum heights, by terrain deformation).
+            # The mapping is kept open by the views.
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+            def view (ctyp, n, offset):
+                return (ctyp * n).from_buffer(mm, offset), offset + n * sizeof(ctyp)
+        else:
+            mm = fh.read()
+            def view (ctyp, n, offset):
+                a = array("d" if ctyp is c_double else "i")
+                a.fromstring(mm[offset:offset + n * sizeof(ctyp)])
+                a.byteswap()
+                return a, offset + n * sizeof(ctyp)
+        fh.close()
+
+        offset = hsize
+        vertxs, offset = view(c_double, nverts, offset)
+        vertys, offset = view(c_double, nverts, offset)
+        vertzs, offset = view(c_double, nverts, offset)
+        maxqzs, offset = view(c_double, nquads, offset)
+        tri1s, offset = view(c_int32, ntris, offset)
+        tri2s, offset = view(c_int32, ntris, offset)
+        tri3s, offset = view(c_int32, ntris, offset)
+        trics, offset = view(c_int32, ntris, offset)
+        qm1, offset = view(c_int32, nquads, offset)
+        qm2, offset = view(c_int32, nquads, offset)
+
+        verts = (vertxs, vertys, vertzs)
+        tris = (tri1s, tri2s, tri3s, trics)
+        quadmap = (qm1, qm2)
+        return verts, tris, quadmap, maxz, maxqzs
+
 # @cache-key-start: terrain-generation
 
     @staticmethod
@@ -2130,8 +2532,19 @@ class TerrainGeom (object):
 
         cdirpath = path_dirname(keypath)
         if path_exists("cache", cdirpath):
-            rmtree(real_path("cache", cdirpath))
-        os.makedirs(real_path("cache", cdirpath))
+            # Tile cache is kept, Terrain checks its key by itself.
+            tiledirpath = Terrain._cache_tile_dir_path(tname)
+            rcdirpath = real_path("cache", cdirpath)
+            for fname in os.listdir(rcdirpath):
+                if join_path(cdirpath, fname) == tiledirpath:
+                    continue
+                fpath = os.path.join(rcdirpath, fname)
+                if os.path.isdir(fpath):
+                    rmtree(fpath)
+                else:
+                    os.remove(fpath)
+        else:
+            os.makedirs(real_path("cache", cdirpath))
 
         geomdatapath = TerrainGeom._cache_geomdata_path(tname)
         geomroot = NodePath("root")
@@ -2140,8 +2553,20 @@ class TerrainGeom (object):
         base.write_model_bam(geomroot, "cache", geomdatapath)
 
         elevdatapath = TerrainGeom._cache_elevdata_path(tname)
-        fh = GzipFile(real_path("cache", elevdatapath), "wb", compresslevel=3)
-        pickle.dump(elevdata, fh, -1)
+        verts, tris, quadmap, maxz, maxqzs = elevdata
+        fh = open(real_path("cache", elevdatapath), "wb")
+        fh.write(struct.pack(TerrainGeom._elevdata_header,
+                             TerrainGeom._elevdata_magic,
+                             len(verts[0]), len(tris[0]), len(maxqzs), maxz))
+        for els, typecode in (
+            (list(verts) + [maxqzs], "d"),
+            (list(tris) + list(quadmap), "i"),
+        ):
+            for e in els:
+                a = array(typecode, e)
+                if sys.byteorder != "little":
+                    a.byteswap()
+                fh.write(a.tostring())
         fh.close()
 
         celldatapath = TerrainGeom._cache_celldata_path(tname)
@@ -3591,5 +4016,109 @@ class TerrainGeom (object):
             tvinds[0], tvinds[1], tvinds[2] = ret.pop(0)
 
 
+    def interpolate_z_many (self, xs, ys, ref1, wnorm=False):
+
+        xs = dec_lst_double(xs)
+        ys = dec_lst_double(ys)
+        zs, cs, ns = TerrainGeom._interpolate_z_many(
+            self._sizex, self._sizey, self._offsetx, self._offsety,
+            self._numquadsx, self._numquadsy,
+            self._verts, self._tris, self._quadmap,
+            xs, ys, ref1, wnorm)
+        ret = zs + array("d", cs)
+        if wnorm:
+            ret.extend(ns[0]); ret.extend(ns[1]); ret.extend(ns[2])
+        return enc_lst_double(ret)
+
+
+    @staticmethod
+    def _interpolate_z_many (sizex, sizey, offsetx, offsety,
+                             numquadsx, numquadsy,
+                             verts, tris, quadmap,
+                             xs, ys, ref1, wnorm=False):
+        # Same as _interpolate_z point by point, but computed on plain
+        # floats, and the normal only for the selected triangle.
+        # Returns arrays of heights and cut indices, and if requested,
+        # the tuple of arrays of normal components (else None).
+
+        xr1, yr1, zr1 = ref1[0], ref1[1], ref1[2]
+        dx = sizex / numquadsx
+        dy = sizey / numquadsy
+        vertxs, vertys, vertzs = verts
+        tri1s, tri2s, tri3s, trics = tris
+        qm1, qm2 = quadmap
+
+        num = len(xs)
+        zs = array("d", [0.0]) * num
+        cs = array("i", [-1]) * num
+        if wnorm:
+            nxs = array("d", [0.0]) * num
+            nys = array("d", [0.0]) * num
+            nzs = array("d", [0.0]) * num
+        for ip in xrange(num):
+            x = xs[ip] - xr1
+            y = ys[ip] - yr1
+            i = int((x - offsetx) / dx)
+            j = int((y - offsety) / dy)
+            if not (0 <= i < numquadsx and 0 <= j < numquadsy):
+                continue
+            q = i * numquadsy + j
+            pmin = None
+            for k in xrange(qm1[q], qm2[q]):
+                l1, l2, l3 = tri1s[k], tri2s[k], tri3s[k]
+                x1, y1, z1 = vertxs[l1], vertys[l1], vertzs[l1]
+                x12, y12 = vertxs[l2] - x1, vertys[l2] - y1
+                x13, y13 = vertxs[l3] - x1, vertys[l3] - y1
+                d1212 = x12 * x12 + y12 * y12
+                d1213 = x12 * x13 + y12 * y13
+                d1313 = x13 * x13 + y13 * y13
+                den = d1313 * d1212 - d1213 * d1213
+                if den == 0.0: # can happen due to roundoff
+                    p = 1.0
+                    z = z1
+                else:
+                    x1p, y1p = x - x1, y - y1
+                    d131p = x13 * x1p + y13 * y1p
+                    d121p = x12 * x1p + y12 * y1p
+                    b2 = (d1313 * d121p - d1213 * d131p) / den
+                    b3 = (d1212 * d131p - d1213 * d121p) / den
+                    b1 = 1.0 - (b2 + b3)
+                    p = 0.0 # outsideness penalty
+                    for b in (b1, b2, b3):
+                        if b < 0.0:
+                            p += b**2
+                        elif b > 1.0:
+                            p += (b - 1.0)**2
+                    z = b1 * z1 + b2 * vertzs[l2] + b3 * vertzs[l3]
+                if pmin is None or pmin > p:
+                    pmin = p
+                    zpmin = z
+                    kpmin = k
+                    dpmin = (den == 0.0)
+                if p == 0.0:
+                    break
+            zs[ip] = zpmin + zr1
+            cs[ip] = trics[kpmin]
+            if wnorm:
+                if dpmin:
+                    nx, ny, nz = 0.0, 0.0, 1.0
+                else:
+                    l1, l2, l3 = tri1s[kpmin], tri2s[kpmin], tri3s[kpmin]
+                    x1, y1, z1 = vertxs[l1], vertys[l1], vertzs[l1]
+                    x12, y12 = vertxs[l2] - x1, vertys[l2] - y1
+                    z12 = vertzs[l2] - z1
+                    x13, y13 = vertxs[l3] - x1, vertys[l3] - y1
+                    z13 = vertzs[l3] - z1
+                    nx = y12 * z13 - z12 * y13
+                    ny = z12 * x13 - x12 * z13
+                    nz = x12 * y13 - y12 * x13
+                    nl = sqrt(nx**2 + ny**2 + nz**2)
+                    if nl != 0.0:
+                        nx /= nl; ny /= nl; nz /= nl
+                nxs[ip], nys[ip], nzs[ip] = nx, ny, nz
+
+        return zs, cs, ((nxs, nys, nzs) if wnorm else None)
+
+
 if USE_COMPILED:
     from terrain_c import *
@@ -414,6 +414,75 @@ class Trail (object):
         self._end = True
 
 
+class TrailManager (object):
+    """
+    Updater of all polygon trails in a world.
+
+    Trails register themselves on creation, and are then updated
+    in a single task, instead of each trail running its own task.
+
+    Only the update tasks are consolidated. Each trail keeps its own
+    geometry and draw calls, since trail nodes are individually placed
+    into altitude bins for transparency ordering.
+
+    There is one manager per world, obtained by for_world().
+    """
+
+    def __init__ (self, world):
+
+        self.world = world
+
+        self._trails = []
+
+        self.alive = True
+        base.taskMgr.add(self._loop, "trail-manager-loop")
+
+
+    @staticmethod
+    def for_world (world):
+
+        manager = world.trail_manager
+        if manager is None or not manager.alive:
+            manager = TrailManager(world)
+            world.trail_manager = manager
+        return manager
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        self.alive = False
+        self._trails = []
+
+
+    def add (self, trail):
+
+        self._trails.append(trail)
+
+
+    def _loop (self, task):
+
+        if not self.alive:
+            return task.done
+        if not self.world.alive:
+            self.destroy()
+            return task.done
+
+        # Trails added during the update are first updated in next frame.
+        trails = self._trails
+        numtrails = len(trails)
+        kept = []
+        for i in xrange(numtrails):
+            trail = trails[i]
+            if trail.alive and trail._update():
+                kept.append(trail)
+        kept.extend(trails[numtrails:])
+        self._trails = kept
+
+        return task.cont
+
+
 class PolyTrail (object):
 
     def __init__ (self, parent, pos, radius0, radius1, lifespan, color,
@@ -508,7 +577,7 @@ class PolyTrail (object):
         self.init_color = Vec4(self.color)
 
         self.alive = True
-        base.taskMgr.add(self._loop, "polytrail-loop")
+        TrailManager.for_world(self.world).add(self)
 
 
     def destroy (self):
@@ -519,10 +588,10 @@ class PolyTrail (object):
         self.node.removeNode()
 
 
-    def _loop (self, task):
+    def _update (self):
 
         if not self.alive:
-            return task.done
+            return False
 
         dt = self.world.dt
 
@@ -542,11 +611,11 @@ class PolyTrail (object):
             elif (not self._nearpack.any_visible() and
                   not (self._farpack and self._farpack.any_visible())):
                 self.node.hide()
-                return task.cont
+                return True
         elif (not self._nearpack.any_visible() and
               not (self._farpack and self._farpack.any_visible())):
             self.destroy()
-            return task.done
+            return False
 
         if self._lodout_dist is not None:
             hidden = self.node.isHidden()
@@ -579,7 +648,7 @@ class PolyTrail (object):
                 else:
                     self._lodout_alpha_fac = 0.0
             if hidden:
-                return task.cont
+                return True
 
         cleared_near = False
         camfw = self.world.camera.getQuat(self.node).getForward()
@@ -608,7 +677,7 @@ class PolyTrail (object):
                                   self._neartime)
             self._neartime = 0.0
 
-        return task.cont
+        return True
 
 
     def set_active (self, active):
@@ -1336,7 +1405,7 @@ class PolyBraid (object):
             self._start()
 
         self.alive = True
-        base.taskMgr.add(self._loop, "polybraid-loop")
+        TrailManager.for_world(self.world).add(self)
 
 
     def destroy (self):
@@ -1353,10 +1422,10 @@ class PolyBraid (object):
         self.node.removeNode()
 
 
-    def _loop (self, task):
+    def _update (self):
 
         if not self.alive:
-            return task.done
+            return False
 
         dt = self.world.dt
 
@@ -1365,11 +1434,11 @@ class PolyBraid (object):
             if self._wait_delay <= 0.0:
                 if self.pnode.isEmpty():
                     self.destroy()
-                    return task.done
+                    return False
                 self._start()
                 self._wait_delay = None
             else:
-                return task.cont
+                return True
 
         apos = Point3()
         aquat = Quat()
@@ -1381,7 +1450,7 @@ class PolyBraid (object):
         elif (not self._nearbraid.any_visible() and
               not (self._farbraid and self._farbraid.any_visible())):
             self.destroy()
-            return task.done
+            return False
 
         if self._lodout_dist is not None:
             hidden = self.node.isHidden()
@@ -1414,7 +1483,7 @@ class PolyBraid (object):
                 else:
                     self._lodout_alpha_fac = 0.0
             if hidden:
-                return task.cont
+                return True
 
         if self._loddir_ang is not None:
             if self._loddir_pause_wait <= 0.0:
@@ -1477,7 +1546,7 @@ class PolyBraid (object):
                     radius = self._obradius + (self._obradius2 - self._obradius) * ifac
                     self._overbright.update(color=color, radius=radius)
 
-        return task.cont
+        return True
 
 
 # :also-compiled:
@@ -1878,7 +1947,7 @@ class PolyBurn (object):
         self._wait_remove = duration
 
         self.alive = True
-        base.taskMgr.add(self._loop, "polyburn-loop")
+        TrailManager.for_world(self.world).add(self)
 
 
     def destroy (self):
@@ -1895,10 +1964,10 @@ class PolyBurn (object):
         self.node.removeNode()
 
 
-    def _loop (self, task):
+    def _update (self):
 
         if not self.alive:
-            return task.done
+            return False
 
         dt = self.world.dt
 
@@ -1907,11 +1976,11 @@ class PolyBurn (object):
             if self._wait_delay <= 0.0:
                 if self.pnode.isEmpty():
                     self.destroy()
-                    return task.done
+                    return False
                 self._start()
                 self._wait_delay = None
             else:
-                return task.cont
+                return True
 
         if self._wait_remove is not None:
             self._wait_remove -= dt
@@ -1926,7 +1995,7 @@ class PolyBurn (object):
             havepq = True
         elif not self._geom.any_visible():
             self.destroy()
-            return task.done
+            return False
 
         cleared_near = False
         camfw = self.world.camera.getQuat(self.node).getForward()
@@ -1960,7 +2029,7 @@ class PolyBurn (object):
                     radius = self._obradius + (self._obradius2 - self._obradius) * ifac
                     self._overbright.update(color=color, radius=radius)
 
-        return task.cont
+        return True
 
 
 # :also-compiled:
@@ -405,12 +405,14 @@ class Turret (Body):
             refcannon = self.cannons[0]
             allied_sides = self.world.get_allied_sides(self.side)
             tbody, prio = None, 0
+            maxdist = refcannon.effrange * 1.5
+            pos = self.pos()
             for family, prio in self._aa_families:
                 bodysel = []
-                for body in self.world.iter_bodies(family):
+                for body in self.world.bodies_within(pos, maxdist, family):
                     if body.side not in allied_sides and not body.shotdown:
                         bdist = self.dist(body)
-                        if bdist < refcannon.effrange * 1.5:
+                        if bdist < maxdist:
                             bodysel.append((body, bdist))
                 if bodysel:
                     tbody = sorted(bodysel, key=lambda x: x[1])[0][0]
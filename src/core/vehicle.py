@@ -1,6 +1,6 @@
 # -*- coding: UTF-8 -*-
 
-from math import floor, radians, degrees, pi, sin, cos, atan2
+from math import floor, ceil, radians, degrees, pi, sin, cos, tan, atan2
 
 from pandac.PandaModules import Vec3, Vec3D, Vec4, Point3, Point3D, Quat
 from pandac.PandaModules import NodePath, AmbientLight
@@ -289,6 +289,9 @@ class Vehicle (Body):
         self._path_pos = 0.0
         self._throttle = 0.0
 
+        # Convoy which moves the vehicle, if any.
+        self._convoy = None
+
         # Control inputs.
         self.zero_inputs()
 
@@ -518,6 +521,24 @@ class Vehicle (Body):
         return task.cont
 
 
+    @staticmethod
+    def move_batch (vehicles, dt):
+        """
+        Move convoys of vehicles, each in one pass over its members,
+        ahead of moves of vehicles on their own.
+        """
+
+        if dt == 0.0:
+            return
+
+        convoys = set()
+        for vehicle in vehicles:
+            if vehicle._convoy is not None:
+                convoys.add(vehicle._convoy)
+        for convoy in convoys:
+            convoy._move(dt)
+
+
     def move (self, dt):
         # Base override.
         # Called by world at end of frame.
@@ -525,6 +546,10 @@ class Vehicle (Body):
         if dt == 0.0:
             return
 
+        if self._convoy is not None:
+            # Already moved by the convoy.
+            return
+
         pos, hpr, tdir, ndir, hdir, tspf = self._prev_gfix
         tvelg, = self._prev_dyn
         zdir = Vec3D(0, 0, 1)
@@ -616,12 +641,12 @@ class Vehicle (Body):
         # Compute approximate ground contact plane as if
         # the rotation were only by heading.
         gyro.setHpr(hpr1[0], 0.0, 0.0)
-        gcpcs = []
-        for rgcp in gcont:
-            gcp1c = ptod(world.node.getRelativePoint(gyro, rgcp))
-            elv = world.elevation(pos1 + gcp1c)
-            gcpc = Point3D(gcp1c[0], gcp1c[1], gcp1c[2] + elv)
-            gcpcs.append(gcpc)
+        gcp1cs = [ptod(world.node.getRelativePoint(gyro, rgcp))
+                  for rgcp in gcont]
+        elvs = world.elevation_many([pos1[0] + c[0] for c in gcp1cs],
+                                    [pos1[1] + c[1] for c in gcp1cs])
+        gcpcs = [Point3D(c[0], c[1], c[2] + elv)
+                 for c, elv in zip(gcp1cs, elvs)]
         gcfc, gclc, gcrc = gcpcs
         ndir = unitv((gclc - gcfc).cross(gcrc - gcfc))  # plane normal
         gpz = (gcfc[2] + gclc[2] + gcrc[2]) / 3
@@ -1032,3 +1057,259 @@ class Vehicle (Body):
         update_text(self._state_info_text, text=text)
 
 
+class Convoy (object):
+    """
+    Column of vehicles moving together along a common route.
+
+    The route is turned once into a path of straight segments joined
+    by arcs, and the ground profile along the path (height, normal,
+    orientation) is sampled in one batch of elevation queries.
+    Every frame the members are placed at fixed spacings behind
+    the leader by interpolating this profile, without terrain queries
+    or scene graph operations per vehicle.
+
+    Members ignore their own autopilot while in the convoy.
+    A member which is shot down or released continues on its own.
+    """
+
+    def __init__ (self, world, vehicles, route,
+                  speed=None, spacing=None, turnrad=None, step=2.0):
+        """
+        Parameters:
+        - world (World): the world
+        - vehicles ([Vehicle*]): members of the convoy, front to back
+        - route ([Point3*]): points through which the convoy drives;
+            members are placed at its start, and only x and y
+            coordinates are used
+        - speed (float): cruising speed; if not given,
+            the lowest optimal speed of members
+        - spacing (float): distance between members along the path;
+            if not given, based on the longest member
+        - turnrad (float): turn radius at route points
+        - step (float): distance between samples of the ground profile
+        """
+
+        if len(route) < 2:
+            raise StandardError("Convoy route must have at least 2 points.")
+
+        self.world = world
+        self.members = list(vehicles)
+
+        if speed is None:
+            speed = min(v.limspeeds(slope=0.0, tspf=1.0)[0]
+                        for v in self.members)
+        self._speed = speed
+        self._maxacc = min(v.maxthracc for v in self.members)
+        self._maxdec = min(v.maxbracc for v in self.members)
+        if spacing is None:
+            spacing = 2.0 * max(v._length for v in self.members)
+        if turnrad is None:
+            turnrad = max(20.0, max(speed / v.maxturnrate
+                                    for v in self.members))
+
+        self._path_pieces = Convoy._make_path(route, turnrad)
+        self._path_length = sum(c.length() for c in self._path_pieces)
+        self._profile_step = step
+        self._profile = Convoy._make_profile(world, self._path_pieces,
+                                             self._path_length, step)
+
+        self._offsets = [i * spacing for i in xrange(len(self.members))]
+        self._lead_pos = min(self._offsets[-1], self._path_length)
+        self._lead_speed = 0.0
+        self._lead_acc = 0.0
+
+        for vehicle in self.members:
+            vehicle.zero_ap()
+            vehicle._convoy = self
+            world.set_batch_mover(vehicle.family, Vehicle.move_batch)
+        self._place_members(0.0)
+
+        self.alive = True
+
+
+    def destroy (self):
+
+        if not self.alive:
+            return
+        for vehicle in self.members:
+            self._release(vehicle)
+        self.members = []
+        self.alive = False
+
+
+    def release (self, vehicle):
+        """
+        Take the vehicle out of the convoy, to continue on its own.
+        """
+
+        if vehicle in self.members:
+            self._release(vehicle)
+            i = self.members.index(vehicle)
+            self.members.pop(i)
+            self._offsets.pop(i)
+
+
+    def set_speed (self, speed):
+
+        self._speed = speed
+
+
+    def _release (self, vehicle):
+
+        vehicle._convoy = None
+        vehicle.path = None
+        vehicle.pspeed = vehicle._prev_dyn[0]
+
+
+    @staticmethod
+    def _make_path (route, turnrad):
+
+        zdir = Vec3D(0, 0, 1)
+        points = [Vec3D(p[0], p[1], 0.0) for p in route]
+        pieces = []
+        p0 = points[0]
+        for i in xrange(1, len(points) - 1):
+            pp, pc, pn = points[i - 1], points[i], points[i + 1]
+            din = unitv(pc - pp)
+            dout = unitv(pn - pc)
+            dang = norm_ang_delta(atan2(-din[0], din[1]),
+                                  atan2(-dout[0], dout[1]))
+            if abs(dang) < 1e-4:
+                continue
+            # Limit tangent length to half of neighboring legs,
+            # for consecutive arcs not to overlap.
+            tfac = tan(0.5 * abs(dang))
+            maxtlen = 0.5 * min((pc - pp).length(), (pn - pc).length())
+            rad = min(turnrad, maxtlen / tfac)
+            tlen = rad * tfac
+            pa = pc - din * tlen
+            if (pa - p0).length() > 1e-3:
+                pieces.append(Segment(p0, pa, zdir))
+            rdir = zdir.cross(din) * sign(dang)
+            pieces.append(Arc(rad, abs(dang), pa, din, rdir))
+            p0 = pc + dout * tlen
+        if (points[-1] - p0).length() > 1e-3:
+            pieces.append(Segment(p0, points[-1], zdir))
+        return pieces
+
+
+    @staticmethod
+    def _make_profile (world, pieces, length, step):
+
+        numsmp = int(ceil(length / step)) + 1
+        pts = []
+        tngs = []
+        nrms = []
+        rads = []
+        ic = 0
+        sc0 = 0.0
+        for k in xrange(numsmp):
+            s = min(k * step, length)
+            while (ic + 1 < len(pieces) and
+                   s > sc0 + pieces[ic].length()):
+                sc0 += pieces[ic].length()
+                ic += 1
+            curve = pieces[ic]
+            sc = min(s - sc0, curve.length())
+            pts.append(curve.point(sc))
+            tngs.append(curve.tangent(sc))
+            nrms.append(curve.normal(sc))
+            rads.append(curve.radius(sc))
+
+        elvs, (nxs, nys, nzs) = world.elevation_many(
+            [p[0] for p in pts], [p[1] for p in pts], wnorm=True)
+
+        # Orientations are computed as in Vehicle._fix_to_ground,
+        # but only once per sample.
+        gyro = NodePath("convoy-gyro")
+        profile = []
+        for k in xrange(numsmp):
+            pos = Point3D(pts[k][0], pts[k][1], elvs[k])
+            ndir = unitv(Vec3D(nxs[k], nys[k], nzs[k]))
+            hdir = unitv(Vec3D(tngs[k][0], tngs[k][1], 0.0))
+            tdirz = -(hdir[0] * ndir[0] + hdir[1] * ndir[1]) / ndir[2]
+            tdir = unitv(Vec3D(hdir[0], hdir[1], tdirz))
+            gyro.lookAt(ptof(tdir), vtof(ndir))
+            hpr = vtod(gyro.getHpr())
+            profile.append([pos, hpr, tdir, ndir, hdir, nrms[k], rads[k]])
+        gyro.removeNode()
+
+        # Store differences to next sample, for interpolation.
+        for k in xrange(numsmp):
+            pos, hpr = profile[k][:2]
+            if k + 1 < numsmp:
+                pos1, hpr1 = profile[k + 1][:2]
+                dpos = pos1 - pos
+                dhpr = Vec3D(norm_ang_delta(hpr[0], hpr1[0], indeg=True),
+                             hpr1[1] - hpr[1], hpr1[2] - hpr[2])
+            else:
+                dpos = Vec3D()
+                dhpr = Vec3D()
+            profile[k][2:2] = [dpos, dhpr]
+        return profile
+
+
+    def _move (self, dt):
+
+        if not self.alive:
+            return
+
+        for vehicle in list(self.members):
+            if not vehicle.alive or vehicle.controlout:
+                self.release(vehicle)
+        if not self.members:
+            self.destroy()
+            return
+
+        # Leader speed within limits of all members on their slopes,
+        # and braking to stop at the end of the path.
+        step = self._profile_step
+        numsmp = len(self._profile)
+        tspeed = self._speed
+        for vehicle, offset in zip(self.members, self._offsets):
+            k = int((self._lead_pos - offset) / step)
+            hpr = self._profile[min(max(k, 0), numsmp - 1)][1]
+            maxspeed = vehicle.limspeeds(slope=radians(hpr[1]), tspf=1.0)[1]
+            tspeed = min(tspeed, maxspeed)
+        remlen = self._path_length - self._lead_pos
+        tspeed = min(tspeed, (2.0 * self._maxdec * remlen)**0.5)
+        speed = self._lead_speed
+        acc = clamp((tspeed - speed) / dt, -self._maxdec, self._maxacc)
+        speed1 = max(speed + acc * dt, 0.0)
+        self._lead_pos = min(self._lead_pos + 0.5 * (speed + speed1) * dt,
+                             self._path_length)
+        self._lead_speed = speed1
+        self._lead_acc = acc
+
+        self._place_members(dt)
+
+
+    def _place_members (self, dt):
+
+        step = self._profile_step
+        numsmp = len(self._profile)
+        speed = self._lead_speed
+        acc = self._lead_acc
+        for vehicle, offset in zip(self.members, self._offsets):
+            s = max(self._lead_pos - offset, 0.0)
+            k = min(int(s / step), numsmp - 1)
+            f = (s - k * step) / step
+            ret = self._profile[k]
+            pos, hpr, dpos, dhpr, tdir, ndir, hdir, pnrm, prad = ret
+            pos1 = pos + dpos * f
+            hpr1 = hpr + dhpr * f
+            if vehicle.sink:
+                pos1 += ndir * -vehicle.sink
+
+            vehicle.node.setPos(ptof(pos1))
+            vehicle.node.setHpr(vtof(hpr1))
+            vehicle._prev_gfix = (pos1, hpr1, tdir, ndir, hdir, 1.0)
+            vehicle._prev_dyn = (speed,)
+
+            cslope = cos(radians(hpr1[1]))
+            vel = tdir * (speed / cslope)
+            acc1 = tdir * (acc / cslope) + pnrm * (speed**2 / prad)
+            vehicle._prev_vel = Vec3(vehicle._vel) # needed in base class
+            vehicle._vel = vtof(vel) # needed in base class
+            vehicle._acc = vtof(acc1) # needed in base class
+            vehicle._throttle = clamp(speed / vehicle.maxspeed, 0.0, 1.0)
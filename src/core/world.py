@@ -1,7 +1,8 @@
 # -*- coding: UTF-8 -*-
 
+from array import array
 from bisect import bisect
-from math import radians, sqrt, tan, acos, atan, exp, log
+from math import radians, sqrt, tan, acos, atan, exp, log, floor
 
 from direct.showbase.DirectObject import DirectObject
 from pandac.PandaModules import NodePath
@@ -192,6 +193,8 @@ class World (object):
         self._sunbcolspc = lt
         self.node.setShaderInput(self.shdinp.sunposn, pnd)
         self.node.setShaderInput(self.shdinp.sunbcoln, lnd)
+        self.shdinp.daytabn = "INdaytab"
+        self.shdinp.daytimen = "INdaytime"
         self.shdinp.moonposn = "INmoonpos"
         pnd = NodePath("sunpos-dummy")
         self.node.setShaderInput(self.shdinp.moonposn, pnd)
@@ -219,6 +222,7 @@ class World (object):
 
         self._bodies = {}
         self._families_by_move_priority = []
+        self._batch_movers = {}
 
         self._single_actions = {}
 
@@ -247,9 +251,32 @@ class World (object):
         self._state_info_last_frame = 0.0
 
         # Collisions.
+        # Precise tests are done by the traverser, but only between
+        # candidate pairs of hitboxes found through the body grid.
+        # Hitboxes of fast bodies are instead swept along their motion.
         self.ctrav = CollisionTraverser("collision-traverser")
         self.cqueue = CollisionHandlerQueue()
         self._collisions = {}
+        self._from_hitboxes = {}
+        # Largest distance of a hitbox surface from its body position,
+        # to widen grid queries for hitboxes.
+        self._hitbox_reach = 0.0
+        self._swept_families = set((
+            "shell",
+            "rocket",
+        ))
+
+        # Pooled invisible cannon shells, created on first use.
+        self.shell_swarm = None
+
+        # Scheduler of plane autopilot decisions, created on first use.
+        self.act_scheduler = None
+
+        # Updater of polygon trails, created on first use.
+        self.trail_manager = None
+
+        # Drawer of instanced buildings, created on first use.
+        self.building_instancer = None
 
         # Explosions.
         self._explosion_affected_families = set((
@@ -261,7 +288,6 @@ class World (object):
             "building",
             "ship",
         ))
-        self._explosion_ctrav = CollisionTraverser("collision-traverser-explosion")
         self._explosions = []
 
         # LIFO removal of bodies.
@@ -302,6 +328,11 @@ class World (object):
         self._visradius_extfac = 1.02
 
         self._select_bodies_cache = {}
+        self._targeting_bodies_cache = None
+        self._max_body_value_cache = {}
+
+        # Spatial index of bodies.
+        self._body_grid = BodyGrid(cellsize=2000.0)
 
         # Body tagging.
         self._tagging_bodies = set()
@@ -327,6 +358,9 @@ class World (object):
         base.set_particle_dt_function(lambda: self.dt)
         Dialog.set_dt_function(lambda: self.dt)
 
+        if base.benchmark is not None:
+            base.benchmark.set_world(self)
+
         self.alive = True
 
         # Before and after all other game logic loops in the frame.
@@ -395,19 +429,23 @@ class World (object):
         # Move bodies.
         for family in self._families_by_move_priority:
             fbodies = self._bodies[family]
+            batchf = self._batch_movers.get(family)
+            if batchf is not None:
+                batchf([body for fsbodies in fbodies.itervalues()
+                        for body in fsbodies], self.dt)
             for fsbodies in fbodies.itervalues():
                 for body in fsbodies:
                     body.move(self.dt)
                     body.after_move()
 
+        # Update spatial index to moved bodies.
+        self._body_grid.update(self._bodies)
+
         # Detect collisions.
         # This is done in pre-loop so that other game logic loops
         # can check if there is pending collision evaluation in post-loop.
-        self.ctrav.traverse(self.node)
         self._collisions = {}
-        for centry in self.cqueue.getEntries():
-            self._collect_collision(centry, self._collisions)
-        self.cqueue.clearEntries()
+        self._detect_collisions(self._collisions)
 
         # Update times.
         # This must be done after bodies have been moved with old time step,
@@ -464,9 +502,9 @@ class World (object):
         self._collisions = {}
 
         # Evaluate explosions.
-        for force, ref, touch in self._explosions:
-            self._evaluate_explosion(force, ref, touch)
-        self._explosions = []
+        if self._explosions:
+            self._evaluate_explosions(self._explosions)
+            self._explosions = []
 
         # Select and destroy action chasers.
         if self.action_chasers:
@@ -498,6 +536,7 @@ class World (object):
                         to_remove.append(body)
                 for body in to_remove:
                     fsbodies.remove(body)
+                    self._body_grid.remove(body)
 
         ## Move bodies. Should be done in pre-loop.
 
@@ -677,6 +716,8 @@ class World (object):
 
         # Invalidate per-frame caches.
         self._select_bodies_cache = {}
+        self._targeting_bodies_cache = None
+        self._max_body_value_cache = {}
 
         # Take away control from player in pause.
         # FIXME: Cannot be done by changing self.player_control_level.
@@ -944,6 +985,17 @@ class World (object):
             self._plight_bspecs.append(bspec)
 
 
+    def set_batch_mover (self, family, movef):
+        """
+        Set the function which moves bodies of the family together.
+
+        The function is called with the list of bodies of the family
+        and the time step, before the bodies are moved one by one.
+        """
+
+        self._batch_movers[family] = movef
+
+
     def register_plight (self, light):
 
         cnd = CollisionNode(light.name)
@@ -1033,6 +1085,70 @@ class World (object):
         return bodies
 
 
+    def bodies_within (self, pos, radius, family=None, side=None):
+        """
+        Return the list of bodies within the given distance of the position,
+        optionally only those of given families and sides.
+
+        Bodies are found by their positions after the last move,
+        so those created since are not included.
+        """
+
+        return self._body_grid.within(pos, radius, family, side)
+
+
+    def targeting_bodies (self, target, family=None):
+        """
+        Return the list of bodies which have the given body as target,
+        optionally only those of given families.
+
+        Bodies are indexed by target once per frame, on first query.
+        """
+
+        index = self._targeting_bodies_cache
+        if index is None:
+            index = {}
+            for body in self.iter_bodies():
+                btarget = getattr(body, "target", None)
+                if btarget is not None and body.alive:
+                    bodies = index.get(btarget)
+                    if bodies is None:
+                        bodies = []
+                        index[btarget] = bodies
+                    bodies.append(body)
+            self._targeting_bodies_cache = index
+        bodies = index.get(target, ())
+        if family is not None:
+            families = as_sequence(family)
+            bodies = [b for b in bodies if b.alive and b.family in families]
+        else:
+            bodies = [b for b in bodies if b.alive]
+        return bodies
+
+
+    def max_body_value (self, family, name, valuef):
+        """
+        Return the maximum of the value computed by the function
+        over all alive bodies of given families, or None if there are
+        no such bodies.
+
+        The name identifies the value in the per-frame cache.
+        """
+
+        families = tuple(sorted(as_sequence(family)))
+        vkey = (families, name)
+        if vkey in self._max_body_value_cache:
+            return self._max_body_value_cache[vkey]
+        maxval = None
+        for body in self.iter_bodies(families):
+            if body.alive:
+                val = valuef(body)
+                if maxval is None or maxval < val:
+                    maxval = val
+        self._max_body_value_cache[vkey] = maxval
+        return maxval
+
+
     def airdens (self, alt):
 
         return self.airdens0 * self.airdens_factor(alt)
@@ -1099,6 +1215,54 @@ class World (object):
             return maxh
 
 
+    def elevation_many (self, xs, ys,
+                        igntrs=None, wnorm=False, wtype=False, flush=False):
+        """
+        Return elevations at many points at once, as an array.
+
+        Like elevation(), but over sequences of x and y coordinates.
+        Normals are returned as the tuple of arrays of their components,
+        and ground types as an array.
+        """
+
+        reftrs = self._get_referent_terrains(igntrs)
+        num = len(xs)
+        wnt = wnorm or wtype
+        if reftrs:
+            maxhs = None
+            for tr in reftrs:
+                if wnt:
+                    hs, ns, ts = tr.height_many(xs, ys, True, flush)
+                else:
+                    hs = tr.height_many(xs, ys, False, flush)
+                if maxhs is None:
+                    maxhs = hs
+                    if wnt:
+                        nmaxhs, tmaxhs = ns, ts
+                    continue
+                for ip in xrange(num):
+                    if maxhs[ip] < hs[ip]:
+                        maxhs[ip] = hs[ip]
+                        if wnt:
+                            for nc, nmc in zip(ns, nmaxhs):
+                                nmc[ip] = nc[ip]
+                            tmaxhs[ip] = ts[ip]
+        else:
+            maxhs = array("d", [0.0]) * num
+            nmaxhs = (array("d", [0.0]) * num, array("d", [0.0]) * num,
+                      array("d", [1.0]) * num)
+            tmaxhs = array("i", [-1]) * num
+
+        if wnorm and wtype:
+            return maxhs, nmaxhs, tmaxhs
+        elif wnorm:
+            return maxhs, nmaxhs
+        elif wtype:
+            return maxhs, tmaxhs
+        else:
+            return maxhs
+
+
     def max_elevation (self, igntrs=None):
 
         reftrs = self._get_referent_terrains(igntrs)
@@ -1176,7 +1340,113 @@ class World (object):
         return body in self._collisions
 
 
-    def _collect_collision (self, centry, collisions):
+    def add_hitbox (self, hbx):
+
+        reach = hbx.center.length() + hbx.radius
+        if self._hitbox_reach < reach:
+            self._hitbox_reach = reach
+        if hbx.isfrom:
+            hbxs = self._from_hitboxes.get(hbx.pbody)
+            if hbxs is None:
+                hbxs = []
+                self._from_hitboxes[hbx.pbody] = hbxs
+            hbxs.append(hbx)
+
+
+    def remove_hitbox (self, hbx):
+
+        hbxs = self._from_hitboxes.get(hbx.pbody)
+        if hbxs is not None and hbx in hbxs:
+            hbxs.remove(hbx)
+            if not hbxs:
+                del self._from_hitboxes[hbx.pbody]
+
+
+    def _detect_collisions (self, collisions):
+
+        wnode = self.node
+        dt = self.dt
+        ireach = self._hitbox_reach
+
+        # Find candidate bodies for active from-hitboxes of each body.
+        colliders_by_body = {}
+        for body, hbxs in self._from_hitboxes.items():
+            if not body.alive:
+                continue
+            hbxs = [h for h in hbxs if h.active]
+            if not hbxs:
+                continue
+            bpos = body.pos()
+            qradius = max(h.center.length() + h.radius for h in hbxs) + ireach
+            swept = body.family in self._swept_families
+            initiator = None
+            if swept:
+                bvel = body.vel()
+                qradius += bvel.length() * dt
+                # Sweep capsule extends back to the muzzle when just fired.
+                initiator = getattr(body, "initiator", None)
+            targets = []
+            for obody in self._body_grid.within(bpos, qradius):
+                if obody is body or obody is initiator:
+                    continue
+                ohbxs = [h for h in obody.hitboxes if h.isinto and h.active]
+                if ohbxs:
+                    targets.append((obody, ohbxs))
+            if not targets:
+                continue
+            if swept:
+                self._sweep_hitboxes(body, hbxs, bvel * dt, targets,
+                                     collisions)
+            else:
+                for obody, ohbxs in targets:
+                    colliders = colliders_by_body.get(obody)
+                    if colliders is None:
+                        colliders = []
+                        colliders_by_body[obody] = colliders
+                    colliders.extend(hbxs)
+
+        # Test candidates precisely, traversing only each candidate body.
+        ctrav = self.ctrav
+        cqueue = self.cqueue
+        for obody, colliders in colliders_by_body.iteritems():
+            ctrav.clearColliders()
+            for hbx in colliders:
+                ctrav.addCollider(hbx.cnode, cqueue)
+            ctrav.traverse(obody.node)
+            for centry in cqueue.getEntries():
+                self._collect_collision_entry(centry, collisions)
+            cqueue.clearEntries()
+        ctrav.clearColliders()
+
+
+    def _sweep_hitboxes (self, body, hbxs, disp, targets, collisions):
+
+        # Each hitbox is taken as a capsule along body forward axis,
+        # extended backward by the displacement in the last frame.
+        wnode = self.node
+        for hbx in hbxs:
+            hoff = Vec3(0.0, hbx.axhlen, 0.0)
+            p1 = wnode.getRelativePoint(body.node, hbx.center + hoff)
+            p0 = wnode.getRelativePoint(body.node, hbx.center - hoff) - disp
+            hit = None
+            for obody, ohbxs in targets:
+                lp0 = obody.node.getRelativePoint(wnode, p0)
+                lp1 = obody.node.getRelativePoint(wnode, p1)
+                for ohbx in ohbxs:
+                    t = ohbx.sweep_param(lp0, lp1, hbx.axrad)
+                    if t is not None and (hit is None or t < hit[0]):
+                        hit = (t, ohbx, p0 + (p1 - p0) * t)
+            if hit is not None:
+                t, ohbx, cpos = hit
+                obody = ohbx.pbody
+                self._collect_collision(
+                    hbx, ohbx,
+                    body.node.getRelativePoint(wnode, cpos),
+                    obody.node.getRelativePoint(wnode, cpos),
+                    collisions)
+
+
+    def _collect_collision_entry (self, centry, collisions):
 
         nd_from = centry.getFromNodePath()
         hbx_from = nd_from.getPythonTag("hitbox")
@@ -1186,22 +1456,29 @@ class World (object):
         body_into = hbx_into.pbody
         if body_into is body_from:
             return
+        if centry.hasSurfacePoint():
+            cpos_from = centry.getSurfacePoint(body_from.node)
+            cpos_into = centry.getSurfacePoint(body_into.node)
+        else:
+            cpos_from = hbx_from.center
+            cpos_into = hbx_into.center
+        self._collect_collision(hbx_from, hbx_into, cpos_from, cpos_into,
+                                collisions)
+
+
+    def _collect_collision (self, hbx_from, hbx_into, cpos_from, cpos_into,
+                            collisions):
+
+        body_from = hbx_from.pbody
+        body_into = hbx_into.pbody
 
         if True:
-            if centry.hasSurfacePoint():
-                cpos_from = centry.getSurfacePoint(body_from.node)
-            else:
-                cpos_from = hbx_from.center
             cp = collisions.get(body_from)
             if cp is None:
                 cp = []
                 collisions[body_from] = cp
             cp.append((body_into, hbx_from, cpos_from))
         if not hbx_into.isfrom or not hbx_from.isinto:
-            if centry.hasSurfacePoint():
-                cpos_into = centry.getSurfacePoint(body_into.node)
-            else:
-                cpos_into = hbx_into.center
             cp = collisions.get(body_into)
             if cp is None:
                 cp = []
@@ -1214,71 +1491,69 @@ class World (object):
         self._explosions.append((force, ref, touch))
 
 
-    def _evaluate_explosion (self, force, ref, touch=[]):
-
-        # Create collision sphere for extent of explosion.
-        maxdist = explosion_reach(force)
-        cnd = CollisionNode("explosion")
-        cs = CollisionSphere(Point3(), maxdist)
-        cnd.addSolid(cs)
-        cnd.setIntoCollideMask(0x0000)
-        expnd = self.node.attachNewNode(cnd)
-        pos = ref.pos() if isinstance(ref, Body) else ref
-        expnd.setPos(pos)
-
-        # Collect collided hitboxes, with minimum collision distances.
-        ctrav = self._explosion_ctrav
-        cqueue = CollisionHandlerQueue()
-        ctrav.clearColliders()
-        ctrav.addCollider(expnd, cqueue)
-        ctrav.traverse(self.node)
-        dist_by_hbx = {}
-        tbodies = set(b for b, f in touch)
-        for centry in cqueue.getEntries():
-            bcnode = centry.getIntoNode()
-            hbx = bcnode.getPythonTag("hitbox")
-            body = hbx.pbody
-            if (hbx.active and
-                body is not ref and body not in tbodies and
-                body.family in self._explosion_affected_families):
-                dist = maxdist + 1.0
-                if centry.hasSurfacePoint():
-                    dist1 = centry.getSurfacePoint(expnd).length()
-                    dist = min(dist, dist1)
-                dist2 = expnd.getPos(hbx.cnode).length()
-                dist = min(dist, dist2)
-                odist = dist_by_hbx.get(hbx)
-                if odist is None or dist < odist:
-                    dist_by_hbx[hbx] = dist
-        expnd.removeNode()
-
-        # Create dummy explosion body.
-        ebody = None
-        if dist_by_hbx or touch:
-            ebody = Body(world=self, family="effect", species="explosion",
-                         hitforce=force, name="", side="", pos=pos,
-                         hitinto=False)
-            ebody.hist_critical = False
-            if isinstance(ref, Body):
-                ebody.initiator = ref.initiator
-
-        # Add damage to collided hitboxes.
-        for hbx, dist in dist_by_hbx.items():
-            ebody.hitforce = explosion_dropoff(force, dist)
-            body = hbx.pbody
-            body.collide(ebody, hbx, Point3())
-
-        # Add damage to touched hitboxes.
-        for body, eforce in touch:
-            ebody.hitforce = eforce
-            dbgval(1, "thunder-of-god",
-                   (self.time, "%.1f", "time", "s"),
-                   ("%s(%s)" % (body.name, body.species), "%s", "into"),
-                   (eforce, "%.2f", "force"))
-            for hbx in body.hitboxes:
+    def _evaluate_explosions (self, explosions):
+
+        # Explosion bodies, one per initiator, since hit bodies keep
+        # the last body which damaged them to record kills.
+        ebodies = {}
+        def get_ebody (ref, force, pos):
+            initiator = ref.initiator if isinstance(ref, Body) else None
+            ebody = ebodies.get(initiator)
+            if ebody is None:
+                ebody = Body(world=self, family="effect", species="explosion",
+                             hitforce=force, name="", side="", pos=pos,
+                             hitinto=False)
+                ebody.hist_critical = False
+                ebody.initiator = initiator
+                ebodies[initiator] = ebody
+            ebody.node.setPos(pos)
+            return ebody
+
+        families = self._explosion_affected_families
+        for force, ref, touch in explosions:
+            maxdist = explosion_reach(force)
+            pos = ref.pos() if isinstance(ref, Body) else ref
+
+            # Collect hitboxes within reach, with minimum distances.
+            # Candidate bodies are taken from the body grid, and their
+            # hitboxes tested directly against the reach of explosion.
+            dist_by_hbx = []
+            tbodies = set(b for b, f in touch)
+            qradius = maxdist + self._hitbox_reach
+            for body in self._body_grid.within(pos, qradius, families):
+                if body is ref or body in tbodies:
+                    continue
+                bpos = None
+                for hbx in body.hitboxes:
+                    if not (hbx.active and hbx.isinto):
+                        continue
+                    if bpos is None:
+                        bpos = body.node.getRelativePoint(self.node, pos)
+                    sdist = hbx.surface_distance(bpos)
+                    if sdist <= maxdist:
+                        # Full damage when centered inside a solid.
+                        dist = max(sdist, 0.0)
+                        dist_by_hbx.append((hbx, dist))
+
+            # Add damage to collided hitboxes.
+            for hbx, dist in dist_by_hbx:
+                ebody = get_ebody(ref, force, pos)
+                ebody.hitforce = explosion_dropoff(force, dist)
+                body = hbx.pbody
                 body.collide(ebody, hbx, Point3())
 
-        if ebody:
+            # Add damage to touched hitboxes.
+            for body, eforce in touch:
+                ebody = get_ebody(ref, force, pos)
+                ebody.hitforce = eforce
+                dbgval(1, "thunder-of-god",
+                       (self.time, "%.1f", "time", "s"),
+                       ("%s(%s)" % (body.name, body.species), "%s", "into"),
+                       (eforce, "%.2f", "force"))
+                for hbx in body.hitboxes:
+                    body.collide(ebody, hbx, Point3())
+
+        for ebody in ebodies.itervalues():
             ebody.destroy()
 
 
@@ -1372,17 +1647,6 @@ class World (object):
         return fsides
 
 
-    def get_friendlies (self, families, side):
-
-        friendlies = set()
-        allied_sides = self.get_allied_sides(side)
-        for family in families:
-            for body in self.iter_bodies(family):
-                if body.side in allied_sides:
-                    friendlies.add(body)
-        return friendlies
-
-
     def set_allied_to_all (self, sides):
 
         self._allied_to_all = set(sides)
@@ -1672,6 +1936,109 @@ class Stopwatch (object):
         return self._passtime >= sec
 
 
+class BodyGrid (object):
+    """
+    Uniform horizontal grid of bodies, by family.
+
+    Grid is updated incrementally, by moving bodies between cells
+    only when they change the cell.
+    """
+
+    def __init__ (self, cellsize):
+
+        self._cellsize = float(cellsize)
+        self._cells = {}
+        self._cell_by_body = {}
+        self._pos_by_body = {}
+
+
+    def _cell_key (self, pos):
+
+        cs = self._cellsize
+        return (int(floor(pos[0] / cs)), int(floor(pos[1] / cs)))
+
+
+    def update (self, bodies):
+
+        cell_by_body = self._cell_by_body
+        pos_by_body = self._pos_by_body
+        for family, fbodies in bodies.iteritems():
+            fcells = self._cells.get(family)
+            if fcells is None:
+                fcells = {}
+                self._cells[family] = fcells
+            for fsbodies in fbodies.itervalues():
+                for body in fsbodies:
+                    if not body.alive:
+                        continue
+                    pos = body.pos()
+                    pos_by_body[body] = pos
+                    ckey = self._cell_key(pos)
+                    ockey = cell_by_body.get(body)
+                    if ockey != ckey:
+                        if ockey is not None:
+                            ocell = fcells[ockey]
+                            ocell.discard(body)
+                            if not ocell:
+                                del fcells[ockey]
+                        cell = fcells.get(ckey)
+                        if cell is None:
+                            cell = set()
+                            fcells[ckey] = cell
+                        cell.add(body)
+                        cell_by_body[body] = ckey
+
+
+    def remove (self, body):
+
+        ckey = self._cell_by_body.pop(body, None)
+        if ckey is not None:
+            fcells = self._cells[body.family]
+            cell = fcells[ckey]
+            cell.discard(body)
+            if not cell:
+                del fcells[ckey]
+        self._pos_by_body.pop(body, None)
+
+
+    def _family_cells (self, family):
+
+        if family is None:
+            return self._cells.values()
+        else:
+            return [self._cells[f] for f in as_sequence(family)
+                    if f in self._cells]
+
+
+    def within (self, pos, radius, family=None, side=None):
+
+        sides = set(as_sequence(side)) if side is not None else None
+        pos_by_body = self._pos_by_body
+        radius2 = radius**2
+        i0, j0 = self._cell_key((pos[0] - radius, pos[1] - radius))
+        i1, j1 = self._cell_key((pos[0] + radius, pos[1] + radius))
+        found = []
+        for fcells in self._family_cells(family):
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(fcells):
+                ckeys = [k for k in fcells.iterkeys()
+                         if i0 <= k[0] <= i1 and j0 <= k[1] <= j1]
+            else:
+                ckeys = [(i, j) for i in xrange(i0, i1 + 1)
+                         for j in xrange(j0, j1 + 1)]
+            for ckey in ckeys:
+                cell = fcells.get(ckey)
+                if not cell:
+                    continue
+                for body in cell:
+                    if not body.alive:
+                        continue
+                    if sides is not None and body.side not in sides:
+                        continue
+                    if (pos_by_body[body] - pos).lengthSquared() <= radius2:
+                        found.append(body)
+        return found
+
+
 class Cutscene (object):
 
     def __init__ (self, world, pnode):
@@ -20,6 +20,7 @@ from src import decode_real_path, encode_full_path
 from src import get_base_game_root, add_game_root
 from src import list_dir_files, list_dir_subdirs
 from src.bconf import PYTHON_CMD
+from src.blocks.cachebuild import build_cache
 from src.core.basestack import BaseStack
 from src.core.game import Game
 from src.core.interface import NarrowAspect
@@ -114,6 +115,44 @@ def main ():
                 "instead of variable, rendering-dependent time step. "
                 "Note that action will not run in real-time "
                 "with fixed time step."))
+    ap.add_argument(
+        "-b", "--benchmark",
+        action="store",
+        metavar=p_("command-line option argument pattern",
+                   "FILE"),
+        default=None,
+        help=p_("command-line option description",
+                "Run the directly started skirmish or test mission "
+                "without window and sound, and write timing of "
+                "each frame and each task in the frame into the given file. "
+                "The file is written in JSON format if its name ends "
+                "with .json, and in CSV format otherwise. "
+                "Fixed time step must be given too. "
+                "The mission zone should be given, to skip intro dialogue."))
+    ap.add_argument(
+        "-B", "--benchmark-frames",
+        action="store",
+        metavar=p_("command-line option argument pattern",
+                   "NUMBER"),
+        default=None,
+        help=p_("command-line option description",
+                "Number of frames to record in benchmark, "
+                "after which the game exits. "
+                "The default is 1000."))
+    ap.add_argument(
+        "-C", "--build-cache",
+        action="store",
+        nargs="?",
+        const="auto",
+        metavar=p_("command-line option argument pattern",
+                   "PROCESSES"),
+        default=None,
+        help=p_("command-line option description",
+                "Build all cached data (converted models and textures, "
+                "dynamics tables, terrain and cloud geometry) "
+                "without window and sound, and exit. "
+                "The work is spread over the given number of processes, "
+                "by default as many as there are CPU cores."))
     ap.add_argument(
         "-r", "--random-seed",
         action="store",
@@ -170,7 +209,9 @@ def main ():
         os_game_config_path = real_path("config", game_config_file)
         error(_("Requested game configuration file '%s' does not exist.") %
               os_game_config_path)
-    set_panda_config(options, gameconf)
+    headless = (options.benchmark is not None or
+                options.build_cache is not None)
+    set_panda_config(options, gameconf, headless)
     set_tr_language(gameconf.misc.language)
     for full_path in reversed(gameconf.path.root_path):
         add_game_root(full_path)
@@ -311,6 +352,50 @@ def main ():
                     "got '%(num2).3f' instead.") %
                   dict(num1=MAX_DT, num2=fixdt))
 
+    # Parse benchmark.
+    benchmark = None
+    if options.benchmark is not None:
+        if skirmish_spec is None and test_spec is None:
+            error(_("Benchmark can be run only on directly started "
+                    "skirmish or test mission."))
+        if fixdt is None:
+            error(_("Benchmark requires fixed time step."))
+        numframes = 1000
+        if options.benchmark_frames is not None:
+            numframes_str = options.benchmark_frames.decode(enc)
+            try:
+                numframes = int(numframes_str)
+            except ValueError:
+                numframes = 0
+            if numframes <= 0:
+                error(_("Number of benchmark frames must be "
+                        "a positive integer number, got '%s' instead.") %
+                      numframes_str)
+        benchmark = (options.benchmark, numframes)
+    elif options.benchmark_frames is not None:
+        error(_("Number of benchmark frames given without benchmark."))
+
+    # Parse cache building.
+    build_cache_numproc = None
+    if options.build_cache is not None:
+        if (mission_spec or skirmish_spec or test_spec or
+            benchmark is not None):
+            error(_("Cache building cannot be combined with "
+                    "directly started mission or benchmark."))
+        numproc_str = options.build_cache.decode(enc)
+        if numproc_str == "auto":
+            numproc = cpu_count()
+        else:
+            try:
+                numproc = int(numproc_str)
+            except ValueError:
+                numproc = 0
+            if numproc <= 0:
+                error(_("Number of cache building processes must be "
+                        "a positive integer number, got '%s' instead.") %
+                      numproc_str)
+        build_cache_numproc = numproc
+
     # Parse random seed.
     randseed = None
     if options.random_seed is not None:
@@ -335,6 +420,9 @@ def main ():
             randseed = rsd_lst[0]
         else:
             randseed = tuple(rsd_lst)
+    elif benchmark is not None:
+        # Benchmark runs should be repeatable.
+        randseed = 1
 
     # Parse game context.
     game_context = []
@@ -368,12 +456,19 @@ def main ():
                         val = val_str
         game_context.append((attr, val))
 
+    if build_cache_numproc is not None:
+        if not path_exists("cache", "."):
+            os.makedirs(real_path("cache", "."))
+        build_cache(gameconf, inputconf, build_cache_numproc)
+        return
+
     report(_("Starting game.")) # also initializes logging
 
     panda_log_real_path = rotate_logs("panda-log", "txt")
     base = BaseStack(gameconf=gameconf, inputconf=inputconf,
                      fixdt=fixdt, randseed=randseed,
-                     pandalog=panda_log_real_path)
+                     pandalog=panda_log_real_path,
+                     headless=headless, benchmark=benchmark)
     # ...also automatically sets __builtin__.base.
 
     # Random generator initialization happens after BaseStack is created,
@@ -459,6 +554,7 @@ class GameConf (SimpleProps):
 
         self.cpu = SimpleProps(
             use_cores=2, _use_cores_p=pset([1, 2, 3], keyw=["auto"]),
+            loader_threads="auto", _loader_threads_p=pset([0, 1, 2, 3, 4], keyw=["auto"]),
         )
         self.video = SimpleProps(
             resolution="desktop", _resolution_p=GameConf._parse_resolution,
@@ -471,6 +567,7 @@ class GameConf (SimpleProps):
         )
         self.audio = SimpleProps(
             sound_system="openal", _sound_system_p=pset(["none", "al", "openal", "fmod"]),
+            max_voices=32, _max_voices_p=pset([16, 32, 64]),
         )
         avail_langs = [item[:-len(".po")]
                        for item in list_dir_files("data", "language/po/limload")
@@ -493,6 +590,7 @@ class GameConf (SimpleProps):
                 "fatal", "error", "warning", "info", "debug", "spam"]),
             panda_pstats=False, _panda_pstats_p=pset([True, False]),
             panda_verbose_timer=False, _panda_verbose_timer_p=pset([True, False]),
+            task_timing=False, _task_timing_p=pset([True, False]),
             act_attack_type=1, _act_attack_type_p=pset([1, 2]),
             act_attack_monitor=frozenset(), _act_attack_monitor_p=GameConf._parse_comma_set,
         )
@@ -696,7 +794,7 @@ class GameConf (SimpleProps):
         return val_str
 
 
-def set_panda_config (options, gameconf):
+def set_panda_config (options, gameconf, headless=False):
 
     gc = gameconf
 
@@ -717,12 +815,14 @@ def set_panda_config (options, gameconf):
 
     pc["load-display"] = "pandagl"
 
-    pc["fullscreen"] = bfmt(gc.video.full_screen)
+    pc["fullscreen"] = bfmt(gc.video.full_screen and not headless)
 
-    if gc.video.resolution == "desktop":
-        resolution = desktop_resolution()
-    else:
+    if gc.video.resolution != "desktop":
         resolution = gc.video.resolution
+    elif headless:
+        resolution = (1280, 720)
+    else:
+        resolution = desktop_resolution()
     pc["win-size"] = "%d %d" % resolution
 
     pc["sync-video"] = bfmt(gc.video.vertical_sync)
@@ -737,14 +837,18 @@ def set_panda_config (options, gameconf):
     pc["preload-simple-textures"] = bfmt(True)
     # NOTE: preload-textures does not seem to work.
 
+    if headless:
+        gc.audio.sound_system = "none"
     pc["audio-library-name"] = {
         "none": "p3fmod_none",
         "al": "p3openal_audio", # DEPRECATED: renamed to openal
         "openal": "p3openal_audio",
         "fmod": "p3fmod_audio",
         }[gc.audio.sound_system]
+    # Keep decoded data of all sounds which may play at once.
+    pc["audio-cache-limit"] = ifmt(64)
 
-    pc["show-frame-rate-meter"] = bfmt(gc.misc.frame_rate_meter)
+    pc["show-frame-rate-meter"] = bfmt(gc.misc.frame_rate_meter and not headless)
 
     pc["text-encoding"] = UI_TEXT_ENC
 
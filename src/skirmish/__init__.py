@@ -74,4 +74,16 @@ def setup_world (zc, mc, gc,
     zc.terrain = zc.world.terrains[0]
 
 
+def prefetch_world (terraintype):
+    """
+    Return the zone prefetch function loading data in background
+    for the world which setup_world will create with the terrain type.
+    """
+
+    def prefetchf (zc, mc, gc):
+        return prefetch_terrain_1(terraintype)
+
+    return prefetchf
+
+
 create_player = create_player_1
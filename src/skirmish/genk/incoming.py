@@ -34,7 +34,8 @@ def mission_start (gc):
     mission.add_zone("zero", clat=34.89, clon=43.36, #clat=43.34, clon=31.04,
                      enterf=zone_zero_enter,
                      exitf=zone_zero_exit,
-                     loopf=zone_zero_loop)
+                     loopf=zone_zero_loop,
+                     prefetchf=prefetch_world("00-iraq"))
 
     mc = mission.context
     mc.player_fuelfill = 0.8
@@ -0,0 +1,6 @@
+# -*- coding: UTF-8 -*-
+
+from pandac.PandaModules import *
+
+from src.core import *
+from src.blocks import *
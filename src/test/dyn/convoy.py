@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+
+from pandac.PandaModules import *
+
+from src.core import *
+from src.blocks import *
+from src.test import setup_background
+
+
+# Largest allowed deviation of convoy placement from the placement
+# by ground contact points, in height [m] and pitch or roll [deg].
+_maxdz = 0.5
+_maxdpr = 3.0
+
+
+def zone_loop (zc, mc, gc):
+    """
+    Check that vehicles moved by a convoy along its sampled ground profile
+    are placed as they would be by fixing them to the ground directly.
+    """
+
+    world = setup_background(zc, mc, gc,
+                             terraintype="00-iraq", skytype="default2",
+                             cumulusdens=0.0, cirrusdens=0.0, fadein=None)
+
+    # Hilly area of the avalanche skirmish.
+    p0 = Point2(55500, 23900)
+    route = [Point3(p0[0] + dx, p0[1] + dy, 0.0)
+             for dx, dy in ((0, 0), (300, 600), (900, 700),
+                            (1400, 200), (1800, 900))]
+    vehicles = []
+    for i, vcls in enumerate((Abrams, Bradley, Bradley, Abrams)):
+        vehicle = vcls(world=world, name="conv%d" % i, side="merc",
+                       pos=Point2(route[0][0], route[0][1]),
+                       hpr=Vec3(0, 0, 0), speed=0.0)
+        vehicles.append(vehicle)
+    convoy = Convoy(world, vehicles, route)
+
+    maxdz, maxdpr = 0.0, 0.0
+    for k in xrange(60):
+        yield world, 1.0
+        for vehicle in convoy.members:
+            pos = ptod(vehicle.pos())
+            hpr = vtod(vehicle.node.getHpr(world.node))
+            gfix = Vehicle._fix_to_ground(world, vehicle._gyro,
+                                          vehicle._modgndcnts, vehicle.sink,
+                                          pos, hpr)
+            pos1, hpr1 = gfix[:2]
+            maxdz = max(maxdz, abs(pos[2] - pos1[2]))
+            for i in (1, 2):
+                dang = norm_ang_delta(hpr[i], hpr1[i], indeg=True)
+                maxdpr = max(maxdpr, abs(dang))
+
+    report("convoy placement: max height deviation %.3f m, "
+           "max pitch/roll deviation %.2f deg" % (maxdz, maxdpr))
+    if maxdz <= _maxdz and maxdpr <= _maxdpr:
+        report("convoy placement test passed")
+    else:
+        report("convoy placement test FAILED")
+
+    convoy.destroy()
+    world.destroy()
+    mc.mission.end()